@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares how long it takes to work out which field a string default needs,
+using the reference `classify_string` (what `_select_field` used to do), a
+`StringClassifier`, and the memoized `classify` used by `_select_field`.
+
+Run from the repository root::
+
+    python benchmarks/select_field.py [number of settings]
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import print_function
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+settings.configure(
+    INSTALLED_APPS=('django.contrib.staticfiles',),
+    STATIC_URL='/static/', MEDIA_URL='/media/', USE_L10N=False,
+)
+import django
+django.setup()
+
+from stagesetting.inference import (StringClassifier, classify,
+                                    classify_string, reset_classifiers)
+
+
+# A spread of the sort of strings found in STAGESETTINGS dictionaries.
+VALUES = (
+    'hello world', 'Site name', 'some-slug', '<b>bold</b>', '/static/',
+    '/static/.*\\.css$', 'https://example.com/', 'admin@example.com',
+    '127.0.0.1', '::1', '25', '1.5', '98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac',
+    '04:23', '2015-08-01', '2015-08-01 16:08:51',
+)
+
+
+def run(count):
+    values = [VALUES[i % len(VALUES)] for i in range(count)]
+    classifier = StringClassifier()
+
+    def reference():
+        for value in values:
+            classify_string(value)
+
+    def compiled():
+        for value in values:
+            classifier(value)
+
+    def memoized():
+        # starts empty each time, so repeated values are what's remembered.
+        reset_classifiers()
+        for value in values:
+            classify(value)
+
+    for name, func in (('reference', reference), ('compiled', compiled),
+                       ('memoized', memoized)):
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print('{name: <10} {ms:8.2f}ms for {count} strings'.format(
+            name=name, ms=best * 1000, count=count))
+
+
+if __name__ == '__main__':
+    run(count=int(sys.argv[1]) if len(sys.argv) > 1 else 500)
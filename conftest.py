@@ -2,6 +2,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import os
+import sys
 
 import django
 from django.conf import settings
@@ -34,6 +35,12 @@ MIDDLEWARES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
+# coroutines are a syntax error before 3.5
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append(os.path.join('tests', 'test_aio.py'))
+
+
 def pytest_configure():
     if not settings.configured:
         settings.configure(
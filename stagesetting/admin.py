@@ -8,11 +8,13 @@ try:
     from django.urls import reverse
 except ImportError:
     from django.core.urlresolvers import reverse
+from django.conf.urls import url
 from django.utils.translation import ugettext_lazy as _
 from .forms import CreateSettingForm
 from .views import CreateSetting
 from .views import UpdateSetting
 from .views import DeleteSetting
+from .views import SettingChoices
 
 
 class RuntimeSettingAdmin(ModelAdmin):
@@ -41,7 +43,22 @@ class RuntimeSettingAdmin(ModelAdmin):
         url = admin_urlname(self.model._meta, 'changelist')
         return UpdateSetting.as_view(model=self.model,
             admin=self, template_name='admin/stagesetting/change_form.html',
-            success_url=reverse(url))(request=request, pk=object_id)
+            success_url=reverse(url),
+            choices_url_name=admin_urlname(self.model._meta, 'choices'),
+            )(request=request, pk=object_id)
+
+    def choices_view(self, request, object_id, field):
+        return SettingChoices.as_view(model=self.model, admin=self)(
+            request=request, pk=object_id, field=field)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urls = [
+            url(r'^(?P<object_id>\d+)/choices/(?P<field>[^/]+)/$',
+                self.admin_site.admin_view(self.choices_view),
+                name='%s_%s_choices' % info),
+        ]
+        return urls + super(RuntimeSettingAdmin, self).get_urls()
 
     def delete_view(self, request, object_id, **kwargs):
         url = admin_urlname(self.model._meta, 'changelist')
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio support, which requires Python 3.5+ (so this module is never imported
+by anything else in stagesetting)
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import asyncio
+import functools
+import logging
+from .models import RuntimeSetting
+from .models import RuntimeSettingWrapper
+from .snapshot import shared_snapshot_enabled
+from .snapshot import snapshots
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # pragma: no cover
+    sync_to_async = None
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_sync(func, *args, **kwargs):
+    """
+    Run blocking code (queries, form validation) outside of the event loop,
+    on the same thread Django would use for any other synchronous work if
+    `asgiref` is available.
+    """
+    if sync_to_async is not None:
+        return sync_to_async(func, thread_sensitive=True)(*args, **kwargs)
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class AsyncRuntimeSettingWrapper(RuntimeSettingWrapper):
+    """
+    A `RuntimeSettingWrapper` which may also be used from coroutines::
+
+        value = await request.stagesetting.aget('KEY')
+        async for key, value in request.stagesetting:
+            ...
+
+    The settings are resolved once, in a thread; after that (or if a current
+    shared snapshot can be used, which needs `STAGESETTING_INVALIDATION`)
+    reading them doesn't leave the event loop.
+    """
+    __slots__ = ()
+
+    def _use_current_snapshot(self):
+        if self.settings is not None:
+            return True
+        if not shared_snapshot_enabled():
+            return False
+        current = snapshots.peek(model=self.model)
+        if current is None:
+            return False
+        super(RuntimeSettingWrapper, self).__setattr__('settings', current)
+        return True
+
+    async def afetch(self):
+        if self._use_current_snapshot():
+            return False
+        return await run_sync(self._fetch_settings)
+
+    async def aprefetch(self, *keys):
+        if self._use_current_snapshot():
+            return False
+        return await run_sync(self.prefetch, *keys)
+
+    async def aget(self, key, default=None):
+        if not self._use_current_snapshot():
+            if self.lazy:
+                await run_sync(self._fetch_keys, keys=(key,))
+                if self.settings is None:
+                    return self._partial.get(key, default)
+            else:
+                await run_sync(self._fetch_settings)
+        return self.settings.get(key, default)
+
+    def __aiter__(self):
+        return AsyncSettingsIterator(wrapper=self)
+
+
+class AsyncSettingsIterator(object):
+    """
+    Yields `(key, value)` pairs, like iterating over the wrapper does.
+    """
+    __slots__ = ('wrapper', 'items')
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.items = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.items is None:
+            await self.wrapper.afetch()
+            self.items = iter(tuple(self.wrapper.settings.items()))
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncApplyRuntimeSettings(object):
+    """
+    Like `ApplyRuntimeSettings`, but works in both sync and async middleware
+    chains, without handing each async request to a thread. Only for the
+    `MIDDLEWARE` setting.
+    """
+    sync_capable = True
+    async_capable = True
+    wrapper_class = AsyncRuntimeSettingWrapper
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def get_model(self):
+        return RuntimeSetting
+
+    def apply(self, request):
+        # creating the wrapper doesn't touch the database.
+        if not hasattr(request, 'stagesetting'):
+            request.stagesetting = self.wrapper_class(model=self.get_model())
+        else:
+            logger.warning("Another middleware already set `request.stagesetting`")  # noqa
+        return request
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self.apply(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.apply(request)
+        return await self.get_response(request)
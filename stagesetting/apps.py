@@ -3,6 +3,9 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import logging
 from django.core.checks import registry as django_check_registry
+from django.db import DatabaseError
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
 from django.utils.translation import ugettext_lazy as _
 from django.apps import AppConfig
 
@@ -23,12 +26,41 @@ class StageSettingAppConfig(AppConfig):
         return RuntimeSettingAdmin
 
     def ready(self):
+        from .cache import invalidate_resolved
         from .checks import check_setting
+        from .fork import register_fork_handlers
         from .utils import registry as stagesetting_registry
         django_check_registry.register(check_setting)
+        post_save.connect(invalidate_resolved,
+                          dispatch_uid='stagesetting_invalidate_resolved_save')
+        post_delete.connect(invalidate_resolved,
+                            dispatch_uid='stagesetting_invalidate_resolved_delete')
         stagesetting_registry.ready(sender=self.__class__, instance=self,
                                         model=self.get_stagesetting_model())
         self.set_stagesetting_modeladmin()
+        register_fork_handlers()
+        self.warm_stagesetting()
+
+    def warm_stagesetting(self):
+        """
+        With `STAGESETTING_WARM = True`, resolve the settings now rather than
+        during the first request.
+
+        The connections this opens are closed again, as this may well be a
+        process (eg: a preloading server) which is about to fork.
+        """
+        from .warmup import close_connections, warm, warm_at_startup
+        if not warm_at_startup():
+            return False
+        try:
+            warm(model=self.get_stagesetting_model())
+        except DatabaseError:
+            # eg: running `migrate` for the first time.
+            logger.warning("Unable to warm the settings", exc_info=True)
+            return False
+        finally:
+            close_connections()
+        return True
 
     def set_stagesetting_modeladmin(self):
         from django.contrib import admin
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from itertools import islice
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, CharField, TextField
+from django.utils.encoding import force_text
+from . import widgets
+from .widgets import flatten_choices
+from .utils import StaticFilesChoiceField
+from .utils import DefaultStorageFilesChoiceField
+
+
+def autocomplete_enabled():
+    return (getattr(settings, 'STAGESETTING_AUTOCOMPLETE', True) and
+            widgets.AUTOCOMPLETE_AVAILABLE)
+
+
+def get_page_size():
+    return getattr(settings, 'STAGESETTING_AUTOCOMPLETE_PAGE_SIZE', 20)
+
+
+def is_searchable(field):
+    """
+    Fields whose choices could be too many to render; those listing files
+    from a storage, and those with a queryset.
+    """
+    return isinstance(field, (StaticFilesChoiceField,
+                              DefaultStorageFilesChoiceField,
+                              forms.ModelChoiceField))
+
+
+def use_autocomplete(form, url_for):
+    """
+    Swap the default widget of every searchable field in `form` for an
+    `AutocompleteSelect` which searches via `url_for(name)`.
+    """
+    if not autocomplete_enabled():
+        return form
+    for name, field in form.fields.items():
+        if not is_searchable(field):
+            continue
+        if field.widget.__class__ is forms.Select:
+            widget_class = widgets.AutocompleteSelect
+        elif field.widget.__class__ is forms.SelectMultiple:
+            widget_class = widgets.AutocompleteSelectMultiple
+        else:
+            continue
+        widget = widget_class(url=url_for(name),
+                              attrs=field.widget.attrs)
+        widget.choices = field.widget.choices
+        widget.is_required = field.widget.is_required
+        field.widget = widget
+    return form
+
+
+def search_choices(choices, term):
+    """
+    `(value, label)` for each non-empty choice with `term` in its value or
+    label, ignoring case.
+    """
+    term = term.lower()
+    for value, label in flatten_choices(choices):
+        if value in (None, ''):
+            continue
+        value = force_text(value)
+        label = force_text(label)
+        if term in value.lower() or term in label.lower():
+            yield value, label
+
+
+def search_queryset(field, term, request, admin_site):
+    """
+    Filter the field's queryset by `term`, using the `search_fields` of the
+    model's admin in `admin_site` if it has any, or otherwise the model's text
+    fields and primary key.
+    """
+    queryset = field.queryset
+    if term:
+        model_admin = admin_site._registry.get(queryset.model)
+        if model_admin is not None and model_admin.get_search_fields(request):
+            queryset, use_distinct = model_admin.get_search_results(
+                request, queryset, term)
+            if use_distinct:
+                queryset = queryset.distinct()
+        else:
+            condition = text_search(queryset.model, term)
+            if condition is None:
+                queryset = queryset.none()
+            else:
+                queryset = queryset.filter(condition)
+    if not queryset.ordered:
+        queryset = queryset.order_by('pk')
+    return queryset
+
+
+def text_search(model, term):
+    """
+    A `Q` matching `term` in any of the model's text fields, or as its primary
+    key; or `None` if there's nothing it could match.
+    """
+    conditions = [Q(**{'%s__icontains' % model_field.name: term})
+                  for model_field in model._meta.concrete_fields
+                  if isinstance(model_field, (CharField, TextField))]
+    try:
+        pk = model._meta.pk.to_python(term)
+    except ValidationError:
+        pass
+    else:
+        conditions.append(Q(pk=pk))
+    if not conditions:
+        return None
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition |= other
+    return condition
+
+
+def search(field, term, page, request, admin_site):
+    """
+    One page of choices for `field` matching `term`, as the
+    `{'results': [...], 'pagination': {'more': ...}}` that select2 expects.
+    Only one more than a page is ever fetched, so there's no count.
+    """
+    page_size = get_page_size()
+    start = (page - 1) * page_size
+    stop = start + page_size + 1
+    if isinstance(field, forms.ModelChoiceField):
+        queryset = search_queryset(field, term, request=request,
+                                   admin_site=admin_site)
+        found = [(field.prepare_value(obj), field.label_from_instance(obj))
+                 for obj in queryset[start:stop]]
+    else:
+        found = list(islice(search_choices(field.choices, term), start, stop))
+    results = [{'id': force_text(value), 'text': force_text(label)}
+               for value, label in found[:page_size]]
+    return {'results': results, 'pagination': {'more': len(found) > page_size}}
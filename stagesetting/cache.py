@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import hashlib
+import logging
+from threading import RLock
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from .records import accessors_enabled
+from .records import frozen_records_enabled
+from .utils import DEFAULT_SERIALIZER
+from .utils import registry
+
+
+logger = logging.getLogger(__name__)
+
+# stops more than one thread in the process giving up on the cache at once.
+_locks = {'build': RLock()}
+
+
+def get_cache_alias():
+    """
+    The `CACHES` alias resolved settings should be stored in, or `None` if
+    the cache layer is switched off (the default).
+    """
+    return getattr(settings, 'STAGESETTING_CACHE', None)
+
+
+def get_cache_timeout():
+    return getattr(settings, 'STAGESETTING_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_lock_timeout():
+    """
+    The longest a process may hold the rebuild lock for, in case it dies
+    without releasing it.
+    """
+    return getattr(settings, 'STAGESETTING_CACHE_LOCK_TIMEOUT', 30)
+
+
+def get_lock_wait():
+    """
+    How long other processes wait for the lock holder to finish, before
+    giving up and rebuilding for themselves.
+    """
+    return getattr(settings, 'STAGESETTING_CACHE_LOCK_WAIT', 2.0)
+
+
+def get_cache():
+    alias = get_cache_alias()
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def resolution_mode():
+    """
+    The settings which change what resolved settings look like, so that
+    processes configured differently don't share data.
+    """
+    return 'frozen=%(frozen)s,accessors=%(accessors)s,serializer=%(serializer)s' % {
+        'frozen': bool(frozen_records_enabled()),
+        'accessors': bool(accessors_enabled()),
+        'serializer': getattr(settings, 'STAGESETTING_SERIALIZER',
+                              DEFAULT_SERIALIZER),
+    }
+
+
+def cache_key_prefix(model):
+    """
+    Includes a digest of the registered setting names and `resolution_mode`,
+    so that processes running with a different set of forms (eg: mid-deploy)
+    or options don't share data.
+    """
+    registered = ','.join(sorted(registry.keys()))
+    digest = hashlib.md5(force_bytes('%s|%s' % (
+        registered, resolution_mode()))).hexdigest()
+    return 'stagesetting:%(app)s.%(model)s:%(digest)s' % {
+        'app': model._meta.app_label, 'model': model._meta.model_name,
+        'digest': digest,
+    }
+
+
+def cache_key_for(model, version=None):
+    """
+    The prefix plus the settings `version` (looked up if not given), so that
+    data resolved before any change is never read after it.
+    """
+    if version is None:
+        version = model.objects.version_token()
+    return '%(prefix)s:%(version)d' % {'prefix': cache_key_prefix(model=model),
+                                       'version': version}
+
+
+def get_resolved(model):
+    cache = get_cache()
+    if cache is None:
+        return None
+    return cache.get(cache_key_for(model=model))
+
+
+def set_resolved(model, resolved):
+    """
+    The cache backend takes care of serializing the resolved dictionary,
+    including any model instances found by ModelChoiceFields.
+    """
+    cache = get_cache()
+    if cache is None:
+        return False
+    cache.set(cache_key_for(model=model), resolved, get_cache_timeout())
+    return True
+
+
+def resolve_once(model, build, poll_interval=0.05):
+    """
+    Get the resolved settings from the cache, or call `build` and store the
+    result. When they're missing, only the process which manages to `add`
+    the lock key calls `build`; everyone else polls the cache for up to
+    `STAGESETTING_CACHE_LOCK_WAIT` seconds for its result.
+
+    Both keys include the settings version, so a result built from rows read
+    before a change is never seen by anyone who knows about the change, and
+    the lock is never released, only left to expire; there's no way to
+    delete it atomically, and once the result is stored nobody asks for it.
+
+    Anyone who gives up waiting builds for themselves, but only one thread
+    per process does so; the rest then find its result in the cache.
+    """
+    cache = get_cache()
+    if cache is None:
+        return build()
+    key = cache_key_for(model=model)
+    resolved = cache.get(key)
+    if resolved is not None:
+        return resolved
+
+    lock_key = '%s:lock' % key
+    if cache.add(lock_key, uuid4().hex, get_lock_timeout()):
+        resolved = build()
+        cache.set(key, resolved, get_cache_timeout())
+        return resolved
+
+    deadline = time.time() + get_lock_wait()
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        resolved = cache.get(key)
+        if resolved is not None:
+            return resolved
+
+    with _locks['build']:
+        # another thread here may have given up first, and built them.
+        resolved = cache.get(key)
+        if resolved is None:
+            logger.warning("Gave up waiting for another process to resolve "
+                           "the settings for %r", model)
+            resolved = build()
+            cache.set(key, resolved, get_cache_timeout())
+        return resolved
+
+
+def after_fork():
+    _locks['build'] = RLock()
+
+
+def delete_resolved(model, version=None):
+    cache = get_cache()
+    if cache is None:
+        return False
+    cache.delete(cache_key_for(model=model, version=version))
+    return True
+
+
+def delete_resolved_on_commit(model, using=None):
+    """
+    Entries are keyed by the settings version, so a change already means
+    nobody reads the old one; this only tidies up. Has to be called inside
+    the transaction, before the version is bumped: the entry for the version
+    being replaced is deleted once the change is visible to everyone.
+    """
+    if get_cache() is None:
+        return False
+    version = model.objects.db_manager(using).version_token()
+    try:
+        on_commit = transaction.on_commit
+    except AttributeError:  # pragma: no cover
+        # Django 1.8 has no way of running things after the commit.
+        return delete_resolved(model=model, version=version)
+    on_commit(lambda: delete_resolved(model=model, version=version),
+              using=using)
+    return True
+
+
+def invalidate_resolved(sender, instance, **kwargs):
+    """
+    Signal handler for `post_save` and `post_delete`, which are sent before
+    `mark_settings_changed` bumps the version.
+    """
+    from .models import BaseRuntimeSetting
+    if not issubclass(sender, BaseRuntimeSetting):
+        return False
+    return delete_resolved_on_commit(model=sender, using=kwargs.get('using'))
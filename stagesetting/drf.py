@@ -24,7 +24,8 @@ class RuntimeSettingSerializer(ModelSerializer):
         model = self.Meta.model()
         model.key = attrs['key']
         model.value = attrs['raw_value']
-        return {'key': model.key, 'raw_value': model.raw_value}
+        return {'key': model.key, 'raw_value': model.raw_value,
+                'fingerprint': model.fingerprint}
 
     class Meta:
         model = RuntimeSetting
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import gc
+import logging
+import os
+from django.conf import settings
+from django.db import connections
+from . import cache
+from . import inference
+from . import invalidation
+from . import patterns
+from . import plans
+from . import records
+from . import refresh
+from . import shm
+from . import utils
+from .snapshot import snapshots
+from .staticindex import static_index
+from .utils import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+_registered = []
+
+
+def after_fork():
+    """
+    Called in a newly forked child process (automatically, on Python 3.7+).
+    Gives every process-wide object fresh locks, and drops anything tied to
+    the parent (database connections, the refresher thread, pub/sub
+    connections, mapped files), while keeping the snapshots, which are
+    immutable.
+    """
+    discard_connections()
+    registry.after_fork()
+    snapshots.after_fork()
+    for module in (cache, inference, patterns, plans, records, utils):
+        module.after_fork()
+    bus = invalidation._bus.get('bus')
+    if bus is not None:
+        bus.after_fork()
+    refresher = refresh._refresher.get('refresher')
+    if refresher is not None:
+        refresher.after_fork()
+    for shared in tuple(shm._files.values()):
+        shared.after_fork()
+    static_index.after_fork()
+    return True
+
+
+def discard_connections():
+    """
+    Forget any database connections inherited from the parent, without
+    closing them; that would tell the server the parent's are finished too.
+    Each is reopened as normal the next time it's used.
+    """
+    for connection in connections.all():
+        connection.connection = None
+
+
+def register_fork_handlers():
+    if _registered or not hasattr(os, 'register_at_fork'):
+        return False
+    os.register_at_fork(after_in_child=after_fork)
+    _registered.append(after_fork)
+    return True
+
+
+def gc_freeze_enabled():
+    return getattr(settings, 'STAGESETTING_GC_FREEZE', False)
+
+
+def freeze():
+    """
+    Move everything allocated so far (eg: the preloaded snapshot) out of
+    the garbage collector's reach, so that collections in forked children
+    don't write to those pages and stop them being shared. Python 3.7+
+    """
+    if not hasattr(gc, 'freeze'):
+        return False
+    gc.collect()
+    gc.freeze()
+    logger.debug("Froze %d objects", gc.get_freeze_count())
+    return True
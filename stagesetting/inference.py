@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from decimal import Decimal, InvalidOperation
+import re
+from threading import RLock
+from uuid import UUID
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.core.validators import (validate_ipv46_address, URLValidator,
+                                    validate_email)
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import get_language
+
+
+# What `classify_string` can say a string looks like, in the order it checks.
+IP = 'ip'
+URL = 'url'
+EMAIL = 'email'
+INTEGER = 'integer'
+DECIMAL = 'decimal'
+UUID_STRING = 'uuid'
+TIME = 'time'
+DATE = 'date'
+DATETIME = 'datetime'
+
+TEMPORAL_FIELDS = ((TIME, forms.TimeField), (DATE, forms.DateField),
+                   (DATETIME, forms.DateTimeField))
+
+CLASSIFIED_MAX = 1024
+
+
+def _can_be_parsed_as_temporal(value, field):
+    for format in field.input_formats:
+        try:
+            field.strptime(value, format)
+            return True
+        except (ValueError, TypeError):
+            continue
+    return False
+
+
+def classify_string(value):
+    """
+    What kind of field `_select_field` should make for the string `value`,
+    found by trying each validator and parser in turn; or `None` if it's
+    none of them.
+
+    This is the reference for `StringClassifier`, which gets the same answer
+    without most of the exceptions.
+    """
+    try:
+        validate_ipv46_address(value)
+        return IP
+    except ValidationError:
+        pass
+    try:
+        URLValidator()(value)
+        return URL
+    except ValidationError:
+        pass
+    try:
+        validate_email(value)
+        return EMAIL
+    except ValidationError:
+        pass
+    if value.isdigit():
+        return INTEGER
+    try:
+        Decimal(value)
+        return DECIMAL
+    except InvalidOperation:
+        pass
+    try:
+        UUID(value)
+        return UUID_STRING
+    except ValueError:
+        pass
+    for kind, field_class in TEMPORAL_FIELDS:
+        if _can_be_parsed_as_temporal(value, field_class()):
+            return kind
+    return None
+
+
+# A string which isn't made only of these can't be an IPv4 address, and one
+# without a colon can't be an IPv6 address.
+IPV4_CHARS = re.compile(r'^[0-9.]+\Z')
+# Decimal() accepts digits (in any script), NaN and Infinity, and nothing else.
+DECIMAL_HINT = re.compile(r'\d|nan|inf', re.IGNORECASE | re.UNICODE)
+# UUID() removes at most braces, hyphens and a urn prefix from 32 hex digits.
+UUID_MIN_LENGTH = 32
+
+
+def format_literals(format):
+    """
+    The characters which must appear in a string for `strptime` to parse it
+    with `format`: everything but directives, whitespace (which matches any
+    amount of any whitespace) and letters (which are matched ignoring case).
+    """
+    literals = set()
+    chars = iter(format)
+    for char in chars:
+        if char == '%':
+            directive = next(chars, '')
+            if directive == '%':
+                literals.add('%')
+        elif not char.isspace() and not char.isalnum():
+            literals.add(char)
+    return frozenset(literals)
+
+
+class StringClassifier(object):
+    """
+    `classify_string`, but checking cheap conditions each kind of string must
+    meet before trying its (exception raising) validator, and checking each
+    date and time format's separators are present before calling `strptime`.
+
+    The input formats are read once, when the classifier is made; they depend
+    on the settings and the active language, so use `get_classifier`.
+    """
+    __slots__ = ('url_validator', 'temporal')
+
+    def __init__(self):
+        self.url_validator = URLValidator()
+        temporal = []
+        for kind, field_class in TEMPORAL_FIELDS:
+            field = field_class()
+            formats = tuple((format, format_literals(format))
+                            for format in field.input_formats)
+            temporal.append((kind, field.strptime, formats))
+        self.temporal = tuple(temporal)
+
+    def is_ip(self, value):
+        if ':' not in value and not IPV4_CHARS.match(value):
+            return False
+        try:
+            validate_ipv46_address(value)
+            return True
+        except ValidationError:
+            return False
+
+    def is_url(self, value):
+        if '://' not in value:
+            return False
+        try:
+            self.url_validator(value)
+            return True
+        except ValidationError:
+            return False
+
+    def is_email(self, value):
+        if '@' not in value:
+            return False
+        try:
+            validate_email(value)
+            return True
+        except ValidationError:
+            return False
+
+    def is_decimal(self, value):
+        if not DECIMAL_HINT.search(value):
+            return False
+        try:
+            Decimal(value)
+            return True
+        except InvalidOperation:
+            return False
+
+    def is_uuid(self, value):
+        if len(value) < UUID_MIN_LENGTH:
+            return False
+        try:
+            UUID(value)
+            return True
+        except ValueError:
+            return False
+
+    def temporal_kind(self, value):
+        for kind, strptime, formats in self.temporal:
+            for format, literals in formats:
+                if not all(char in value for char in literals):
+                    continue
+                try:
+                    strptime(value, format)
+                    return kind
+                except (ValueError, TypeError):
+                    continue
+        return None
+
+    def __call__(self, value):
+        if self.is_ip(value):
+            return IP
+        if self.is_url(value):
+            return URL
+        if self.is_email(value):
+            return EMAIL
+        if value.isdigit():
+            return INTEGER
+        if self.is_decimal(value):
+            return DECIMAL
+        if self.is_uuid(value):
+            return UUID_STRING
+        return self.temporal_kind(value)
+
+
+_classifiers = {}
+_locks = {'classifiers': RLock()}
+
+
+def after_fork():
+    _locks['classifiers'] = RLock()
+
+
+def get_classifier():
+    """
+    The `StringClassifier` for the active language.
+    """
+    language = get_language()
+    try:
+        return _classifiers[language]
+    except KeyError:
+        pass
+    with _locks['classifiers']:
+        if language not in _classifiers:
+            _classifiers[language] = StringClassifier()
+        return _classifiers[language]
+
+
+@lru_cache(CLASSIFIED_MAX)
+def _classify(value, language):
+    return get_classifier()(value)
+
+
+def classify(value):
+    """
+    `classify_string`, remembering the answer for each value.
+    """
+    return _classify(value, get_language())
+
+
+def reset_classifiers(**kwargs):
+    with _locks['classifiers']:
+        _classifiers.clear()
+        _classify.cache_clear()
+setting_changed.connect(reset_classifiers,
+                        dispatch_uid='stagesetting_reset_classifiers')
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+import os
+from threading import RLock
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTransport(object):
+    """
+    Carries "something changed" messages between processes.
+
+    `publish(token)` announces a change, and `poll()` returns the most recent
+    token it knows of (or `None`), without blocking.
+    """
+    def publish(self, token):  # pragma: no cover
+        raise NotImplementedError("Subclasses should implement publish()")
+
+    def poll(self):  # pragma: no cover
+        raise NotImplementedError("Subclasses should implement poll()")
+
+    def after_fork(self):
+        """
+        Drop any connection shared with the parent process.
+        """
+        return None
+
+
+class LocalTransport(BaseTransport):
+    """
+    Only tells the current process. Mostly useful for development & tests.
+    """
+    def __init__(self):
+        self.token = None
+
+    def publish(self, token):
+        self.token = token
+        return True
+
+    def poll(self):
+        return self.token
+
+
+class FileTransport(BaseTransport):
+    """
+    For processes on a single host: publishing replaces the file at `path`,
+    and polling is a `stat()` of it.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, token):
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(force_bytes(token))
+        # os.rename is atomic on POSIX, and gives the file a new inode so that
+        # two publishes within the mtime resolution still look different.
+        os.rename(tmp_path, self.path)
+        return True
+
+    def poll(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return '%d:%r:%d' % (stat.st_ino, stat.st_mtime, stat.st_size)
+
+
+class CacheTransport(BaseTransport):
+    """
+    For processes sharing a `CACHES` backend (memcached, redis, database...)
+    """
+    def __init__(self, alias='default', key='stagesetting:invalidation'):
+        self.alias = alias
+        self.key = key
+
+    def publish(self, token):
+        caches[self.alias].set(self.key, token, None)
+        return True
+
+    def poll(self):
+        return caches[self.alias].get(self.key)
+
+
+class RedisTransport(BaseTransport):
+    """
+    Uses Redis pub/sub. Either pass a `client` (anything with `publish` and
+    `pubsub` like `redis.StrictRedis`) or a `url` for `redis` to connect to.
+
+    Only changes published after this process first polls can be seen.
+    """
+    def __init__(self, client=None, url=None,
+                 channel='stagesetting:invalidation'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured("RedisTransport requires `redis` "
+                                           "to be installed, or a `client`")
+            client = redis.StrictRedis.from_url(url or 'redis://localhost')
+        self.client = client
+        self.channel = channel
+        self.pubsub = None
+        self.token = None
+
+    def publish(self, token):
+        self.client.publish(self.channel, token)
+        return True
+
+    def poll(self):
+        if self.pubsub is None:
+            self.pubsub = self.client.pubsub()
+            self.pubsub.subscribe(self.channel)
+        while True:
+            message = self.pubsub.get_message(ignore_subscribe_messages=True)
+            if message is None:
+                break
+            if message.get('type') == 'message':
+                self.token = force_text(message['data'])
+        return self.token
+
+    def after_fork(self):
+        # resubscribes on the next poll.
+        self.pubsub = None
+
+
+class InvalidationBus(object):
+    """
+    Tells subscribers when any process has changed a setting. The transport
+    is only asked every `interval` seconds, which bounds how long it takes
+    for a change to be noticed.
+    """
+    def __init__(self, transport, interval=1.0):
+        self.transport = transport
+        self.interval = interval
+        self._lock = RLock()
+        self._last_seen = None
+        self._last_polled = None
+
+    def publish(self):
+        token = uuid4().hex
+        try:
+            self.transport.publish(token)
+        except Exception:
+            logger.exception("Unable to publish settings invalidation")
+            return False
+        # don't tell ourselves twice.
+        self.poll(force=True)
+        return True
+
+    def after_fork(self):
+        self._lock = RLock()
+        self.transport.after_fork()
+
+    def due(self):
+        """
+        Whether the next `poll()` would actually ask the transport.
+        """
+        return (self._last_polled is None or
+                time.time() - self._last_polled >= self.interval)
+
+    def poll(self, force=False):
+        """
+        Returns `True` if something changed since the last poll, having told
+        every subscriber.
+        """
+        if not force and not self.due():
+            return False
+        now = time.time()
+        with self._lock:
+            self._last_polled = now
+            try:
+                token = self.transport.poll()
+            except Exception:
+                logger.exception("Unable to poll for settings invalidation")
+                return False
+            if token is None or token == self._last_seen:
+                return False
+            self._last_seen = token
+        notify_subscribers()
+        return True
+
+
+_subscribers = []
+_bus = {}
+
+
+def subscribe(callback):
+    """
+    `callback` is called with no arguments whenever a change is noticed.
+    """
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+    return callback
+
+
+def notify_subscribers():
+    for callback in tuple(_subscribers):
+        callback()
+    return len(_subscribers)
+
+
+def get_bus():
+    """
+    The bus configured by `STAGESETTING_INVALIDATION`, which looks like::
+
+        STAGESETTING_INVALIDATION = {
+            'BACKEND': 'stagesetting.invalidation.FileTransport',
+            'OPTIONS': {'path': '/var/run/myproject/stagesetting'},
+            'INTERVAL': 1.0,
+        }
+
+    or `None` if there isn't one.
+    """
+    if 'bus' not in _bus:
+        config = getattr(settings, 'STAGESETTING_INVALIDATION', None)
+        if config is None:
+            _bus['bus'] = None
+        else:
+            transport_class = import_string(config['BACKEND'])
+            transport = transport_class(**config.get('OPTIONS', {}))
+            _bus['bus'] = InvalidationBus(
+                transport=transport, interval=config.get('INTERVAL', 1.0))
+    return _bus['bus']
+
+
+def publish_invalidation(using=None):
+    """
+    Announce that settings have changed, once the current transaction (if
+    there is one) has committed.
+    """
+    bus = get_bus()
+    if bus is None:
+        return False
+    try:
+        on_commit = transaction.on_commit
+    except AttributeError:  # pragma: no cover
+        # Django 1.8 can't wait for the commit.
+        return bus.publish()
+    on_commit(bus.publish, using=using)
+    return True
+
+
+def reset_bus(**kwargs):
+    if kwargs.get('setting', 'STAGESETTING_INVALIDATION') == 'STAGESETTING_INVALIDATION':
+        _bus.clear()
+setting_changed.connect(reset_bus, dispatch_uid='stagesetting_reset_bus')
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import django
 from django.core.management import BaseCommand, CommandError
 from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.warmup import warm
 
 
 class Command(BaseCommand):
@@ -14,13 +16,21 @@ class Command(BaseCommand):
     def get_wrapper(self):
         return RuntimeSettingWrapper(model=self.get_model())
 
+    def add_subparser(self, subparsers, name, **kwargs):
+        # Django 2.1 stopped passing the command to CommandParser.
+        if django.VERSION < (2, 1):
+            kwargs['cmd'] = self
+        return subparsers.add_parser(name, **kwargs)
+
     def add_arguments(self, parser):
         subparsers = parser.add_subparsers(dest='command')
-        parser_list = subparsers.add_parser('list', cmd=self, help='list all settings')
+        parser_list = self.add_subparser(subparsers, 'list', help='list all settings')
 
-        parser_get = subparsers.add_parser('get', cmd=self, help='get a specific setting')
+        parser_get = self.add_subparser(subparsers, 'get', help='get a specific setting')
         parser_get.add_argument('key', help='name of the setting to get', metavar='KEY')
 
+        self.add_subparser(subparsers, 'warm', help='resolve all settings into the cache')
+
     def write_setting_name(self, key):
         sep = '=' * len(key)
         self.stdout.write(self.style.HTTP_REDIRECT(key))
@@ -58,6 +68,9 @@ class Command(BaseCommand):
             self.stdout.write("\n")
             self.write_setting_raw(value)
             self.stdout.write("\n")
+        elif command == "warm":
+            found = warm(model=self.get_model())
+            self.stdout.write("Warmed {} settings".format(len(found)))
         elif command == "set":
             pass
 
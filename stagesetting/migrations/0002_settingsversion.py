@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def create_version(apps, schema_editor):
+    SettingsVersion = apps.get_model('stagesetting', 'SettingsVersion')
+    db_alias = schema_editor.connection.alias
+    SettingsVersion.objects.using(db_alias).get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stagesetting', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettingsVersion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'stagesetting_settingsversion',
+                'verbose_name': 'Settings version',
+                'verbose_name_plural': 'Settings version',
+            },
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
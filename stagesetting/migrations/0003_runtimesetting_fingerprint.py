@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stagesetting', '0002_settingsversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runtimesetting',
+            name='fingerprint',
+            field=models.CharField(default='', max_length=32, blank=True, editable=False),
+        ),
+    ]
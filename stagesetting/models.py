@@ -1,19 +1,101 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from threading import RLock
+from django.conf import settings as project_settings
 from django.core.cache.backends.base import MEMCACHE_MAX_KEY_LENGTH
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db import router
+from django.db import transaction
 from django.db.models.query import QuerySet
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.db.models import Model, TextField
+from django.db.models import F
+from django.db.models.fields import BigIntegerField
 from django.db.models.fields import CharField
 from django.db.models.fields import DateTimeField
 from .utils import registry
 from .utils import prettify_setting_name
+from .cache import delete_resolved_on_commit
+from .cache import get_resolved
+from .cache import resolve_once
+from .invalidation import publish_invalidation
+from .plans import clean_plan_for
+from .plans import form_fingerprint
+from .prefetch import ModelChoicePrefetcher
+from .records import accessors_enabled
+from .records import freeze
+from .records import frozen_records_enabled
+from .snapshot import snapshots
+from .snapshot import shared_snapshot_enabled
 from .validators import validate_setting_name
 
 
+class SettingsVersionQuerySet(QuerySet):
+    def current(self):
+        """
+        The current settings version, found by primary key.
+        """
+        version = self.filter(pk=1).values_list('version', flat=True).first()
+        return version or 0
+
+    def bump(self):
+        """
+        Increment the version, creating the row if it has gone missing. Done
+        as an UPDATE with an F() expression, so concurrent bumps can't be lost.
+        """
+        if self.filter(pk=1).update(version=F('version') + 1):
+            return True
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(pk=1, version=1)
+        except IntegrityError:
+            # someone else created it first.
+            self.filter(pk=1).update(version=F('version') + 1)
+        return True
+
+
+@python_2_unicode_compatible
+class SettingsVersion(Model):
+    """
+    A single row, whose `version` goes up every time any setting is saved,
+    deleted or bulk updated.
+    """
+    version = BigIntegerField(default=0)
+
+    objects = SettingsVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return '%d' % self.version
+
+    class Meta:
+        app_label = "stagesetting"
+        db_table = "stagesetting_settingsversion"
+        verbose_name = _("Settings version")
+        verbose_name_plural = _("Settings version")
+
+
+def get_settings_version(using=None):
+    """
+    Has anything changed since version N? Costs one primary key lookup.
+    """
+    return SettingsVersion.objects.using(using).current()
+
+
+def bump_settings_version(using=None):
+    return SettingsVersion.objects.using(using).bump()
+
+
+def mark_settings_changed(using=None):
+    """
+    Called from within the transaction which changed any setting.
+    """
+    bump_settings_version(using=using)
+    publish_invalidation(using=using)
+    return True
+
+
 class RuntimeSettingQuerySet(QuerySet):
     def keys(self):
         return self.values_list('key', flat=True)
@@ -28,10 +110,43 @@ class RuntimeSettingQuerySet(QuerySet):
             raise self.model.DoesNotExist("Invalid setting name")
         return self.filter(key=key).exists()
 
+    def version_token(self):
+        """
+        Changes whenever a setting is added, removed or saved.
+        """
+        return get_settings_version(using=self.db)
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            updated = super(RuntimeSettingQuerySet, self).update(**kwargs)
+            # no signals are sent for bulk updates.
+            delete_resolved_on_commit(model=self.model, using=self.db)
+            mark_settings_changed(using=self.db)
+        return updated
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            deleted = super(RuntimeSettingQuerySet, self).delete()
+            mark_settings_changed(using=self.db)
+        return deleted
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            created = super(RuntimeSettingQuerySet, self).bulk_create(*args, **kwargs)
+            delete_resolved_on_commit(model=self.model, using=self.db)
+            mark_settings_changed(using=self.db)
+        return created
+
 
 @python_2_unicode_compatible
 class BaseRuntimeSetting(Model):
     raw_value = TextField()
+    # the `form_fingerprint` of the form which validated `raw_value`.
+    fingerprint = CharField(max_length=32, blank=True, default='',
+                            editable=False)
     created = DateTimeField(auto_now_add=True)
     modified = DateTimeField(auto_now=True)
 
@@ -47,12 +162,30 @@ class BaseRuntimeSetting(Model):
     def get_form_class(self):
         return registry[self.key]
 
-    def get_form(self):
-        data = registry.deserialize(self.raw_value)
+    def get_form(self, data=None):
+        if data is None:
+            data = registry.deserialize(self.raw_value)
         return self.get_form_class()(data=data, initial=data, files=None)
 
-    def get_value(self):
-        form = self.get_form()
+    def get_value(self, form=None, data=None, prefetcher=None):
+        if form is None:
+            if data is None:
+                data = registry.deserialize(self.raw_value)
+            clean_field = None if prefetcher is None else prefetcher.clean
+            # values which were validated on the way in don't need the form.
+            trusted = registry.trusted_value(self.get_form_class(), data=data,
+                                             clean_field=clean_field,
+                                             fingerprint=self.fingerprint)
+            if trusted is not None:
+                return trusted
+            plan = clean_plan_for(self.get_form_class())
+            if plan is not None:
+                cleaned_data = plan(data, clean_field=clean_field)
+                if cleaned_data is not None:
+                    return cleaned_data
+            form = self.get_form(data=data)
+            if prefetcher is not None:
+                prefetcher.apply(form)
         form.full_clean()
         return form.cleaned_data
 
@@ -60,6 +193,18 @@ class BaseRuntimeSetting(Model):
         form = self.get_form_class()(data=value, initial=value, files=None)
         form.full_clean()
         self.raw_value = registry.serialize(form.cleaned_data)
+        self.fingerprint = self.fingerprint_for(form)
+
+    def fingerprint_for(self, form):
+        """
+        What to store in `fingerprint` when `raw_value` comes from `form`;
+        nothing unless it's a valid instance of this setting's form (or of a
+        subclass, like the admin's, which only changes widgets).
+        """
+        form_class = self.get_form_class()
+        if not isinstance(form, form_class) or not form.is_valid():
+            return ''
+        return form_fingerprint(form_class) or ''
 
     value = property(get_value, set_value)
 
@@ -78,6 +223,14 @@ class BaseRuntimeSetting(Model):
             'key': self.key, 'value': self.raw_value,
         }
 
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(self.__class__,
+                                                           instance=self)
+        with transaction.atomic(using=using):
+            super(BaseRuntimeSetting, self).save(*args, **kwargs)
+            mark_settings_changed(using=using)
+    save.alters_data = True
+
     def delete(self, using=None):
         assert self._get_pk_val() is not None, (
             "%s object can't be deleted because its %s attribute is set to None." %
@@ -85,6 +238,7 @@ class BaseRuntimeSetting(Model):
         )
         default = registry.get_default(self.key)
         self.raw_value = default
+        self.fingerprint = ''
         self.full_clean()
         self.save()
     delete.alters_data = True
@@ -112,11 +266,16 @@ class RuntimeSetting(BaseRuntimeSetting):
 
 @python_2_unicode_compatible
 class RuntimeSettingWrapper(object):
-    __slots__ = ('settings', '_lock', 'model')
-    def __init__(self, settings=None, model=RuntimeSetting):
+    __slots__ = ('settings', '_lock', 'model', 'lazy', '_partial', '_missing')
+    def __init__(self, settings=None, model=RuntimeSetting, lazy=None):
+        if lazy is None:
+            lazy = getattr(project_settings, 'STAGESETTING_LAZY', False)
         super(RuntimeSettingWrapper, self).__setattr__('settings', settings)
         super(RuntimeSettingWrapper, self).__setattr__('model', model)
         super(RuntimeSettingWrapper, self).__setattr__('_lock', RLock())
+        super(RuntimeSettingWrapper, self).__setattr__('lazy', lazy)
+        super(RuntimeSettingWrapper, self).__setattr__('_partial', {})
+        super(RuntimeSettingWrapper, self).__setattr__('_missing', set())
 
     def __str__(self):
         msg_dict = {'cls': self.__class__.__name__}
@@ -138,57 +297,143 @@ class RuntimeSettingWrapper(object):
             return exposed
         return list(self.settings.keys()) + exposed
 
+    @property
+    def version(self):
+        """
+        The current global settings version; see `get_settings_version`
+        """
+        return get_settings_version(using=router.db_for_read(self.model))
+
     def _fetch_settings(self):
         if self.settings is not None:
             return False
 
         with self._lock:
-            settings = {}
-            in_defaults = set(registry._defaults.keys())
-
-            # Set up anything that's been configured into the database.
-            keys = frozenset(registry._registry.keys())
-            for setting in self.model.objects.known(keys).iterator():  # noqa
-                try:
-                    # this may trigger further database hits for FK fields
-                    # (modelchoice, modelmultiplechoice)
-                    settings[setting.key] = setting.value
-                except ValidationError:
-                    continue
-
-            for key in in_defaults:
-                default_data = registry.deserialize(registry.get_default(key=key))
-                # Find the keys which are in the defaults, which aren't
-                # in the database value.
-                default_keys = set(default_data.keys())
-                saved_keys = set(settings.get(key, {}).keys())
-                missing_from_saved = default_keys - saved_keys
-
-                # db value has stale (missing) keys
-                if missing_from_saved:
-                    form_class = registry[key]
-                    form = form_class(data=default_data)
-                    # this may trigger further database hits for FK fields
-                    # (modelchoice, modelmultiplechoice)
-                    form.is_valid()
-                    if key not in settings:
-                        settings[key] = form.cleaned_data
-                    else:
-                        # any keys which are in the form and are in the defaults
-                        # may be added to the database-backed value so that stale
-                        # database entries don't have missing data until the next
-                        # time they're saved.
-                        for defaultkey in form.cleaned_data:
-                            if defaultkey not in settings[key]:
-                                settings[key][defaultkey] = form.cleaned_data[defaultkey]
+            if shared_snapshot_enabled():
+                settings = snapshots.get(model=self.model,
+                                         build=self._resolve_settings)
+            else:
+                settings = self._resolve_settings()
             super(RuntimeSettingWrapper, self).__setattr__('settings', settings)
         return True
 
+    def _fetch_keys(self, keys):
+        """
+        Lazy mode only: resolve just the given registered keys which haven't
+        already been looked up, using a single query. Keys which resolve to
+        nothing are remembered too, so they aren't queried again.
+        """
+        if self.settings is not None:
+            return False
+        wanted = frozenset(keys) - frozenset(self._partial) - self._missing
+        wanted = wanted & frozenset(registry.keys())
+        if not wanted:
+            return False
+
+        with self._lock:
+            # If this process or another already did all the work, use it
+            # wholesale.
+            resolved = None
+            if shared_snapshot_enabled():
+                resolved = snapshots.peek(model=self.model)
+            if resolved is None:
+                resolved = get_resolved(model=self.model)
+            if resolved is not None:
+                super(RuntimeSettingWrapper, self).__setattr__('settings',
+                                                               resolved)
+                return True
+            found = self._resolve_settings_uncached(keys=wanted)
+            self._partial.update(found)
+            self._missing.update(wanted - frozenset(found))
+        return True
+
+    def prefetch(self, *keys):
+        """
+        Load several settings in one go. Without lazy loading enabled, this
+        is the same as touching any setting, which loads them all.
+        """
+        if self.lazy:
+            return self._fetch_keys(keys=keys)
+        return self._fetch_settings()
+
+    def _resolve_settings(self):
+        return resolve_once(model=self.model,
+                            build=self._resolve_settings_uncached)
+
+    def _resolve_settings_uncached(self, keys=None):
+        settings = {}
+        if keys is None:
+            keys = frozenset(registry._registry.keys())
+        else:
+            keys = frozenset(keys) & frozenset(registry._registry.keys())
+        in_defaults = set(registry._defaults.keys()) & keys
+
+        # Set up anything that's been configured into the database.
+        # Build all the forms up front, so that any model instances they
+        # reference can be fetched together rather than field by field.
+        prefetcher = ModelChoicePrefetcher()
+        found = []
+        for setting in self.model.objects.known(keys).iterator():  # noqa
+            data = registry.deserialize(setting.raw_value)
+            prefetcher.add(setting.get_form_class().base_fields, data)
+            found.append((setting, data))
+        prefetcher.fetch()
+
+        for setting, data in found:
+            try:
+                settings[setting.key] = setting.get_value(
+                    data=data, prefetcher=prefetcher)
+            except ValidationError:
+                continue
+
+        for key in in_defaults:
+            # Find the keys which are in the defaults, which aren't
+            # in the database value.
+            default_keys = set(registry._get_default(key=key).keys())
+            saved_keys = set(settings.get(key, {}).keys())
+            missing_from_saved = default_keys - saved_keys
+
+            # db value has stale (missing) keys
+            if missing_from_saved:
+                default_value = registry.get_default_value(key=key)
+                if key not in settings:
+                    settings[key] = default_value
+                else:
+                    # any keys which are in the form and are in the defaults
+                    # may be added to the database-backed value so that stale
+                    # database entries don't have missing data until the next
+                    # time they're saved.
+                    for defaultkey in default_value:
+                        if defaultkey not in settings[key]:
+                            settings[key][defaultkey] = default_value[defaultkey]
+
+        if accessors_enabled():
+            for key, value in settings.items():
+                accessor = registry.get_accessor(key=key)
+                if sorted(accessor._fields) == sorted(value):
+                    settings[key] = accessor(value)
+                else:
+                    settings[key] = freeze(form_class=registry[key], data=value)
+        elif frozen_records_enabled():
+            for key, value in settings.items():
+                settings[key] = freeze(form_class=registry[key], data=value)
+        return settings
+
     def __getitem__(self, item):
+        if self.lazy and self.settings is None:
+            self._fetch_keys(keys=(item,))
+            if self.settings is None:
+                return self._partial[item]
         self._fetch_settings()
         return self.settings[item]
 
     def __getattr__(self, item):
+        if self.lazy and self.settings is None:
+            self._fetch_keys(keys=(item,))
+            if self.settings is None:
+                if item in self._partial:
+                    return self._partial[item]
+                raise AttributeError("%s not found" % item)
         self._fetch_settings()
         if item in self.settings:
             return self.settings[item]
@@ -199,6 +444,10 @@ class RuntimeSettingWrapper(object):
         return len(self.settings)
 
     def __contains__(self, item):
+        if self.lazy and self.settings is None:
+            self._fetch_keys(keys=(item,))
+            if self.settings is None:
+                return item in self._partial
         self._fetch_settings()
         return item in self.settings
 
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import re
+from threading import RLock
+
+
+DEFAULT_FLAGS = re.compile('').flags
+
+_in_use = set()
+_locks = {'patterns': RLock()}
+
+
+def after_fork():
+    _locks['patterns'] = RLock()
+
+
+def use_pattern(pattern):
+    """
+    Remember that choices filtered by the `pattern` regex (or `None`, for
+    every file) are wanted, so they're found along with everyone else's.
+    """
+    if pattern not in _in_use:
+        with _locks['patterns']:
+            _in_use.add(pattern)
+    return pattern
+
+
+def patterns_in_use(*also):
+    """
+    Every pattern given to `use_pattern`, plus `also`, in a stable order.
+    """
+    for pattern in also:
+        use_pattern(pattern)
+    with _locks['patterns']:
+        return tuple(sorted(_in_use, key=lambda pattern: (
+            pattern is not None, pattern or '')))
+
+
+class PatternFilter(object):
+    """
+    Sorts filenames into a list per regex in one pass, in the order they're
+    given; `None` stands for every file.
+
+    Where possible the patterns are also combined into one alternation, so
+    a filename matching none of them is rejected with a single search.
+    Patterns with groups (which could be referred to by number) or global
+    inline flags (which would apply to the others) can't be combined.
+    """
+    __slots__ = ('patterns', 'compiled', 'combined')
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.compiled = tuple((pattern, re.compile(pattern))
+                              for pattern in self.patterns
+                              if pattern is not None)
+        self.combined = self.combine(self.compiled)
+
+    @staticmethod
+    def combine(compiled):
+        if not compiled:
+            return None
+        for pattern, regex in compiled:
+            if regex.groups or regex.flags != DEFAULT_FLAGS:
+                return None
+        return re.compile('|'.join('(?:%s)' % pattern
+                                   for pattern, regex in compiled))
+
+    def __call__(self, filenames):
+        found = dict((pattern, []) for pattern in self.patterns)
+        everything = found.get(None)
+        compiled = self.compiled
+        combined = self.combined
+        for filename in filenames:
+            if everything is not None:
+                everything.append(filename)
+            if combined is not None and not combined.search(filename):
+                continue
+            for pattern, regex in compiled:
+                if regex.search(filename):
+                    found[pattern].append(filename)
+        return found
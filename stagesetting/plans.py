@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import hashlib
+import logging
+from threading import RLock
+from weakref import WeakKeyDictionary
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.datastructures import MultiValueDict
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
+from django.utils.six import get_unbound_function
+
+
+logger = logging.getLogger(__name__)
+
+
+# Anything which overrides these needs an actual form instance.
+FORM_METHODS = ('__init__', 'full_clean', '_clean_fields', '_clean_form',
+                '_post_clean', 'clean', 'add_prefix', 'get_initial_for_field')
+NO_FILES = MultiValueDict()
+
+
+def clean_plans_enabled():
+    return getattr(settings, 'STAGESETTING_CLEAN_PLANS', True)
+
+
+def _same_method(cls, base, name):
+    if not hasattr(base, name):
+        return not hasattr(cls, name)
+    return (get_unbound_function(getattr(cls, name)) is
+            get_unbound_function(getattr(base, name)))
+
+
+def _datadict_getter(field, name):
+    """
+    How the form would get the field's value out of its `data`.
+    """
+    widget_class = type(field.widget)
+    if _same_method(widget_class, forms.Widget, 'value_from_datadict'):
+        return lambda data: data.get(name)
+    value_from_datadict = field.widget.value_from_datadict
+    return lambda data: value_from_datadict(data, NO_FILES, name)
+
+
+class CleanPlan(object):
+    """
+    What `form.full_clean()` would do with a form's `data`, without the form:
+    each field's value is taken from the data the way its widget would take
+    it, and put through the field's `clean`, in order.
+
+    Only made for forms where that's all `full_clean` would do; see
+    `clean_plan_for`.
+    """
+    __slots__ = ('form_class', 'steps')
+
+    def __init__(self, form_class, steps):
+        self.form_class = form_class
+        self.steps = steps
+
+    def __call__(self, data, clean_field=None):
+        """
+        The equivalent of `cleaned_data`, or `None` if anything is invalid,
+        so that the form can be used to find out exactly what.
+
+        `clean_field(field, value)` is used for model-backed fields if given.
+        """
+        cleaned_data = {}
+        try:
+            for name, field, get_value in self.steps:
+                value = get_value(data)
+                if clean_field is not None and isinstance(
+                        field, forms.ModelChoiceField):
+                    cleaned_data[name] = clean_field(field, value)
+                else:
+                    cleaned_data[name] = field.clean(value)
+        except ValidationError:
+            return None
+        return cleaned_data
+
+
+def make_clean_plan(form_class):
+    """
+    A `CleanPlan` for `form_class`, or `None` if it does anything the plan
+    couldn't: custom `__init__` or form-level cleaning, `clean_<field>`
+    methods, a prefix, disabled or file fields, or widgets made of several
+    inputs.
+    """
+    if not issubclass(form_class, forms.BaseForm):
+        return None
+    for method in FORM_METHODS:
+        if not _same_method(form_class, forms.BaseForm, method):
+            return None
+    if getattr(form_class, 'prefix', None):
+        return None
+    steps = []
+    for name, field in form_class.base_fields.items():
+        if hasattr(form_class, 'clean_%s' % name):
+            return None
+        if getattr(field, 'disabled', False):
+            return None
+        if isinstance(field, forms.FileField):
+            return None
+        if isinstance(field.widget, (forms.MultiWidget, forms.FileInput)):
+            return None
+        steps.append((name, field, _datadict_getter(field, name)))
+    return CleanPlan(form_class=form_class, steps=tuple(steps))
+
+
+_plans = WeakKeyDictionary()
+_locks = {'plans': RLock()}
+
+
+def after_fork():
+    _locks['plans'] = RLock()
+
+
+def clean_plan_for(form_class):
+    """
+    The (memoized) `CleanPlan` for `form_class`, or `None`.
+    """
+    if not clean_plans_enabled():
+        return None
+    try:
+        return _plans[form_class]
+    except KeyError:
+        pass
+    with _locks['plans']:
+        if form_class not in _plans:
+            plan = make_clean_plan(form_class)
+            if plan is None:
+                logger.debug("%r can't be planned, so is cleaned by the form",
+                             form_class)
+            _plans[form_class] = plan
+        return _plans[form_class]
+
+
+# The options which change what a field accepts, or what it cleans to.
+FINGERPRINT_OPTIONS = ('required', 'max_length', 'min_length', 'min_value',
+                       'max_value', 'max_digits', 'decimal_places',
+                       'input_formats', 'empty_value', 'to_field_name',
+                       'allow_unicode', 'protocol', 'unpack_ipv4', 'coerce')
+
+
+def _qualified_name(obj):
+    # classes and functions name themselves; instances go by their class.
+    if not isinstance(obj, type) and not hasattr(obj, '__name__'):
+        obj = type(obj)
+    return '%s.%s' % (obj.__module__, obj.__name__)
+
+
+def _field_signature(field):
+    """
+    Everything about `field` which, if changed, might make a previously
+    valid value invalid (or clean to something else); or `None` if that
+    can't be known up front.
+    """
+    options = []
+    for option in FINGERPRINT_OPTIONS:
+        if hasattr(field, option):
+            value = getattr(field, option)
+            if option == 'input_formats' and value is not None:
+                # Usually lazily read from the current locale's formats.
+                value = [force_text(fmt) for fmt in value]
+            elif option == 'coerce':
+                # by name, as the repr of a function includes its address.
+                value = _qualified_name(value)
+            options.append((option, force_text(value)))
+    if hasattr(field, 'queryset'):
+        options.append(('model', force_text(field.queryset.model._meta.label_lower)))
+    elif hasattr(field, 'choices'):
+        # callable choices are wrapped in an iterator, rather than a list.
+        if not isinstance(getattr(field, '_choices', None), (list, tuple)):
+            return None
+        options.append(('choices', force_text([
+            (force_text(key), force_text(value))
+            for key, value in field.choices])))
+    if hasattr(field, 'regex'):
+        options.append(('regex', force_text(field.regex.pattern)))
+    validators = sorted(
+        '%s(%s)' % (_qualified_name(validator),
+                    force_text(getattr(validator, 'limit_value', '')))
+        for validator in field.validators)
+    return (_qualified_name(field), _qualified_name(field.widget),
+            tuple(options), tuple(validators))
+
+
+def make_form_fingerprint(form_class):
+    signatures = []
+    for name, field in form_class.base_fields.items():
+        signature = _field_signature(field)
+        if signature is None:
+            return None
+        signatures.append((force_text(name), signature))
+    structure = force_text((_qualified_name(form_class), tuple(signatures)))
+    return hashlib.md5(force_bytes(structure)).hexdigest()
+
+
+_fingerprints = WeakKeyDictionary()
+
+
+def form_fingerprint(form_class):
+    """
+    A digest of the structure of `form_class` (its fields' names, types and
+    options), stored alongside values it has validated, so that they can
+    be trusted on the way back out if it hasn't changed since.
+
+    `None` for forms with anything which can change without the form
+    changing, like callable choices.
+    """
+    try:
+        return _fingerprints[form_class]
+    except KeyError:
+        pass
+    with _locks['plans']:
+        if form_class not in _fingerprints:
+            _fingerprints[form_class] = make_form_fingerprint(form_class)
+        return _fingerprints[form_class]
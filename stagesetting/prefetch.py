@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from collections import OrderedDict
+from functools import partial
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # pragma: no cover
+    from django.db.models.sql.datastructures import EmptyResultSet
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceField
+from django.forms.models import ModelMultipleChoiceField
+from django.utils.encoding import force_text
+
+
+def _queryset_key(queryset):
+    """
+    Fields whose querysets would generate the same SQL can share the same
+    fetched objects; usually that means one query per model.
+    """
+    try:
+        return (queryset.model, force_text(queryset.query))
+    except EmptyResultSet:
+        return None
+
+
+def _to_pks(model, values):
+    to_python = model._meta.pk.to_python
+    return tuple(to_python(value) for value in values)
+
+
+def _clean_single(field, objects, original, value):
+    if value in field.empty_values:
+        return original(value)
+    try:
+        pk, = _to_pks(field.queryset.model, (value,))
+    except (ValidationError, ValueError, TypeError):
+        return original(value)
+    if pk not in objects:
+        # let the field come up with the usual error.
+        return original(value)
+    obj = objects[pk]
+    field.validate(obj)
+    field.run_validators(obj)
+    return obj
+
+
+def _clean_multiple(field, objects, original, value):
+    value = field.prepare_value(value)
+    if not value or not isinstance(value, (list, tuple)):
+        return original(value)
+    try:
+        pks = frozenset(_to_pks(field.queryset.model, value))
+    except (ValidationError, ValueError, TypeError):
+        return original(value)
+    if not pks.issubset(objects):
+        return original(value)
+    queryset = field.queryset.filter(pk__in=pks)
+    # Equivalent to the queryset having been evaluated already, which is
+    # what ModelMultipleChoiceField would have done while checking the values.
+    queryset._result_cache = [obj for pk, obj in objects.items() if pk in pks]
+    field.run_validators(value)
+    return queryset
+
+
+class ModelChoicePrefetcher(object):
+    """
+    Collects the primary keys used by every ModelChoiceField and
+    ModelMultipleChoiceField across a number of bound forms, so they can be
+    fetched with one query per queryset rather than (at least) one per field.
+    """
+    __slots__ = ('_querysets', '_wanted', '_found')
+
+    def __init__(self):
+        self._querysets = OrderedDict()
+        self._wanted = {}
+        self._found = {}
+
+    def _prefetchable_fields(self, fields):
+        for name, field in fields.items():
+            if not isinstance(field, ModelChoiceField):
+                continue
+            if field.to_field_name is not None:
+                continue
+            group = _queryset_key(field.queryset)
+            if group is None:
+                continue
+            yield name, field, group
+
+    def add(self, fields, data):
+        """
+        Note down the primary keys `data` uses for any of the given form
+        `fields` (usually a form class's `base_fields`)
+        """
+        for name, field, group in self._prefetchable_fields(fields):
+            value = data.get(name)
+            if value in field.empty_values:
+                continue
+            if isinstance(field, ModelMultipleChoiceField):
+                if not isinstance(value, (list, tuple)):
+                    continue
+                values = value
+            else:
+                values = (value,)
+            try:
+                pks = _to_pks(field.queryset.model, values)
+            except (ValidationError, ValueError, TypeError):
+                continue
+            self._querysets.setdefault(group, field.queryset)
+            self._wanted.setdefault(group, set()).update(pks)
+        return True
+
+    def fetch(self):
+        for group, queryset in self._querysets.items():
+            if group in self._found:
+                continue
+            # QuerySet.in_bulk() clears any ordering, which would change the
+            # order ModelMultipleChoiceField values come out in.
+            pks = self._wanted[group]
+            self._found[group] = OrderedDict(
+                (obj.pk, obj) for obj in queryset.filter(pk__in=pks))
+        return len(self._found)
+
+    def _cleaner_for(self, field):
+        if not isinstance(field, ModelChoiceField):
+            return None
+        if field.to_field_name is not None:
+            return None
+        group = _queryset_key(field.queryset)
+        if group is None or group not in self._found:
+            return None
+        if isinstance(field, ModelMultipleChoiceField):
+            return partial(_clean_multiple, field, self._found[group])
+        return partial(_clean_single, field, self._found[group])
+
+    def clean(self, field, value):
+        """
+        Clean `value` for the given `field` using the fetched objects where
+        possible. Anything not found falls through to the normal `clean`.
+        """
+        cleaner = self._cleaner_for(field)
+        if cleaner is None:
+            return field.clean(value)
+        return cleaner(field.clean, value)
+
+    def apply(self, form):
+        """
+        Make the form's model-backed fields use the fetched objects. The
+        fields are the form instance's own copies, so the form class is left
+        alone.
+        """
+        for field in form.fields.values():
+            cleaner = self._cleaner_for(field)
+            if cleaner is not None:
+                field.clean = partial(cleaner, field.clean)
+        return form
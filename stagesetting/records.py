@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import keyword
+import re
+from threading import RLock
+from uuid import UUID
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models.query import QuerySet
+from django.utils import six
+from django.utils.encoding import force_str
+
+
+IDENTIFIER = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+
+
+def frozen_records_enabled():
+    return getattr(settings, 'STAGESETTING_FROZEN', False)
+
+
+class SettingRecord(object):
+    """
+    An immutable replacement for a setting's `cleaned_data` dictionary,
+    which supports both `record.name` and `record['name']`, along with the
+    read-only parts of the dictionary API, and compares equal to the
+    dictionary it was made from.
+
+    Subclasses are generated by `record_class`; fields whose names can't be
+    used as attributes (or would hide a method) are only available as items.
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __init__(self, data):
+        for name, slot in six.iteritems(self._index):
+            object.__setattr__(self, slot, data[name])
+
+    def __setattr__(self, key, value):
+        raise AttributeError("%s is read-only" % self.__class__.__name__)
+
+    def __delattr__(self, key):
+        raise AttributeError("%s is read-only" % self.__class__.__name__)
+
+    def __reduce__(self):
+        return (make_record, (self._fields, tuple(self.values())))
+
+    def __getitem__(self, item):
+        try:
+            slot = self._index[item]
+        except (KeyError, TypeError):
+            raise KeyError(item)
+        return getattr(self, slot)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, SettingRecord):
+            return (self._fields == other._fields and
+                    tuple(self.values()) == tuple(other.values()))
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%(cls)s %(values)r>' % {'cls': self.__class__.__name__,
+                                         'values': self._asdict()}
+
+    def get(self, item, default=None):
+        if item in self._index:
+            return self[item]
+        return default
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return [getattr(self, self._index[name]) for name in self._fields]
+
+    def items(self):
+        return [(name, getattr(self, self._index[name]))
+                for name in self._fields]
+
+    def copy(self):
+        """
+        A mutable copy, as a dictionary.
+        """
+        return self._asdict()
+
+    def _asdict(self):
+        return dict(self.items())
+
+
+def slot_name(name, position):
+    if (IDENTIFIER.match(name) and not keyword.iskeyword(name) and
+            not hasattr(SettingAccessor, name)):
+        return name
+    return '_f%d' % position
+
+
+_classes = {}
+_locks = {'classes': RLock()}
+
+
+def after_fork():
+    _locks['classes'] = RLock()
+
+
+def record_class(fields):
+    """
+    The record class for the given field names, generated once and reused.
+    """
+    fields = tuple(fields)
+    try:
+        return _classes[fields]
+    except KeyError:
+        pass
+    with _locks['classes']:
+        if fields not in _classes:
+            index = dict((name, slot_name(name, position))
+                         for position, name in enumerate(fields))
+            attrs = {
+                '__slots__': tuple(force_str(slot)
+                                   for slot in sorted(index.values())),
+                '_fields': fields,
+                '_index': index,
+            }
+            _classes[fields] = type(force_str('SettingRecord'),
+                                    (SettingRecord,), attrs)
+    return _classes[fields]
+
+
+def record_class_for(form_class):
+    return record_class(fields=form_class.base_fields.keys())
+
+
+def make_record(fields, values):
+    return record_class(fields=fields)(dict(zip(fields, values)))
+
+
+def freeze(form_class, data):
+    """
+    Turn a setting's `cleaned_data` into a record; usually generated from the
+    form's fields, unless the data doesn't match them.
+    """
+    if isinstance(data, SettingRecord):
+        return data
+    fields = tuple(form_class.base_fields.keys())
+    if len(fields) != len(data) or any(name not in data for name in fields):
+        fields = tuple(data.keys())
+    return record_class(fields=fields)(data)
+
+
+# The Python type each kind of form field cleans to, most specific first.
+FIELD_TYPES = (
+    (forms.ModelMultipleChoiceField, QuerySet),
+    (forms.MultipleChoiceField, list),
+    (forms.NullBooleanField, bool),
+    (forms.BooleanField, bool),
+    (forms.DecimalField, Decimal),
+    (forms.FloatField, float),
+    (forms.IntegerField, int),
+    (forms.DateTimeField, datetime),
+    (forms.DateField, date),
+    (forms.TimeField, time),
+    (forms.CharField, six.text_type),
+    (forms.ChoiceField, six.text_type),
+)
+if hasattr(forms, 'DurationField'):
+    FIELD_TYPES += ((forms.DurationField, timedelta),)
+if hasattr(forms, 'UUIDField'):
+    FIELD_TYPES += ((forms.UUIDField, UUID),)
+
+
+def field_type(field):
+    """
+    What `field` cleans its value to, or `object` if that isn't known.
+    """
+    if isinstance(field, forms.ModelChoiceField) and not isinstance(
+            field, forms.ModelMultipleChoiceField):
+        return field.queryset.model
+    if isinstance(field, forms.TypedChoiceField):
+        return object
+    for field_class, python_type in FIELD_TYPES:
+        if isinstance(field, field_class):
+            return python_type
+    return object
+
+
+class SettingAccessor(SettingRecord):
+    """
+    Generated by `FormRegistry.get_accessor` for each registered setting;
+    a record with one slot per field of the setting's form, and the type
+    each holds in `_types`.
+    """
+    __slots__ = ()
+    _key = None
+    _form_class = None
+    _types = {}
+
+    def __reduce__(self):
+        return (make_accessor, (self._key, self._fields,
+                                tuple(self.values())))
+
+    @classmethod
+    def from_raw(cls, data, fingerprint=None, clean_field=None):
+        """
+        Build one from deserialized `data`, as stored in a setting's
+        `raw_value` along with its `fingerprint`. Data the form as it is now
+        stored is trusted (see `FormRegistry.trusted_value`), so only
+        converted by each field; anything else goes through the form, and
+        raises `ValidationError` if it isn't valid.
+
+        `clean_field(field, value)`, such as `ModelChoicePrefetcher.clean`,
+        is used to fetch the objects for model-backed fields.
+        """
+        from .utils import registry
+        values = registry.trusted_value(cls._form_class, data=data,
+                                        clean_field=clean_field,
+                                        fingerprint=fingerprint)
+        if values is None:
+            form = cls._form_class(data=data, initial=data, files=None)
+            if not form.is_valid():
+                raise ValidationError(form.errors)
+            values = form.cleaned_data
+        return cls(values)
+
+
+def accessor_class(key, form_class):
+    fields = form_class.base_fields
+    name = ''.join(part.title() for part in key.split('_')) + 'Setting'
+    attrs = {
+        '__slots__': (),
+        '_key': key,
+        '_form_class': form_class,
+        '_types': dict((field_name, field_type(field))
+                       for field_name, field in fields.items()),
+    }
+    bases = (SettingAccessor, record_class(fields=fields.keys()))
+    return type(force_str(name), bases, attrs)
+
+
+def make_accessor(key, fields, values):
+    from .utils import registry
+    try:
+        cls = registry.get_accessor(key=key)
+    except KeyError:
+        cls = None
+    if cls is None or cls._fields != tuple(fields):
+        return make_record(fields=fields, values=values)
+    return cls(dict(zip(fields, values)))
+
+
+def accessors_enabled():
+    return getattr(settings, 'STAGESETTING_ACCESSORS', False)
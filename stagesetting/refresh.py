@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+import random
+from threading import Event
+from threading import RLock
+from threading import Thread
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    'TTL': 30.0,
+    'JITTER': 5.0,
+    'MAX_STALENESS': 300.0,
+}
+
+
+def get_refresh_config():
+    """
+    `STAGESETTING_REFRESH`, which looks like::
+
+        STAGESETTING_REFRESH = {
+            'TTL': 30.0,
+            'JITTER': 5.0,
+            'MAX_STALENESS': 300.0,
+        }
+
+    or `None` if background refreshing is switched off (the default)
+    """
+    config = getattr(settings, 'STAGESETTING_REFRESH', None)
+    if config is None:
+        return None
+    merged = DEFAULTS.copy()
+    merged.update(config)
+    return merged
+
+
+class Refresher(object):
+    """
+    Revalidates snapshots from a daemon thread every `ttl` seconds (give or
+    take up to `jitter`, so that processes don't all do it at once), while
+    readers carry on using the last good one.
+
+    Once a snapshot hasn't been successfully revalidated for `max_staleness`
+    seconds, readers stop trusting it and rebuild it themselves.
+    """
+    def __init__(self, ttl, jitter, max_staleness):
+        self.ttl = ttl
+        self.jitter = jitter
+        self.max_staleness = max_staleness
+        self._callbacks = {}
+        self._lock = RLock()
+        self._stop = Event()
+        self._thread = None
+
+    def after_fork(self):
+        """
+        The thread doesn't exist in the child; it's restarted by the next
+        `watch()`
+        """
+        self._lock = RLock()
+        self._stop = Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def watch(self, key, callback):
+        """
+        `callback` will be called with no arguments on every refresh.
+        """
+        if key not in self._callbacks:
+            with self._lock:
+                self._callbacks[key] = callback
+        if not self.running:
+            self.start()
+        return callback
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            thread = Thread(target=self.run, name='stagesetting-refresher')
+            thread.daemon = True
+            self._thread = thread
+            thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        return thread is not None
+
+    def next_interval(self):
+        return max(0, self.ttl + random.uniform(-self.jitter, self.jitter))
+
+    def run(self):
+        while not self._stop.wait(self.next_interval()):
+            try:
+                self.refresh()
+            finally:
+                # only affects this thread's connections.
+                for connection in connections.all():
+                    connection.close()
+
+    def refresh(self):
+        refreshed = 0
+        for key, callback in tuple(self._callbacks.items()):
+            try:
+                callback()
+            except Exception:
+                logger.exception("Unable to refresh %r, will serve the "
+                                 "previous snapshot", key)
+            else:
+                refreshed += 1
+        return refreshed
+
+
+_refresher = {}
+
+
+def get_refresher():
+    if 'refresher' not in _refresher:
+        config = get_refresh_config()
+        if config is None:
+            _refresher['refresher'] = None
+        else:
+            _refresher['refresher'] = Refresher(
+                ttl=config['TTL'], jitter=config['JITTER'],
+                max_staleness=config['MAX_STALENESS'])
+    return _refresher['refresher']
+
+
+def reset_refresher(**kwargs):
+    if kwargs.get('setting', 'STAGESETTING_REFRESH') == 'STAGESETTING_REFRESH':
+        refresher = _refresher.pop('refresher', None)
+        if refresher is not None:
+            refresher.stop()
+setting_changed.connect(reset_refresher,
+                        dispatch_uid='stagesetting_reset_refresher')
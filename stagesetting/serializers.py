@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from base64 import b64decode
+from base64 import b64encode
+import json
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_text
+from django.utils.six import string_types, integer_types
+from .utils import JSONEncoder
+from .utils import TaggedJSONEncoder
+from .utils import decode_tagged
+
+
+PRIMITIVE_TYPES = string_types + integer_types + (float, bool, type(None))
+
+
+def prepare_tagged(value, default=TaggedJSONEncoder().default):
+    """
+    Turn `value` into something made only of dicts, lists and primitives,
+    tagging anything else the way `TaggedJSONEncoder` would. For codecs which
+    natively understand (and therefore lose the type of) things like UUIDs.
+    """
+    if isinstance(value, PRIMITIVE_TYPES):
+        return value
+    elif isinstance(value, dict):
+        return dict((k, prepare_tagged(v)) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [prepare_tagged(v) for v in value]
+    return prepare_tagged(default(value))
+
+
+def restore_tagged(value):
+    """
+    The reverse of `prepare_tagged`, for codecs without an `object_hook`.
+    Works from the inside out, as `object_hook` would.
+    """
+    if isinstance(value, dict):
+        return decode_tagged(dict((k, restore_tagged(v))
+                                  for k, v in value.items()))
+    elif isinstance(value, list):
+        return [restore_tagged(v) for v in value]
+    return value
+
+
+class BaseSerializer(object):
+    """
+    Turns setting data into text for the `raw_value` column, and back.
+
+    `dumps(data, tagged=True)` must record the types of values, and `loads`
+    must return a `TaggedValues` for such data, as `JSONSerializer` does.
+    `loads` should also cope with anything written by `JSONSerializer`, so
+    that existing values remain readable after switching.
+    """
+    __slots__ = ()
+
+    def dumps(self, data, tagged=False):  # pragma: no cover
+        raise NotImplementedError("Subclasses should implement dumps()")
+
+    def loads(self, data):  # pragma: no cover
+        raise NotImplementedError("Subclasses should implement loads()")
+
+    def tag(self, data):
+        return {'__t': 'tagged', 'v': data}
+
+
+class JSONSerializer(BaseSerializer):
+    """
+    The default, using the standard library's `json` module.
+    """
+    __slots__ = ()
+
+    def dumps(self, data, tagged=False):
+        if tagged:
+            return json.dumps(self.tag(data), cls=TaggedJSONEncoder)
+        return json.dumps(data, cls=JSONEncoder)
+
+    def loads(self, data):
+        return json.loads(data, object_hook=decode_tagged)
+
+
+class OrjsonSerializer(BaseSerializer):
+    """
+    Uses `orjson`, which must be installed. The output is still JSON, so
+    existing values can be read, though it omits the optional whitespace.
+    """
+    __slots__ = ('orjson', 'untagged_default')
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise ImproperlyConfigured("OrjsonSerializer requires `orjson` "
+                                       "to be installed")
+        self.orjson = orjson
+        self.untagged_default = JSONEncoder().default
+
+    def dumps(self, data, tagged=False):
+        orjson = self.orjson
+        if tagged:
+            output = orjson.dumps(self.tag(prepare_tagged(data)))
+        else:
+            # Hand dates and times over to `JSONEncoder`, as orjson would
+            # otherwise write them in a format the form fields won't accept.
+            output = orjson.dumps(data, default=self.untagged_default,
+                                  option=orjson.OPT_PASSTHROUGH_DATETIME)
+        return output.decode('utf-8')
+
+    def loads(self, data):
+        return restore_tagged(self.orjson.loads(data))
+
+
+class MsgpackSerializer(BaseSerializer):
+    """
+    Uses `msgpack`, which must be installed. As the column is text, the
+    output is base64 encoded and prefixed, so anything without the prefix is
+    assumed to be JSON written before switching.
+    """
+    __slots__ = ('msgpack', 'untagged_default', 'tagged_default')
+    prefix = 'msgpack:'
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImproperlyConfigured("MsgpackSerializer requires `msgpack` "
+                                       "to be installed")
+        self.msgpack = msgpack
+        self.untagged_default = JSONEncoder().default
+        self.tagged_default = TaggedJSONEncoder().default
+
+    def dumps(self, data, tagged=False):
+        if tagged:
+            packed = self.msgpack.packb(self.tag(data), use_bin_type=True,
+                                        default=self.tagged_default)
+        else:
+            packed = self.msgpack.packb(data, use_bin_type=True,
+                                        default=self.untagged_default)
+        return self.prefix + force_text(b64encode(packed))
+
+    def loads(self, data):
+        if not data.startswith(self.prefix):
+            return JSONSerializer().loads(data)
+        packed = b64decode(data[len(self.prefix):])
+        return self.msgpack.unpackb(packed, raw=False,
+                                    object_hook=decode_tagged)
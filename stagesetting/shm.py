@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+from stat import S_IWGRP, S_IWOTH
+import struct
+import tempfile
+from threading import RLock
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.encoding import force_bytes
+from django.utils.six.moves import cPickle as pickle
+from .cache import cache_key_prefix
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'SSTG'
+FORMAT = 1
+# magic, format, settings version, registry digest, payload length.
+HEADER = struct.Struct(str('!4sHq16sQ'))
+
+
+def get_shared_memory_dir():
+    """
+    The directory (ideally a tmpfs, like `/dev/shm/myproject`) in which
+    resolved settings are shared by every process on the host, or `None`
+    if that's switched off (the default).
+    """
+    return getattr(settings, 'STAGESETTING_SHARED_MEMORY', None)
+
+
+def shared_memory_enabled():
+    return get_shared_memory_dir() is not None
+
+
+def owned_by_us(found):
+    """
+    Whether the `os.stat` result `found` belongs to this process's user;
+    always true where there are no user ids to compare.
+    """
+    getuid = getattr(os, 'getuid', None)
+    return getuid is None or found.st_uid == getuid()
+
+
+def is_private_directory(path):
+    """
+    Whether only this process's user could have put files in `path`: it's
+    theirs, and nobody else can write to it. Snapshots are unpickled, so
+    they're only shared via directories like that.
+    """
+    try:
+        found = os.stat(path)
+    except OSError:
+        return False
+    return owned_by_us(found) and not found.st_mode & (S_IWGRP | S_IWOTH)
+
+
+def registry_digest(model):
+    return hashlib.md5(force_bytes(cache_key_prefix(model=model))).digest()
+
+
+class SharedSnapshotFile(object):
+    """
+    One process writes the resolved settings to `path`, prefixed by a header
+    saying which settings version they are for; every other process maps
+    the file read-only and only unpickles it if the header matches the
+    version it wants.
+
+    The file is only ever replaced (by renaming over it), never modified,
+    so a mapping always sees a complete snapshot. Files belonging to another
+    user are ignored, and nothing is shared at all unless the directory
+    passes `is_private_directory`.
+    """
+    __slots__ = ('path', '_lock', '_mapped', '_identity')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = RLock()
+        self._mapped = None
+        self._identity = None
+
+    def after_fork(self):
+        self._lock = RLock()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._mapped is not None:
+                self._mapped.close()
+            self._mapped = None
+            self._identity = None
+
+    def _map(self):
+        """
+        The mapping of the current file, remapped only if it's been replaced.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.close()
+            return None
+        identity = (stat.st_dev, stat.st_ino)
+        if self._mapped is not None and identity == self._identity:
+            return self._mapped
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size or not owned_by_us(stat):
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.close()
+        self._mapped = mapped
+        self._identity = (stat.st_dev, stat.st_ino)
+        return mapped
+
+    def read(self, version, digest):
+        """
+        The snapshot for the given version, or `None` if the file holds a
+        different one (or there's no usable file)
+        """
+        with self._lock:
+            try:
+                mapped = self._map()
+            except (OSError, IOError, ValueError):
+                logger.exception("Unable to map %s", self.path)
+                return None
+            if mapped is None:
+                return None
+            magic, fmt, found_version, found_digest, length = HEADER.unpack_from(mapped, 0)  # noqa
+            if (magic != MAGIC or fmt != FORMAT or found_version != version or
+                    found_digest != digest):
+                return None
+            if len(mapped) < HEADER.size + length:
+                return None
+            try:
+                return pickle.loads(mapped[HEADER.size:HEADER.size + length])
+            except Exception:
+                logger.exception("Unable to load the snapshot in %s", self.path)
+                return None
+
+    def write(self, version, digest, resolved):
+        payload = pickle.dumps(resolved, pickle.HIGHEST_PROTOCOL)
+        header = HEADER.pack(MAGIC, FORMAT, version, digest, len(payload))
+        directory, filename = os.path.split(self.path)
+        # mkstemp means only our own user can write (or read) the snapshot.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=filename,
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """
+        Only one process on the host rebuilds at a time; the rest wait and
+        then find the file already written.
+        """
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open('%s.lock' % self.path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get(self, version, digest, build):
+        directory = os.path.dirname(self.path)
+        if not is_private_directory(directory):
+            logger.warning("Not sharing the snapshot via %s, as it isn't a "
+                           "directory only this user can write to",
+                           directory)
+            return build()
+        resolved = self.read(version=version, digest=digest)
+        if resolved is not None:
+            return resolved
+        try:
+            with self.exclusive():
+                resolved = self.read(version=version, digest=digest)
+                if resolved is not None:
+                    return resolved
+                resolved = build()
+                self.write(version=version, digest=digest, resolved=resolved)
+                return resolved
+        except (OSError, IOError):
+            logger.exception("Unable to share the snapshot via %s", self.path)
+            if resolved is None:
+                resolved = build()
+            return resolved
+
+
+_files = {}
+
+
+def get_shared_file(model):
+    directory = get_shared_memory_dir()
+    if directory is None:
+        return None
+    path = os.path.join(directory, '%s.%s.snapshot' % (
+        model._meta.app_label, model._meta.model_name))
+    if path not in _files:
+        _files[path] = SharedSnapshotFile(path=path)
+    return _files[path]
+
+
+def get_shared(model, build, version=None):
+    """
+    The resolved settings for `model`, from the host-wide file if it's for
+    the current settings version, or by calling `build` and sharing the
+    result otherwise.
+    """
+    shared = get_shared_file(model=model)
+    if shared is None:
+        return build()
+    if version is None:
+        version = model.objects.version_token()
+    return shared.get(version=version, digest=registry_digest(model=model),
+                      build=build)
+
+
+def reset_files(**kwargs):
+    if kwargs.get('setting', 'STAGESETTING_SHARED_MEMORY') == 'STAGESETTING_SHARED_MEMORY':
+        for shared in tuple(_files.values()):
+            shared.close()
+        _files.clear()
+setting_changed.connect(reset_files, dispatch_uid='stagesetting_reset_files')
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from collections import namedtuple
+from functools import partial
+import logging
+from threading import RLock
+import time
+from django.conf import settings
+from .invalidation import get_bus
+from .invalidation import subscribe
+from .records import freeze
+from .refresh import get_refresh_config
+from .refresh import get_refresher
+from .shm import get_shared
+from .shm import shared_memory_enabled
+from .utils import registry
+
+
+logger = logging.getLogger(__name__)
+
+
+Snapshot = namedtuple('Snapshot', 'token settings checked_at')
+
+
+def freeze_settings(resolved):
+    """
+    Make each setting in `resolved` an immutable record, so that a snapshot
+    shared by every wrapper can't be changed through one of them.
+    """
+    frozen = {}
+    for key, value in resolved.items():
+        if isinstance(value, dict) and key in registry._registry:
+            value = freeze(form_class=registry[key], data=value)
+        frozen[key] = value
+    return frozen
+
+
+def shared_snapshot_enabled():
+    # sharing between processes implies sharing within them.
+    return (getattr(settings, 'STAGESETTING_SHARED_SNAPSHOT', False) or
+            shared_memory_enabled() or get_refresh_config() is not None)
+
+
+class SnapshotStore(object):
+    """
+    Holds one resolved settings dictionary per model, shared by every
+    `RuntimeSettingWrapper` in the process.
+
+    A snapshot is never mutated once it has been stored, and each setting in
+    it is frozen into a record, so it can't be mutated by its readers either;
+    when the token (registry generation + settings version) moves on, a new
+    one replaces it.
+
+    If an invalidation bus is configured, the settings version isn't
+    checked; instead the bus clears the snapshots when anything changes.
+
+    With `STAGESETTING_SHARED_MEMORY`, rebuilding first looks for a snapshot
+    another process on the host has already written.
+
+    With `STAGESETTING_REFRESH`, readers aren't asked to check the token at
+    all; a background thread does it instead.
+    """
+    __slots__ = ('_snapshots', '_lock')
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def __contains__(self, model):
+        return model in self._snapshots
+
+    def after_fork(self):
+        """
+        The snapshots themselves are never mutated, so are kept.
+        """
+        self._lock = RLock()
+
+    def get_token(self, model):
+        bus = get_bus()
+        if bus is not None:
+            bus.poll()
+            return (registry.generation, None)
+        return (registry.generation, model.objects.version_token())
+
+    def _trusted(self, model, refresher):
+        """
+        With a background refresher, any snapshot for the current registry
+        which has been checked within `max_staleness` seconds will do.
+        """
+        current = self._snapshots.get(model)
+        if current is None or current.token[0] != registry.generation:
+            return None
+        if time.time() - current.checked_at > refresher.max_staleness:
+            return None
+        return current
+
+    def peek(self, model):
+        """
+        The snapshot for `model` if it's known to be current without asking
+        the database or the invalidation bus, or `None`.
+        """
+        refresher = get_refresher()
+        if refresher is not None:
+            current = self._trusted(model=model, refresher=refresher)
+            return current.settings if current is not None else None
+        bus = get_bus()
+        if bus is None or bus.due():
+            return None
+        current = self._snapshots.get(model)
+        if current is not None and current.token == (registry.generation, None):
+            return current.settings
+        return None
+
+    def get(self, model, build):
+        refresher = get_refresher()
+        if refresher is not None:
+            current = self._trusted(model=model, refresher=refresher)
+            refresher.watch(model, partial(self.revalidate, model=model,
+                                           build=build))
+            if current is not None:
+                return current.settings
+        return self.revalidate(model=model, build=build)
+
+    def revalidate(self, model, build):
+        """
+        Check the token, and rebuild the snapshot if it has moved on.
+        """
+        token = self.get_token(model=model)
+        current = self._snapshots.get(model)
+        if current is not None and current.token == token:
+            if get_refresher() is not None:
+                self._snapshots[model] = current._replace(
+                    checked_at=time.time())
+            return current.settings
+
+        # only one thread rebuilds; if there's a previous snapshot, everyone
+        # else carries on using it rather than waiting.
+        if not self._lock.acquire(current is None):
+            return current.settings
+        try:
+            # someone else may have rebuilt it while we waited for the lock.
+            current = self._snapshots.get(model)
+            if current is not None and current.token == token:
+                return current.settings
+            logger.debug("Rebuilding settings snapshot for %r", model)
+            if shared_memory_enabled():
+                resolved = get_shared(model=model, build=build,
+                                      version=token[1])
+            else:
+                resolved = build()
+            resolved = freeze_settings(resolved)
+            self._snapshots[model] = Snapshot(token=token, settings=resolved,
+                                              checked_at=time.time())
+            return resolved
+        finally:
+            self._lock.release()
+
+    def clear(self, model=None):
+        with self._lock:
+            if model is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(model, None)
+
+
+snapshots = SnapshotStore()
+subscribe(snapshots.clear)
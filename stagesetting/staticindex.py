@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from collections import namedtuple
+import os
+from threading import RLock
+import time
+from django.conf import settings
+from django.contrib.staticfiles.finders import AppDirectoriesFinder
+from django.contrib.staticfiles.finders import FileSystemFinder
+from django.contrib.staticfiles.finders import get_finders
+from django.core.signals import setting_changed
+from django.utils.six import get_unbound_function
+
+
+# A directory changed this recently may change again within the same mtime,
+# so its listing isn't trusted until it's older than this.
+MTIME_RESOLUTION = 2
+
+# What a directory held when it was last listed.
+Listing = namedtuple('Listing', 'mtime files directories')
+
+
+def get_check_interval():
+    """
+    How long to use the index before checking whether any of the static
+    directories have changed, in seconds.
+    """
+    return getattr(settings, 'STAGESETTING_STATIC_INDEX_INTERVAL', 5)
+
+
+def _lists_like(finder, finder_class):
+    return (get_unbound_function(type(finder).list) is
+            get_unbound_function(finder_class.list))
+
+
+def indexable_storages(finder):
+    """
+    The local storages `finder` lists files from, in the order it would, or
+    `None` if its listing can't be indexed by directory mtimes.
+    """
+    if _lists_like(finder, FileSystemFinder):
+        storages = [finder.storages[root] for prefix, root in finder.locations]
+    elif _lists_like(finder, AppDirectoriesFinder):
+        storages = [storage for storage in finder.storages.values()
+                    if storage.exists('')]
+    else:
+        return None
+    if not all(hasattr(storage, 'location') for storage in storages):
+        return None
+    return storages
+
+
+class StaticFilesIndex(object):
+    """
+    Every file the staticfiles finders can find, in the order they'd find
+    them, kept between calls.
+
+    Refreshing only lists the directories whose mtime has changed (which
+    happens when files are added to, removed from or renamed in them), and
+    reuses the previous listing of the rest. Finders which don't list local
+    directories are asked for everything each time.
+    """
+    __slots__ = ('_lock', '_listings', '_files', '_generation', '_checked_at')
+
+    def __init__(self):
+        self._lock = RLock()
+        self._listings = {}
+        self._files = None
+        self._generation = 0
+        self._checked_at = None
+
+    def after_fork(self):
+        self._lock = RLock()
+
+    def invalidate(self):
+        with self._lock:
+            self._listings = {}
+            self._files = None
+            self._checked_at = None
+
+    def due(self):
+        return (self._files is None or self._checked_at is None or
+                time.time() - self._checked_at >= get_check_interval())
+
+    def _walk(self, storage, location, listings, started):
+        path = storage.path(location)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        listing = self._listings.get(path)
+        if listing is None or listing.mtime is None or listing.mtime != mtime:
+            directories, files = storage.listdir(location)
+            stable = mtime < started - MTIME_RESOLUTION
+            listing = Listing(mtime=mtime if stable else None,
+                              files=tuple(files),
+                              directories=tuple(directories))
+        listings[path] = listing
+        for filename in listing.files:
+            yield os.path.join(location, filename) if location else filename
+        for directory in listing.directories:
+            if location:
+                directory = os.path.join(location, directory)
+            for filename in self._walk(storage, directory, listings, started):
+                yield filename
+
+    def _find(self, listings, started):
+        for finder in get_finders():
+            storages = indexable_storages(finder)
+            if storages is None:
+                for filename, storage in finder.list(ignore_patterns=None):
+                    yield filename
+                continue
+            for storage in storages:
+                for filename in self._walk(storage, '', listings, started):
+                    yield filename
+
+    def refresh(self, force=False):
+        """
+        Bring the index up to date if it's due to be checked, returning its
+        generation, which changes whenever the files found do.
+        """
+        if not force and not self.due():
+            return self._generation
+        with self._lock:
+            if not force and not self.due():
+                return self._generation
+            started = time.time()
+            listings = {}
+            files = tuple(self._find(listings, started))
+            self._listings = listings
+            self._checked_at = started
+            if files != self._files:
+                self._files = files
+                self._generation += 1
+            return self._generation
+
+    def files(self):
+        with self._lock:
+            self.refresh()
+            return self._files
+
+
+static_index = StaticFilesIndex()
+
+
+def invalidate_static_index():
+    """
+    Forget this process's index, so the next lookup lists every directory
+    again. Changed directories are noticed anyway, within
+    `STAGESETTING_STATIC_INDEX_INTERVAL`, so this is only needed by deploys
+    which replace files without changing their directories' mtimes.
+    """
+    static_index.invalidate()
+
+
+def reset_static_index(**kwargs):
+    if kwargs.get('setting') in (None, 'STATICFILES_DIRS',
+                                 'STATICFILES_FINDERS', 'INSTALLED_APPS',
+                                 'STAGESETTING_STATIC_INDEX_INTERVAL'):
+        static_index.invalidate()
+setting_changed.connect(reset_static_index,
+                        dispatch_uid='stagesetting_reset_static_index')
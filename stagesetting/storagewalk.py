@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+import os
+import time
+from django.conf import settings
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+except ImportError:  # Python 2 without the `futures` backport.
+    ThreadPoolExecutor = None
+    FutureTimeoutError = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class WalkTimeout(Exception):
+    pass
+
+
+DEFAULTS = {
+    'WORKERS': 1,
+    'MAX_DEPTH': None,
+    'MAX_FILES': None,
+    'TIMEOUT': None,
+}
+
+
+def get_walk_options():
+    """
+    `STAGESETTING_STORAGE_WALK`, which looks like::
+
+        STAGESETTING_STORAGE_WALK = {
+            'WORKERS': 8,      # directories listed at once
+            'MAX_DEPTH': 4,    # how many directories deep to go
+            'MAX_FILES': 5000, # stop after finding this many files
+            'TIMEOUT': 10,     # stop after this many seconds
+        }
+
+    with any of them missing taking the value in `DEFAULTS`, which lists
+    everything, one directory at a time.
+    """
+    options = DEFAULTS.copy()
+    options.update(getattr(settings, 'STAGESETTING_STORAGE_WALK', None) or {})
+    return options
+
+
+class StorageWalker(object):
+    """
+    Finds every file in a storage, the same way (and in the same order) as
+    recursively calling `storage.listdir` would, but listing up to `workers`
+    directories at once. As soon as a directory has been listed, its
+    subdirectories are queued, while its files are yielded as soon as every
+    directory before it has been.
+
+    Stops early, having logged a warning, after `max_files` files or
+    `timeout` seconds, and doesn't list directories more than `max_depth`
+    deep (where the files in `directory` are at depth 0). Whether the last
+    walk stopped early is kept in `truncated`.
+    """
+    __slots__ = ('storage', 'workers', 'max_depth', 'max_files', 'timeout',
+                 'truncated')
+
+    def __init__(self, storage, workers=1, max_depth=None, max_files=None,
+                 timeout=None):
+        self.storage = storage
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_files = max_files
+        self.timeout = timeout
+        self.truncated = False
+
+    @classmethod
+    def from_settings(cls, storage):
+        options = get_walk_options()
+        return cls(storage=storage, workers=options['WORKERS'],
+                   max_depth=options['MAX_DEPTH'],
+                   max_files=options['MAX_FILES'],
+                   timeout=options['TIMEOUT'])
+
+    def descend(self, depth):
+        return self.max_depth is None or depth < self.max_depth
+
+    def children(self, directory, subdirectories):
+        for subdirectory in subdirectories:
+            if directory:
+                subdirectory = os.path.join(directory, subdirectory)
+            yield subdirectory
+
+    def listings(self, directory, depth=0):
+        """
+        `(directory, files)` for `directory` and everything below it, one
+        `listdir` at a time.
+        """
+        subdirectories, files = self.storage.listdir(directory)
+        yield directory, files
+        if self.descend(depth):
+            for child in self.children(directory, subdirectories):
+                for listing in self.listings(child, depth + 1):
+                    yield listing
+
+    def concurrent_listings(self, directory, deadline):
+        """
+        `listings`, but from a pool of threads.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {}
+
+        def listdir(path, depth):
+            subdirectories, files = self.storage.listdir(path)
+            children = []
+            if self.descend(depth):
+                for child in self.children(path, subdirectories):
+                    try:
+                        futures[child] = executor.submit(listdir, child,
+                                                         depth + 1)
+                    except RuntimeError:
+                        # the walk has finished early, and the pool with it.
+                        break
+                    children.append(child)
+            return children, files
+
+        futures[directory] = executor.submit(listdir, directory, 0)
+        pending = [directory]
+        try:
+            while pending:
+                path = pending.pop()
+                remaining = None
+                if deadline is not None:
+                    remaining = max(0, deadline - time.time())
+                try:
+                    children, files = futures.pop(path).result(
+                        timeout=remaining)
+                except FutureTimeoutError:
+                    raise WalkTimeout
+                yield path, files
+                pending.extend(reversed(children))
+        finally:
+            executor.shutdown(wait=False)
+            for future in tuple(futures.values()):
+                future.cancel()
+
+    def walk(self, directory=''):
+        self.truncated = False
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        if self.workers > 1 and ThreadPoolExecutor is not None:
+            listings = self.concurrent_listings(directory, deadline=deadline)
+        else:
+            listings = self.listings(directory)
+        found = 0
+        try:
+            for path, files in listings:
+                for filename in files:
+                    if self.max_files is not None and found >= self.max_files:
+                        logger.warning("Stopped listing %r after %d files",
+                                       self.storage, found)
+                        self.truncated = True
+                        return
+                    found += 1
+                    yield os.path.join(path, filename) if path else filename
+                if deadline is not None and time.time() > deadline:
+                    raise WalkTimeout
+        except WalkTimeout:
+            logger.warning("Stopped listing %r after %s seconds",
+                           self.storage, self.timeout)
+            self.truncated = True
+        finally:
+            listings.close()
+
+    __iter__ = walk
+
+
+def walk_storage(storage, directory=''):
+    """
+    Every file in `storage` (below `directory`), found as configured by
+    `STAGESETTING_STORAGE_WALK`.
+    """
+    return StorageWalker.from_settings(storage=storage).walk(directory)
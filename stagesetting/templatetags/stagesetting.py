@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 from django import VERSION as django_version
 from django.template import Library
 from stagesetting.models import RuntimeSettingWrapper, RuntimeSetting
+from stagesetting.models import get_settings_version
 
 register = Library()
 
@@ -23,3 +24,8 @@ def stagesetting(context):
     else:
         wrapper = RuntimeSettingWrapper(model=RuntimeSetting)
     return wrapper
+
+
+@register.simple_tag
+def stagesetting_version():
+    return get_settings_version()
@@ -6,6 +6,7 @@ from .views import create_view
 from .views import update_view
 from .views import delete_view
 from .views import list_view
+from .views import choices_view
 
 stagesetting_create = url(regex=r'^add/$',
                      view=create_view,
@@ -22,6 +23,11 @@ stagesetting_delete = url(regex=r'^(?P<pk>\d+)/delete/$',
                      name='stagesetting_delete',
                      kwargs={})
 
+stagesetting_choices = url(regex=r'^(?P<pk>\d+)/choices/(?P<field>[^/]+)/$',
+                     view=choices_view,
+                     name='stagesetting_choices',
+                     kwargs={})
+
 stagesetting_list = url(regex=r'^$',
                     view=list_view,
                     name='stagesetting_list',
@@ -31,5 +37,6 @@ urlpatterns = [
     stagesetting_create,
     stagesetting_update,
     stagesetting_delete,
+    stagesetting_choices,
     stagesetting_list,
 ]
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from __future__ import unicode_literals
-import os
+import copy
 import warnings
 
 from django.utils.text import slugify
@@ -11,15 +11,14 @@ from django.forms import TypedChoiceField
 import re
 from collections import namedtuple, OrderedDict
 from datetime import datetime, timedelta, date, time
-from decimal import Decimal, InvalidOperation
-from itertools import chain, groupby
-import json
+from decimal import Decimal
+from itertools import groupby
 import logging
 from threading import RLock
 from uuid import UUID
 from django.conf import settings
-from django.contrib.staticfiles.finders import get_finders
 from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
 try:
     from django.urls import NoReverseMatch, reverse
 except ImportError:
@@ -27,16 +26,28 @@ except ImportError:
 from django.utils.html import strip_tags
 from django.utils.translation import ugettext as _
 from django.core.exceptions import ValidationError
-from django.core.validators import (validate_ipv46_address, URLValidator,
-                                    validate_email)
 from django.db.models import QuerySet, Model
 from django import forms
+from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_datetime
+from django.utils.dateparse import parse_time
 from django.utils.encoding import force_text
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.module_loading import import_string
 from django.utils.six import string_types, integer_types
+from django.utils.six import get_unbound_function
 from .validators import validate_setting_name, validate_default
 from .validators import validate_formish
+from . import inference
+from .inference import classify
+from .patterns import PatternFilter
+from .patterns import patterns_in_use
+from .patterns import use_pattern
+from .plans import clean_plan_for
+from .staticindex import static_index
+from .storagewalk import StorageWalker
+from .plans import form_fingerprint
+from .records import accessor_class
 from django.core.serializers.json import DjangoJSONEncoder
 try:
     forms.fields.CallableChoiceIterator
@@ -78,6 +89,89 @@ class JSONEncoder(DjangoJSONEncoder):
             return super(JSONEncoder, self).default(o)  # pragma: no cover
 
 
+class TaggedJSONEncoder(JSONEncoder):
+    """
+    Like `JSONEncoder`, but values which JSON can't represent are written out
+    as `{"__t": "<type>", "v": <value>}` so that they can be turned back into
+    the same Python type when read, without needing the form.
+
+    Model instances and querysets are still written as primary keys, because
+    they need looking up again regardless.
+    """
+    def default(self, o):
+        if callable(o):
+            o = o()
+        if isinstance(o, datetime):
+            return {'__t': 'datetime', 'v': o.isoformat()}
+        elif isinstance(o, date):
+            return {'__t': 'date', 'v': o.isoformat()}
+        elif isinstance(o, time):
+            return {'__t': 'time', 'v': o.isoformat()}
+        elif isinstance(o, timedelta):
+            return {'__t': 'timedelta',
+                    'v': [o.days, o.seconds, o.microseconds]}
+        elif isinstance(o, Decimal):
+            return {'__t': 'decimal', 'v': force_text(o)}
+        elif isinstance(o, UUID):
+            return {'__t': 'uuid', 'v': force_text(o)}
+        return super(TaggedJSONEncoder, self).default(o)
+
+
+class TaggedValues(dict):
+    """
+    The deserialized data from a tagged payload. Being tagged means it was
+    written from a form's `cleaned_data`, so has already been validated.
+    """
+    __slots__ = ()
+
+
+TAG_DECODERS = {
+    'tagged': TaggedValues,
+    'datetime': parse_datetime,
+    'date': parse_date,
+    'time': parse_time,
+    'timedelta': lambda v: timedelta(days=v[0], seconds=v[1],
+                                     microseconds=v[2]),
+    'decimal': Decimal,
+    'uuid': UUID,
+}
+
+
+def decode_tagged(obj):
+    """
+    `object_hook` for `json.loads` which reverses `TaggedJSONEncoder`.
+    Anything which doesn't look like a tag is left alone.
+    """
+    if len(obj) != 2 or '__t' not in obj or 'v' not in obj:
+        return obj
+    try:
+        decoder = TAG_DECODERS[obj['__t']]
+    except (KeyError, TypeError):
+        return obj
+    return decoder(obj['v'])
+
+
+def tagged_serialization_enabled():
+    return getattr(settings, 'STAGESETTING_TAGGED_SERIALIZATION', False)
+
+
+DEFAULT_SERIALIZER = 'stagesetting.serializers.JSONSerializer'
+
+
+@lru_cache(maxsize=None)
+def _load_serializer(path):
+    return import_string(path)()
+
+
+def get_serializer():
+    """
+    An instance of the class named by `STAGESETTING_SERIALIZER`, which
+    defaults to the standard library JSON one.
+    """
+    path = getattr(settings, 'STAGESETTING_SERIALIZER', DEFAULT_SERIALIZER)
+    return _load_serializer(path)
+
+
 class RegistryError(KeyError):
     pass
 
@@ -93,17 +187,27 @@ Unregistered = namedtuple('Unregistered', 'setting_name form_class default')
 
 @python_2_unicode_compatible
 class FormRegistry(object):
-    __slots__ = ('_registry', '_defaults', '_name', '_lock')
+    __slots__ = ('_registry', '_defaults', '_name', '_lock', '_generation',
+                 '_default_values', '_accessors')
 
     def __init__(self, name=None):
         self._registry = {}
         self._defaults = {}
         self._name = name or 'default'
         self._lock = RLock()
+        self._generation = 0
+        self._default_values = {}
+        self._accessors = {}
 
     def __str__(self):
         return ', '.join(self._registry.keys())
 
+    def after_fork(self):
+        """
+        Another thread may have held the lock when the process forked.
+        """
+        self._lock = RLock()
+
     def __repr__(self):
         return '<%(mod)s.%(cls)s "%(name)s" [%(settings)s]>' % {
             'mod': self.__module__, 'cls': self.__class__.__name__,
@@ -113,6 +217,14 @@ class FormRegistry(object):
     def __len__(self):
         return len(self._registry)
 
+    @property
+    def generation(self):
+        """
+        Incremented every time a setting is registered or unregistered, so
+        that anything derived from the registry can tell it is out of date.
+        """
+        return self._generation
+
     def ready(self, sender, instance, model):
         project_setting = getattr(settings, 'STAGESETTINGS', {})
 
@@ -165,6 +277,9 @@ class FormRegistry(object):
                 raise AlreadyRegistered('The setting "%s" is already registered' % key)
             self._registry[key] = form_class
             self._defaults[key] = default or {}
+            self._generation += 1
+            self._default_values.clear()
+            self._accessors.clear()
             return True
     add = register
     __setitem__ = register
@@ -176,6 +291,9 @@ class FormRegistry(object):
                 raise NotRegistered('The setting "%s" is not registered' % key)
             existing_form = self._registry.pop(key)
             existing_default = self._defaults.pop(key)
+            self._generation += 1
+            self._default_values.clear()
+            self._accessors.clear()
             return Unregistered(setting_name=key, form_class=existing_form,
                                 default=existing_default)
     remove = unregister
@@ -200,22 +318,120 @@ class FormRegistry(object):
         return self._defaults[key]
 
     def get_default(self, key):
-        return self.serialize(self._get_default(key=key))
+        # defaults haven't been through the form, so must never be tagged
+        # as if they had.
+        return self.serialize(self._get_default(key=key), tagged=False)
+
+    def get_default_value(self, key):
+        """
+        The default data for `key` after going through the form, as it
+        would come out of `cleaned_data`.
 
-    def serialize(self, data):
-        return json.dumps(data, cls=JSONEncoder)
+        This is only worked out once per registry generation; callers get a
+        deep copy so they may change it freely. Forms with model-backed
+        fields are worked out every time, because the objects they refer to
+        can change (or go away) without the registry knowing.
+        """
+        form_class = self[key]
+        if any(isinstance(field, forms.ModelChoiceField)
+               for field in form_class.base_fields.values()):
+            return self._clean_default(key=key, form_class=form_class)
+        generation = self._generation
+        try:
+            cached_generation, value = self._default_values[key]
+        except KeyError:
+            cached_generation, value = None, None
+        if cached_generation != generation:
+            value = self._clean_default(key=key, form_class=form_class)
+            self._default_values[key] = (generation, value)
+        return copy.deepcopy(value)
+
+    def _clean_default(self, key, form_class):
+        data = self.deserialize(self.get_default(key=key))
+        # this may trigger further database hits for FK fields
+        # (modelchoice, modelmultiplechoice)
+        plan = clean_plan_for(form_class)
+        value = None if plan is None else plan(data)
+        if value is None:
+            form = form_class(data=data)
+            form.is_valid()
+            value = form.cleaned_data
+        return value
+
+    def get_accessor(self, key):
+        """
+        A `SettingAccessor` subclass for `key`, generated from its form's
+        fields once per registry generation.
+        """
+        try:
+            return self._accessors[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._accessors:
+                self._accessors[key] = accessor_class(key=key,
+                                                      form_class=self[key])
+            return self._accessors[key]
+
+    def serialize(self, data, tagged=None):
+        """
+        Only data which has come out of a form's `cleaned_data` should be
+        `tagged`, which by default depends on the
+        `STAGESETTING_TAGGED_SERIALIZATION` setting.
+        """
+        if tagged is None:
+            tagged = tagged_serialization_enabled()
+        return get_serializer().dumps(data, tagged=tagged)
 
     def deserialize(self, data):
-        return json.loads(data)
+        return get_serializer().loads(data)
+
+    def trusted_value(self, form_class, data, clean_field=None,
+                      fingerprint=None):
+        """
+        Given deserialized `data`, return the equivalent of the form's
+        `cleaned_data` without using the form, if that's possible.
+
+        That's only the case for data whose fields are exactly those of the
+        form, and which was stored with the same `fingerprint` the form has
+        now. Tagged values are then used as they are, while others only need
+        converting back by their field's `to_python` (or `clean`, for fields
+        which customise it). Model-backed fields are still put through their
+        field's `clean` (or `clean_field(field, value)` if given), because
+        the objects have to be fetched anyway.
+
+        Returns `None` if the form has to be used.
+        """
+        if not fingerprint or fingerprint != form_fingerprint(form_class):
+            return None
+        tagged = isinstance(data, TaggedValues)
+        fields = form_class.base_fields
+        if len(fields) != len(data) or not all(k in data for k in fields):
+            return None
+        value = {}
+        try:
+            for name, field in fields.items():
+                if isinstance(field, forms.ModelChoiceField):
+                    if clean_field is None:
+                        value[name] = field.clean(data[name])
+                    else:
+                        value[name] = clean_field(field, data[name])
+                elif tagged:
+                    value[name] = data[name]
+                elif (get_unbound_function(type(field).clean) is not
+                      get_unbound_function(forms.Field.clean)):
+                    value[name] = field.clean(data[name])
+                else:
+                    value[name] = field.to_python(data[name])
+        except ValidationError:
+            return None
+        return value
 
 registry = FormRegistry(name='default')
 
 
 def _get_files_in_static_storage(only_matching=None):
-    finders = get_finders()
-    finders_results = (finder.list(ignore_patterns=None) for finder in finders)
-    found_files = chain.from_iterable(finders_results)
-    filenames_only = (filename for filename, storage in found_files)
+    filenames_only = static_index.files()
     if only_matching is not None:
         # Apply a regex search over the given filenames to choose only
         # matching elements.
@@ -261,10 +477,33 @@ def make_storage_choices(found_files):
     return fixed
 
 
+def choices_by_pattern(filenames, patterns):
+    """
+    The choices for each of `patterns`, from one pass over `filenames`.
+    """
+    found = PatternFilter(patterns=patterns)(filenames)
+    return dict((pattern, tuple(make_storage_choices(found_files=matched)))
+                for pattern, matched in found.items())
+
+
 @lru_cache(LRU_MAX)
+def _list_files_in_static(patterns, generation):
+    return choices_by_pattern(
+        filenames=_get_files_in_static_storage(only_matching=None),
+        patterns=patterns)
+
+
 def list_files_in_static(only_matching=None):
-    return tuple(make_storage_choices(
-        found_files=_get_files_in_static_storage(only_matching=only_matching)))
+    """
+    Choices for every static file (or those matching the `only_matching`
+    regex), from the `static_index`; so only recalculated when the static
+    files have changed. The choices for every other pattern in use are
+    found at the same time.
+    """
+    generation = static_index.refresh()
+    patterns = patterns_in_use(only_matching)
+    return _list_files_in_static(patterns, generation)[only_matching]
+list_files_in_static.cache_clear = _list_files_in_static.cache_clear
 
 
 class StaticFilesChoiceField(TypedChoiceField):
@@ -286,31 +525,48 @@ class PartialStaticFilesChoiceField(StaticFilesChoiceField):
     def __init__(self, only_matching, *args, **kwargs):
         if 'choices' not in kwargs:  # pragma: no cover
             kwargs['choices'] = partial(list_files_in_static,
-                                        only_matching=only_matching)
+                                        only_matching=use_pattern(only_matching))
         super(PartialStaticFilesChoiceField, self).__init__(*args, **kwargs)
 
 
-def _get_files_in_default_storage(directory=''):
-    dirs, files = default_storage.listdir(directory)
-    for fn in files:
-        location = os.path.join(directory, fn)
-        yield location
-    for subdir in dirs:
-        if directory:
-            subdir = os.path.join(directory, subdir)
-        for fn in _get_files_in_default_storage(directory=subdir):
-            yield fn
+class IncompleteListing(Exception):
+    """
+    Raised (so that `lru_cache` doesn't keep them) with the choices found by
+    a walk of the default storage which stopped early.
+    """
+    def __init__(self, choices):
+        super(IncompleteListing, self).__init__(choices)
+        self.choices = choices
+
+
+def _get_files_in_default_storage(walker, directory=''):
+    return walker.walk(directory)
 
 
 @lru_cache(LRU_MAX)
+def _list_files_in_default_storage(patterns):
+    walker = StorageWalker.from_settings(storage=default_storage)
+    choices = choices_by_pattern(
+        filenames=_get_files_in_default_storage(walker), patterns=patterns)
+    if walker.truncated:
+        raise IncompleteListing(choices)
+    return choices
+
+
 def list_files_in_default_storage(only_matching=None):
-    filenames_only = _get_files_in_default_storage()
-    if only_matching is not None:
-        # Apply a regex search over the given filenames to choose only
-        # matching elements.
-        filenames_only = (fname for fname in filenames_only
-                          if re.search(only_matching, fname))
-    return tuple(make_storage_choices(found_files=filenames_only))
+    """
+    Choices for every file in the default storage (or those matching the
+    `only_matching` regex), along with those for every other pattern in use.
+    Only complete listings are cached; one cut short by
+    `STAGESETTING_STORAGE_WALK` is listed again next time.
+    """
+    patterns = patterns_in_use(only_matching)
+    try:
+        choices = _list_files_in_default_storage(patterns)
+    except IncompleteListing as e:
+        choices = e.choices
+    return choices[only_matching]
+list_files_in_default_storage.cache_clear = _list_files_in_default_storage.cache_clear
 
 
 class DefaultStorageFilesChoiceField(TypedChoiceField):
@@ -332,7 +588,7 @@ class PartialDefaultStorageFilesChoiceField(DefaultStorageFilesChoiceField):
     def __init__(self, only_matching, *args, **kwargs):
         if 'choices' not in kwargs:  # pragma: no cover
             kwargs['choices'] = partial(list_files_in_default_storage,
-                                        only_matching=only_matching)
+                                        only_matching=use_pattern(only_matching))
         super(PartialDefaultStorageFilesChoiceField, self).__init__(*args, **kwargs)
 
 
@@ -457,36 +713,22 @@ def _select_field(v):
     elif isinstance(v, re._pattern_type):
         return forms.RegexField(regex=v)
     elif isinstance(v, string_types):
-        try:
-            validate_ipv46_address(v)
+        kind = classify(v)
+        if kind == inference.IP:
             return forms.GenericIPAddressField(initial=v)
-        except ValidationError:
-            pass
-        try:
-            URLValidator()(v)
+        elif kind == inference.URL:
             return forms.URLField(initial=v)
-        except ValidationError:
-            pass
-        try:
-            validate_email(v)
+        elif kind == inference.EMAIL:
             return forms.EmailField(initial=v)
-        except ValidationError:
-            pass
         # cast integerlike strings as such.
-        if v.isdigit():
+        elif kind == inference.INTEGER:
             v = int(v)
             return forms.IntegerField(initial=v)
-        try:
+        elif kind == inference.DECIMAL:
             v = Decimal(v)
             return forms.DecimalField(initial=v)
-        except InvalidOperation:
-            pass
         # allow 'ffffffff-ffff-ffff-ffff-ffffffffffff' to do the right thing.
-        try:
-            UUID(v)
-        except ValueError:
-            pass
-        else:
+        elif kind == inference.UUID_STRING:
             try:
                 return forms.UUIDField(initial=v)
             except AttributeError:
@@ -494,23 +736,11 @@ def _select_field(v):
                              "have UUIDField, so a charfield is being used "
                              "instead", exc_info=1)
                 return forms.RegexField(regex=uuid_re, initial=str(v), max_length=36)
-
-        def can_be_parsed_as_temporal(value, field):
-            for format in field.input_formats:
-                try:
-                    field.strptime(value, format)
-                    return True
-                except (ValueError, TypeError):
-                    continue
-            return False
-
-        if can_be_parsed_as_temporal(v, forms.TimeField()):
+        elif kind == inference.TIME:
             return forms.TimeField(initial=v)
-
-        if can_be_parsed_as_temporal(v, forms.DateField()):
+        elif kind == inference.DATE:
             return forms.DateField(initial=v)
-
-        if can_be_parsed_as_temporal(v, forms.DateTimeField()):
+        elif kind == inference.DATETIME:
             return forms.DateTimeField(initial=v)
 
         if settings.STATIC_URL and v == settings.STATIC_URL:
@@ -568,7 +798,89 @@ def _select_field(v):
         return forms.CharField(initial=v)
 
 
+# Values whose fingerprint is just their type and repr().
+FINGERPRINT_SCALARS = (type(None), bool, float, Decimal, datetime, date, time,
+                       timedelta, UUID) + integer_types + string_types
+
+
+def _fingerprint_value(value):
+    """
+    A hashable equivalent of `value`, which differs whenever `_select_field`
+    would make a different field for it. Raises `TypeError` for anything
+    which can't be compared that way, like callables, model instances and
+    querysets.
+    """
+    kind = '%s.%s' % (type(value).__module__, type(value).__name__)
+    if isinstance(value, FINGERPRINT_SCALARS):
+        return kind, repr(value)
+    elif isinstance(value, (list, tuple)):
+        return kind, tuple(_fingerprint_value(item) for item in value)
+    elif isinstance(value, OrderedDict):
+        return kind, tuple((_fingerprint_value(k), _fingerprint_value(v))
+                           for k, v in value.items())
+    elif isinstance(value, dict):
+        return kind, frozenset((_fingerprint_value(k), _fingerprint_value(v))
+                               for k, v in value.items())
+    elif isinstance(value, (set, frozenset)):
+        return kind, frozenset(_fingerprint_value(item) for item in value)
+    elif isinstance(value, re._pattern_type):
+        return kind, value.pattern, value.flags
+    # don't repr() the value; for a queryset that would run it.
+    raise TypeError("Can't fingerprint %s values" % kind)
+
+
+def config_fingerprint(dictionary):
+    """
+    A hashable fingerprint of a dictionary given to `generate_form`, or
+    `None` if its form can't be reused.
+    """
+    try:
+        return _fingerprint_value(dictionary)
+    except TypeError:
+        return None
+
+
+_generated_forms = {}
+_locks = {'generated_forms': RLock()}
+
+
+def after_fork():
+    _locks['generated_forms'] = RLock()
+
+
+def clear_generated_forms(**kwargs):
+    """
+    Fields for strings depend on settings like `STATIC_URL` and the input
+    formats, so any setting changing forgets every generated form.
+    """
+    with _locks['generated_forms']:
+        _generated_forms.clear()
+setting_changed.connect(clear_generated_forms,
+                        dispatch_uid='stagesetting_clear_generated_forms')
+
+
 def generate_form(dictionary):
+    """
+    A form class with a field for each key of `dictionary`, chosen by the
+    type (and for strings, the content) of its value.
+
+    The same class is returned for equal dictionaries, unless they contain
+    callables, model instances or querysets.
+    """
+    fingerprint = config_fingerprint(dictionary)
+    if fingerprint is None:
+        return _generate_form(dictionary)
+    try:
+        return _generated_forms[fingerprint]
+    except KeyError:
+        pass
+    with _locks['generated_forms']:
+        if fingerprint not in _generated_forms:
+            _generated_forms[fingerprint] = _generate_form(dictionary)
+        return _generated_forms[fingerprint]
+
+
+def _generate_form(dictionary):
     form_fields = OrderedDict()
     if isinstance(dictionary, OrderedDict):
         fields_to_make = dictionary.items()
@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import logging
 from django.contrib import messages
+from django.contrib.admin import site as default_admin_site
 from django.contrib.admin.models import LogEntry, CHANGE
 from django.contrib.admin.options import IS_POPUP_VAR
 from django.contrib.admin.options import get_content_type_for_model
@@ -12,13 +13,15 @@ try:
 except ImportError:
     from django.core.urlresolvers import reverse, reverse_lazy
 from django.db import transaction
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import FormView
 from django.views.generic import ListView
 from django.views.generic import DeleteView
+from django.views.generic import View
+from .autocomplete import is_searchable, search, use_autocomplete
 from .models import RuntimeSetting
 from .forms import CreateSettingForm, AdminFieldForm
 from .utils import registry
@@ -86,6 +89,7 @@ class CreateSetting(FormView):
 class UpdateSetting(FormView):
     template_name = 'stagesetting/update.html'
     success_url = reverse_lazy('stagesetting_list')
+    choices_url_name = 'stagesetting_choices'
     admin = None
     model = None
 
@@ -128,6 +132,15 @@ class UpdateSetting(FormView):
             return replaced_form
         return form
 
+    def get_form(self, form_class=None):
+        form = super(UpdateSetting, self).get_form(form_class=form_class)
+        if self.admin:
+            form = use_autocomplete(form, url_for=self.get_choices_url)
+        return form
+
+    def get_choices_url(self, field_name):
+        return reverse(self.choices_url_name, args=(self.object.pk, field_name))
+
     def get_initial(self):
         return self.object.value
 
@@ -161,6 +174,7 @@ class UpdateSetting(FormView):
             old_value = self.object.value
             changed_data = self.keys_changed(old_value, form.cleaned_data)
             self.object.raw_value = registry.serialize(data=form.cleaned_data)
+            self.object.fingerprint = self.object.fingerprint_for(form)
             self.object.full_clean()
             self.object.save()
             LogEntry.objects.log_action(
@@ -172,7 +186,8 @@ class UpdateSetting(FormView):
                 change_message="Changed %(changed)s" % {
                     'old': force_text(old_value),
                     'new': force_text(self.object.raw_value),
-                    'changed': force_text(registry.serialize(changed_data))
+                    'changed': force_text(registry.serialize(changed_data,
+                                                             tagged=False))
                 }
             )
         msg_dict = {'name': force_text(self.object._meta.verbose_name),
@@ -225,7 +240,55 @@ class ListSettings(ListView):
         return super(ListSettings, self).get(request, *args, **kwargs)
 
 
+class SettingChoices(View):
+    """
+    One page of the choices for a field of a setting's form, which match the
+    `term` GET parameter, as JSON for `AutocompleteSelect`.
+    """
+    admin = None
+    model = None
+
+    def assert_has_permission(self, request, obj=None):
+        return request_passes_test(request=request, obj=obj)
+
+    def get_object(self):
+        return get_object_or_404(self.model.objects.all(), pk=self.kwargs.get('pk'))
+
+    def get_field(self):
+        try:
+            form = registry[self.object.key]
+        except KeyError:
+            raise Http404('form_class missing for setting "%(key)s"' % {
+                'key': self.object.key})
+        field = form().fields.get(self.kwargs.get('field'))
+        if field is None or not is_searchable(field):
+            raise Http404("No searchable field %(field)s" % self.kwargs)
+        return field
+
+    def get_page(self):
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            raise Http404("Invalid page")
+        if page < 1:
+            raise Http404("Invalid page")
+        return page
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        self.assert_has_permission(request=request, obj=self.object)
+        admin_site = default_admin_site
+        if self.admin:
+            admin_site = self.admin.admin_site
+        data = search(field=self.get_field(),
+                      term=request.GET.get('term', '').strip(),
+                      page=self.get_page(), request=request,
+                      admin_site=admin_site)
+        return JsonResponse(data)
+
+
 create_view = CreateSetting.as_view(model=RuntimeSetting)
 delete_view = DeleteSetting.as_view(queryset=RuntimeSetting.objects.all())
 update_view = UpdateSetting.as_view(model=RuntimeSetting)
 list_view = ListSettings.as_view(queryset=RuntimeSetting.objects.all())
+choices_view = SettingChoices.as_view(model=RuntimeSetting)
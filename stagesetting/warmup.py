@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import unicode_literals
+import logging
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_at_startup():
+    return getattr(settings, 'STAGESETTING_WARM', False)
+
+
+def warm(model=None):
+    """
+    Do everything the first request would otherwise have to: validate every
+    default value, then resolve the settings into whichever of the shared
+    snapshot, cache or shared memory file are enabled.
+
+    Returns the resolved settings.
+    """
+    from .models import RuntimeSettingWrapper
+    from .utils import registry
+    if model is None:
+        model = apps.get_app_config('stagesetting').get_stagesetting_model()
+    for key in registry.keys():
+        if key in registry._defaults:
+            registry.get_default_value(key=key)
+    wrapper = RuntimeSettingWrapper(model=model, lazy=False)
+    wrapper.prefetch()
+    logger.debug("Warmed %d settings for %r", len(wrapper.settings), model)
+    return wrapper.settings
+
+
+def close_connections():
+    """
+    So that processes forked afterwards don't share the sockets.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
+def when_ready(server):
+    """
+    A gunicorn server hook; in your gunicorn config file::
+
+        preload_app = True
+        from stagesetting.warmup import when_ready, post_fork
+
+    the master process resolves the settings once, and every worker it forks
+    starts with a copy of them.
+    """
+    from .fork import freeze, gc_freeze_enabled
+    try:
+        warm()
+    finally:
+        close_connections()
+    if gc_freeze_enabled():
+        freeze()
+
+
+def post_fork(server, worker):
+    """
+    A gunicorn server hook, only needed before Python 3.7 (after which
+    `os.register_at_fork` does this anyway)
+    """
+    from .fork import after_fork
+    after_fork()
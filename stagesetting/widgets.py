@@ -1,9 +1,108 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from __future__ import unicode_literals
+import json
+from django import forms
+from django.conf import settings
 from django.contrib.admin.widgets import AdminIntegerFieldWidget
+from django.utils.encoding import force_text
+from django.utils.translation import get_language
+
+try:
+    from django.contrib.admin.widgets import SELECT2_TRANSLATIONS
+except ImportError:  # Django < 2.0 doesn't ship select2.
+    SELECT2_TRANSLATIONS = None
+
+
+AUTOCOMPLETE_AVAILABLE = SELECT2_TRANSLATIONS is not None
+
+
+def flatten_choices(choices):
+    for value, label in choices:
+        if isinstance(label, (list, tuple)):
+            for option in flatten_choices(label):
+                yield option
+        else:
+            yield value, label
 
 
 class AdminIntegerFieldReplacement(AdminIntegerFieldWidget):
     input_type = 'number'
 
+
+class AutocompleteSelect(forms.Select):
+    """
+    A select2 box, like the admin's `autocomplete_fields`, which only renders
+    the selected option(s) and searches the rest via `url`.
+    """
+    def __init__(self, url, attrs=None, choices=()):
+        super(AutocompleteSelect, self).__init__(attrs=attrs, choices=choices)
+        self.url = url
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super(AutocompleteSelect, self).build_attrs(
+            base_attrs, extra_attrs=extra_attrs)
+        classes = attrs.get('class', '')
+        attrs.update({
+            'data-ajax--cache': 'true',
+            'data-ajax--type': 'GET',
+            'data-ajax--url': force_text(self.url),
+            'data-theme': 'admin-autocomplete',
+            'data-allow-clear': json.dumps(not self.is_required),
+            'data-placeholder': '',
+            'class': (classes + ' ' if classes else '') + 'admin-autocomplete',
+        })
+        return attrs
+
+    def selected_choices(self, selected):
+        """
+        `(value, label)` for each selected value, without evaluating every
+        choice; a queryset is filtered to them, while other choices are only
+        looked through until every selected value's label has been found.
+        """
+        queryset = getattr(self.choices, 'queryset', None)
+        if queryset is None:
+            labels = {}
+            if selected:
+                for value, label in flatten_choices(self.choices):
+                    value = force_text(value)
+                    if value in selected and value not in labels:
+                        labels[value] = force_text(label)
+                        if len(labels) == len(selected):
+                            break
+            return [(value, labels.get(value, value))
+                    for value in sorted(selected)]
+        field = self.choices.field
+        lookup = '%s__in' % (field.to_field_name or 'pk')
+        return [(field.prepare_value(obj), field.label_from_instance(obj))
+                for obj in queryset.filter(**{lookup: selected})]
+
+    def optgroups(self, name, value, attrs=None):
+        options = []
+        if not self.is_required and not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '', False, 0))
+        selected = set(force_text(v) for v in value if v not in (None, ''))
+        for option_value, label in self.selected_choices(selected):
+            options.append(self.create_option(name, option_value, label, True,
+                                              len(options)))
+        return [(None, options, 0)]
+
+    @property
+    def media(self):
+        extra = '' if settings.DEBUG else '.min'
+        i18n_name = SELECT2_TRANSLATIONS.get(get_language())
+        i18n_file = ()
+        if i18n_name:
+            i18n_file = ('admin/js/vendor/select2/i18n/%s.js' % i18n_name,)
+        return forms.Media(
+            js=('admin/js/vendor/jquery/jquery%s.js' % extra,
+                'admin/js/vendor/select2/select2.full%s.js' % extra) +
+               i18n_file +
+               ('admin/js/jquery.init.js', 'admin/js/autocomplete.js'),
+            css={'screen': ('admin/css/vendor/select2/select2%s.css' % extra,
+                            'admin/css/autocomplete.css')},
+        )
+
+
+class AutocompleteSelectMultiple(AutocompleteSelect, forms.SelectMultiple):
+    pass
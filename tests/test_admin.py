@@ -14,6 +14,7 @@ from django.forms import Form, IntegerField
 import pytest
 from stagesetting.forms import CreateSettingForm, AdminFieldForm
 from stagesetting.models import RuntimeSetting
+from stagesetting.plans import form_fingerprint
 from stagesetting.utils import registry
 
 
@@ -121,6 +122,16 @@ def test_change_view_POST(admin_client, change_url, changelist_url):
     assert response.url.endswith(changelist_url) is True
 
 
+@pytest.mark.django_db
+def test_change_view_POST_fingerprints(admin_client, change_url):
+    with form('GLORP') as form_class:
+        admin_client.post(change_url, {'count': '24'})
+        obj = RuntimeSetting.objects.get(key='GLORP')
+        assert obj.fingerprint == form_fingerprint(form_class)
+        assert obj.fingerprint != ''
+        assert obj.value == {'count': 24}
+
+
 @pytest.mark.django_db
 def test_delete_view_GET(admin_client, delete_url):
     response = admin_client.get(delete_url)
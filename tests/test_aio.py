@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import asyncio
+import contextlib
+import json
+from django.forms import Form, IntegerField
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import override_settings
+from unittest.mock import patch
+from stagesetting.aio import (AsyncRuntimeSettingWrapper,
+                              AsyncApplyRuntimeSettings, run_sync)
+from stagesetting.models import RuntimeSetting
+from stagesetting.snapshot import snapshots
+from stagesetting.utils import registry
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+def test_run_sync():
+    assert run(run_sync(sorted, (3, 1, 2), reverse=True)) == [3, 2, 1]
+
+
+class AsyncWrapperTestCase(TransactionTestCase):
+    def setUp(self):
+        snapshots.clear()
+
+    def tearDown(self):
+        snapshots.clear()
+
+    def test_aget(self):
+        RuntimeSetting.objects.create(key='AIO',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('AIO'):
+            wrapper = AsyncRuntimeSettingWrapper()
+            assert run(wrapper.aget('AIO')) == {'count': 4}
+            assert run(wrapper.aget('NOPE', 1)) == 1
+            # and the sync API still works, without querying again.
+            with self.assertNumQueries(0):
+                assert wrapper.AIO == {'count': 4}
+
+    def test_aget_lazy(self):
+        with form('AIO'):
+            wrapper = AsyncRuntimeSettingWrapper(lazy=True)
+            assert run(wrapper.aget('AIO')) == {'count': 3}
+            assert wrapper.settings is None
+
+    def test_async_for(self):
+        with form('AIO'):
+            wrapper = AsyncRuntimeSettingWrapper()
+
+            async def collect():
+                found = {}
+                async for key, value in wrapper:
+                    found[key] = value
+                return found
+            found = run(collect())
+            assert found['AIO'] == {'count': 3}
+            assert found == dict(wrapper.items())
+
+    def test_aprefetch(self):
+        with form('AIO'):
+            wrapper = AsyncRuntimeSettingWrapper()
+            assert run(wrapper.aprefetch('AIO')) is True
+            assert wrapper.settings is not None
+
+    @override_settings(STAGESETTING_SHARED_SNAPSHOT=True,
+                       STAGESETTING_INVALIDATION={
+                           'BACKEND': 'stagesetting.invalidation.LocalTransport',
+                           'INTERVAL': 60})
+    def test_current_snapshot_served_in_loop(self):
+        with form('AIO'):
+            assert run(AsyncRuntimeSettingWrapper().aget('AIO')) == {'count': 3}
+            wrapper = AsyncRuntimeSettingWrapper()
+            with patch('stagesetting.aio.run_sync') as run_sync_mock:
+                with self.assertNumQueries(0):
+                    assert run(wrapper.aget('AIO')) == {'count': 3}
+            assert run_sync_mock.called is False
+
+
+def test_middleware_sync():
+    def view(request):
+        return HttpResponse(request.stagesetting.__class__.__name__)
+    middleware = AsyncApplyRuntimeSettings(view)
+    assert middleware.is_async is False
+    response = middleware(RequestFactory().get('/'))
+    assert response.content == b'AsyncRuntimeSettingWrapper'
+
+
+def test_middleware_async():
+    async def view(request):
+        return HttpResponse(request.stagesetting.__class__.__name__)
+    middleware = AsyncApplyRuntimeSettings(view)
+    assert middleware.is_async is True
+    assert asyncio.iscoroutinefunction(middleware)
+    response = run(middleware(RequestFactory().get('/')))
+    assert response.content == b'AsyncRuntimeSettingWrapper'
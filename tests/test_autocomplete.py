@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+import json
+from django.contrib import admin
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.forms import Form, ModelChoiceField, ModelMultipleChoiceField
+from django.test.utils import override_settings
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+import pytest
+from stagesetting.autocomplete import search, use_autocomplete
+from stagesetting.models import RuntimeSetting
+from stagesetting.utils import registry, DefaultStorageFilesChoiceField
+from stagesetting.widgets import AUTOCOMPLETE_AVAILABLE, AutocompleteSelect
+from stagesetting.widgets import AutocompleteSelectMultiple
+
+
+pytestmark = pytest.mark.skipif(not AUTOCOMPLETE_AVAILABLE,
+                                reason="select2 needs Django 2.0+")
+
+FILE_CHOICES = (
+    ('css', tuple(('css/%02d.css' % i, '%02d.css' % i) for i in range(30))),
+    ('js', tuple(('js/%02d.js' % i, '%02d.js' % i) for i in range(15))),
+)
+
+
+def files_field(**kwargs):
+    with pytest.warns(FutureWarning):
+        return DefaultStorageFilesChoiceField(choices=FILE_CHOICES, **kwargs)
+
+
+def url_for(name):
+    return '/choices/%s/' % name
+
+
+class OnlyFirstGroup(object):
+    """
+    The first group of `FILE_CHOICES`, and then a failure if anything tries
+    to look at the rest.
+    """
+    def __iter__(self):
+        yield FILE_CHOICES[0]
+        raise AssertionError("every choice was rendered")
+
+
+@contextlib.contextmanager
+def form(key):
+    class ThisForm(Form):
+        group = ModelChoiceField(queryset=Group.objects.all(), required=False)
+        upload = files_field(required=False)
+    registry.register(key, ThisForm, {'amdefault': None})
+    try:
+        yield ThisForm
+    finally:
+        registry.unregister(key)
+
+
+@pytest.fixture
+def groups(db):
+    return [Group.objects.create(name='group %02d' % i) for i in range(50)]
+
+
+@pytest.fixture
+def setting(db):
+    with form('AUTOCOMPLETED'):
+        yield RuntimeSetting.objects.create(
+            key='AUTOCOMPLETED', raw_value=json.dumps({'upload': 'js/03.js'}))
+
+
+def test_renders_only_the_selected_choice():
+    widget = AutocompleteSelect(url='/choices/upload/')
+    widget.choices = OnlyFirstGroup()
+    widget.is_required = True
+    html = widget.render('upload', 'css/05.css')
+    assert html.count('<option') == 1
+    assert '<option value="css/05.css" selected>05.css</option>' in html
+    assert 'data-ajax--url="/choices/upload/"' in html
+    assert 'admin-autocomplete' in html
+
+
+def test_renders_only_the_selected_objects(groups):
+    field = ModelMultipleChoiceField(queryset=Group.objects.all())
+    widget = AutocompleteSelectMultiple(url='/choices/groups/')
+    widget.choices = field.widget.choices
+    html = widget.render('groups', [groups[3].pk, groups[7].pk])
+    assert html.count('<option') == 2
+    assert 'group 03' in html and 'group 07' in html
+    assert 'multiple' in html
+
+
+def test_media():
+    media = AutocompleteSelect(url='/').media
+    assert 'admin/js/autocomplete.js' in str(media)
+
+
+def test_use_autocomplete():
+    class ThisForm(Form):
+        group = ModelChoiceField(queryset=Group.objects.all())
+        upload = files_field()
+    found = use_autocomplete(ThisForm(), url_for=url_for)
+    assert isinstance(found.fields['group'].widget, AutocompleteSelect)
+    assert found.fields['upload'].widget.url == '/choices/upload/'
+    with override_settings(STAGESETTING_AUTOCOMPLETE=False):
+        found = use_autocomplete(ThisForm(), url_for=url_for)
+    assert not isinstance(found.fields['upload'].widget, AutocompleteSelect)
+
+
+def test_bound_form_shows_search_labels():
+    class ThisForm(Form):
+        upload = files_field()
+    form = use_autocomplete(ThisForm(data={'upload': 'js/07.js'}),
+                            url_for=url_for)
+    assert form.is_valid()
+    found = search(form.fields['upload'], term='07.js', page=1, request=None,
+                   admin_site=admin.site)
+    label = found['results'][0]['text']
+    assert label == '07.js'
+    html = str(form['upload'])
+    assert html.count('<option') == 1
+    assert '<option value="js/07.js" selected>%s</option>' % label in html
+
+
+def test_unknown_selected_value_is_its_own_label():
+    widget = AutocompleteSelect(url='/choices/upload/')
+    widget.choices = FILE_CHOICES
+    widget.is_required = True
+    html = widget.render('upload', 'gone.css')
+    assert '<option value="gone.css" selected>gone.css</option>' in html
+
+
+def test_search_choices_pages():
+    field = files_field()
+    first = search(field, term='', page=1, request=None, admin_site=admin.site)
+    assert len(first['results']) == 20
+    assert first['results'][0] == {'id': 'css/00.css', 'text': '00.css'}
+    assert first['pagination'] == {'more': True}
+    last = search(field, term='', page=3, request=None, admin_site=admin.site)
+    assert len(last['results']) == 5
+    assert last['pagination'] == {'more': False}
+
+
+def test_search_choices_term():
+    field = files_field()
+    found = search(field, term='1.JS', page=1, request=None,
+                   admin_site=admin.site)
+    assert [x['id'] for x in found['results']] == ['js/01.js', 'js/11.js']
+
+
+def test_search_queryset_uses_admin_search_fields(rf, groups):
+    field = ModelChoiceField(queryset=Group.objects.all())
+    found = search(field, term='group 1', page=1, request=rf.get('/'),
+                   admin_site=admin.site)
+    # GroupAdmin searches for each word separately.
+    expected = [x for x in groups if '1' in x.name]
+    assert len(expected) == 14
+    assert found['results'] == [{'id': str(x.pk), 'text': x.name}
+                                for x in expected]
+    assert found['pagination'] == {'more': False}
+
+
+@pytest.mark.django_db
+def test_search_queryset_without_admin(rf):
+    field = ModelChoiceField(queryset=ContentType.objects.all())
+    found = search(field, term='runtimesetting', page=1, request=rf.get('/'),
+                   admin_site=admin.site)
+    expected = ContentType.objects.get_for_model(RuntimeSetting)
+    assert [x['id'] for x in found['results']] == [str(expected.pk)]
+    found = search(field, term=str(expected.pk), page=1, request=rf.get('/'),
+                   admin_site=admin.site)
+    assert str(expected.pk) in [x['id'] for x in found['results']]
+
+
+def test_search_queryset_without_text_fields(rf, groups):
+    through = Group.permissions.through
+    groups[0].permissions.add(*Permission.objects.all()[:2])
+    field = ModelChoiceField(queryset=through.objects.all())
+    found = search(field, term='group', page=1, request=rf.get('/'),
+                   admin_site=admin.site)
+    assert found['results'] == []
+    row = through.objects.all()[0]
+    found = search(field, term=str(row.pk), page=1, request=rf.get('/'),
+                   admin_site=admin.site)
+    assert [x['id'] for x in found['results']] == [str(row.pk)]
+
+
+def test_admin_choices_view(admin_client, setting, groups):
+    url = reverse('admin:stagesetting_runtimesetting_choices',
+                  kwargs={'object_id': setting.pk, 'field': 'group'})
+    response = admin_client.get(url, {'term': 'group', 'page': '3'})
+    assert response.status_code == 200
+    data = json.loads(response.content.decode('utf-8'))
+    assert [x['text'] for x in data['results']] == [
+        'group %02d' % i for i in range(40, 50)]
+    assert data['pagination'] == {'more': False}
+
+
+def test_choices_view(admin_client, setting):
+    url = reverse('stagesetting_choices',
+                  kwargs={'pk': setting.pk, 'field': 'upload'})
+    response = admin_client.get(url, {'term': 'js/0', 'page': '2'})
+    assert response.status_code == 200
+    data = json.loads(response.content.decode('utf-8'))
+    assert data == {'results': [], 'pagination': {'more': False}}
+
+
+def test_choices_view_not_searchable(admin_client, setting):
+    url = reverse('stagesetting_choices',
+                  kwargs={'pk': setting.pk, 'field': 'nope'})
+    assert admin_client.get(url).status_code == 404
+    assert admin_client.get(url.replace('nope', 'upload'),
+                            {'page': 'x'}).status_code == 404
+
+
+def test_choices_view_needs_staff(client, setting):
+    url = reverse('stagesetting_choices',
+                  kwargs={'pk': setting.pk, 'field': 'upload'})
+    assert client.get(url).status_code == 403
+
+
+def test_change_view_renders_autocomplete(admin_client, setting, groups):
+    url = reverse('admin:stagesetting_runtimesetting_change',
+                  args=(setting.pk,))
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    form = response.context_data['form']
+    assert isinstance(form.fields['upload'].widget, AutocompleteSelect)
+    html = str(form['upload']) + str(form['group'])
+    assert html.count('<option') == 3
+    assert 'js/03.js' in html
+    assert 'admin/js/autocomplete.js' in str(response.context_data['media'])
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+import json
+from threading import Thread
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.forms import Form, IntegerField, ModelChoiceField
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from stagesetting.cache import (cache_key_for, get_resolved,
+                                invalidate_resolved, resolve_once)
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.utils import registry
+
+
+@contextlib.contextmanager
+def form(key, default=None):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, default or {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+@override_settings(STAGESETTING_CACHE='default')
+class CachedResolutionTestCase(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_second_wrapper_reads_cache(self):
+        RuntimeSetting.objects.create(key='CACHED',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            with self.assertNumQueries(2):
+                assert RuntimeSettingWrapper().CACHED == {'count': 4}
+            # only the settings version is looked up.
+            with self.assertNumQueries(1):
+                assert RuntimeSettingWrapper().CACHED == {'count': 4}
+
+    def test_model_instances_survive(self):
+        user = get_user_model().objects.create(username='cached')
+
+        class UserForm(Form):
+            user = ModelChoiceField(queryset=get_user_model().objects.all())
+        registry.register('CACHED_USER', UserForm, {'user': user})
+        try:
+            RuntimeSettingWrapper().CACHED_USER
+            with self.assertNumQueries(1):
+                assert RuntimeSettingWrapper().CACHED_USER == {'user': user}
+        finally:
+            registry.unregister('CACHED_USER')
+
+    def test_save_invalidates(self):
+        obj = RuntimeSetting.objects.create(key='CACHED',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            RuntimeSettingWrapper().CACHED
+            assert get_resolved(model=RuntimeSetting) is not None
+            obj.value = {'count': 7}
+            obj.save()
+            assert get_resolved(model=RuntimeSetting) is None
+            assert RuntimeSettingWrapper().CACHED == {'count': 7}
+
+    def test_delete_invalidates(self):
+        RuntimeSetting.objects.create(key='CACHED',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            RuntimeSettingWrapper().CACHED
+            RuntimeSetting.objects.filter(key='CACHED').delete()
+            assert get_resolved(model=RuntimeSetting) is None
+            assert RuntimeSettingWrapper().CACHED == {'count': 3}
+
+    def test_key_depends_on_registry(self):
+        before = cache_key_for(model=RuntimeSetting)
+        with form('CACHED'):
+            assert cache_key_for(model=RuntimeSetting) != before
+        assert cache_key_for(model=RuntimeSetting) == before
+
+    def test_key_depends_on_version(self):
+        obj = RuntimeSetting.objects.create(key='CACHED',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            before = cache_key_for(model=RuntimeSetting)
+            obj.save()
+            assert cache_key_for(model=RuntimeSetting) != before
+
+    def test_key_depends_on_mode(self):
+        before = cache_key_for(model=RuntimeSetting)
+        with override_settings(STAGESETTING_FROZEN=True):
+            frozen = cache_key_for(model=RuntimeSetting)
+        with override_settings(STAGESETTING_ACCESSORS=True):
+            accessors = cache_key_for(model=RuntimeSetting)
+        assert len(set([before, frozen, accessors])) == 3
+
+    def test_stale_data_never_read(self):
+        obj = RuntimeSetting.objects.create(key='CACHED',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            key = cache_key_for(model=RuntimeSetting)
+            RuntimeSettingWrapper().CACHED
+            obj.value = {'count': 7}
+            obj.save()
+            # as if written by a process which read the rows before the save.
+            caches['default'].set(key, {'CACHED': {'count': 4}})
+            assert RuntimeSettingWrapper().CACHED == {'count': 7}
+
+    def test_bulk_update_deletes_after_commit(self):
+        RuntimeSetting.objects.create(key='CACHED',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            # TestCase never commits, so nothing deferred ever runs.
+            with patch('stagesetting.cache.delete_resolved') as delete:
+                RuntimeSetting.objects.filter(key='CACHED').update(
+                    raw_value=json.dumps({'count': 8}))
+                RuntimeSetting.objects.bulk_create([
+                    RuntimeSetting(key='CACHED2', raw_value='{}')])
+            assert delete.called is False
+
+    def test_ignores_other_senders(self):
+        assert invalidate_resolved(sender=get_user_model(), instance=None) is False
+
+
+@override_settings(STAGESETTING_CACHE='default')
+class CommittedInvalidationTestCase(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_save_deletes_the_old_version(self):
+        obj = RuntimeSetting.objects.create(key='CACHED',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('CACHED'):
+            old = cache_key_for(model=RuntimeSetting)
+            RuntimeSettingWrapper().CACHED
+            assert caches['default'].get(old) is not None
+            obj.value = {'count': 7}
+            obj.save()
+            assert caches['default'].get(old) is None
+            new = cache_key_for(model=RuntimeSetting)
+            assert new != old
+            assert RuntimeSettingWrapper().CACHED == {'count': 7}
+            # a later change only removes what it replaced.
+            RuntimeSetting.objects.filter(key='CACHED').update(
+                raw_value=json.dumps({'count': 8}))
+            assert caches['default'].get(new) is None
+
+    def test_bulk_create_deletes_the_old_version(self):
+        with form('CACHED'):
+            old = cache_key_for(model=RuntimeSetting)
+            RuntimeSettingWrapper().CACHED
+            RuntimeSetting.objects.bulk_create([
+                RuntimeSetting(key='CACHED', raw_value='{"count": 5}')])
+            assert caches['default'].get(old) is None
+            assert RuntimeSettingWrapper().CACHED == {'count': 5}
+
+
+class CacheDisabledTestCase(TestCase):
+    def test_nothing_stored(self):
+        with form('CACHED'):
+            RuntimeSettingWrapper().CACHED
+            assert get_resolved(model=RuntimeSetting) is None
+            key = cache_key_for(model=RuntimeSetting)
+            assert caches['default'].get(key) is None
+
+
+@override_settings(STAGESETTING_CACHE='default',
+                   STAGESETTING_CACHE_LOCK_WAIT=0.2)
+class SingleFlightTestCase(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.key = cache_key_for(model=RuntimeSetting)
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_builds_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {'A': 1}
+        assert resolve_once(model=RuntimeSetting, build=build) == {'A': 1}
+        assert resolve_once(model=RuntimeSetting, build=build) == {'A': 1}
+        assert len(calls) == 1
+        # left to expire, rather than deleted without knowing whose it is.
+        assert caches['default'].get('%s:lock' % self.key) is not None
+
+    def test_waits_for_lock_holder(self):
+        cache = caches['default']
+        cache.add('%s:lock' % self.key, 'another-process', 30)
+
+        def sleep(seconds):
+            # the other process finishes while we wait.
+            cache.set(self.key, {'A': 2})
+
+        def build():
+            raise AssertionError("Only the lock holder should build")
+        with patch('stagesetting.cache.time.sleep', side_effect=sleep):
+            assert resolve_once(model=RuntimeSetting, build=build) == {'A': 2}
+
+    def test_gives_up_waiting(self):
+        cache = caches['default']
+        cache.add('%s:lock' % self.key, 'another-process', 30)
+        assert resolve_once(model=RuntimeSetting, build=lambda: {'A': 3},
+                            poll_interval=0.05) == {'A': 3}
+        # someone else's lock is left alone.
+        assert cache.get('%s:lock' % self.key) == 'another-process'
+
+    def test_one_build_per_process_after_giving_up(self):
+        cache = caches['default']
+        cache.add('%s:lock' % self.key, 'another-process', 30)
+        calls = []
+        results = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'A': 4}
+
+        def resolve():
+            results.append(resolve_once(model=RuntimeSetting, build=build,
+                                        poll_interval=0.05))
+        threads = [Thread(target=resolve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert results == [{'A': 4}] * 4
+        assert len(calls) == 1
+
+    def test_disabled(self):
+        with override_settings(STAGESETTING_CACHE=None):
+            assert resolve_once(model=RuntimeSetting, build=dict) == {}
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import gc
+import os
+from threading import Event, Thread
+from django.db import connections
+from django.test.utils import override_settings
+import pytest
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from stagesetting import cache, inference, patterns, plans, records, utils
+from stagesetting.fork import after_fork, discard_connections, freeze
+from stagesetting.invalidation import (InvalidationBus, RedisTransport,
+                                       get_bus)
+from stagesetting.models import RuntimeSetting
+from stagesetting.refresh import Refresher, get_refresher
+from stagesetting.snapshot import snapshots, Snapshot
+from stagesetting.utils import registry
+from stagesetting.warmup import when_ready
+
+
+@override_settings(STAGESETTING_INVALIDATION={
+    'BACKEND': 'stagesetting.invalidation.LocalTransport'},
+    STAGESETTING_REFRESH={'TTL': 3600})
+def test_after_fork_replaces_locks():
+    bus = get_bus()
+    refresher = get_refresher()
+    refresher._thread = Thread(target=lambda: None)
+    modules = (cache, inference, patterns, plans, records, utils)
+    before = (registry._lock, snapshots._lock, bus._lock, refresher._lock)
+    before_modules = [dict(module._locks) for module in modules]
+    snapshots._snapshots[RuntimeSetting] = Snapshot(token=(0, 0), settings={},
+                                                    checked_at=0)
+    try:
+        with patch('stagesetting.fork.discard_connections') as discard:
+            assert after_fork() is True
+        assert discard.called is True
+        after = (registry._lock, snapshots._lock, bus._lock, refresher._lock)
+        for old, new in zip(before, after):
+            assert old is not new
+        for module, old in zip(modules, before_modules):
+            for name, lock in old.items():
+                assert module._locks[name] is not lock
+        assert refresher._thread is None
+        # but the snapshot is still there to be shared.
+        assert RuntimeSetting in snapshots
+    finally:
+        snapshots.clear()
+
+
+def test_discard_connections():
+    connection = connections['default']
+    inherited = object()
+    with patch.object(connection, 'connection', inherited):
+        with patch.object(type(connection), 'close') as close:
+            discard_connections()
+            assert connection.connection is None
+    assert close.called is False
+
+
+def test_redis_pubsub_dropped():
+    transport = RedisTransport(client=object())
+    transport.pubsub = object()
+    InvalidationBus(transport=transport).after_fork()
+    assert transport.pubsub is None
+
+
+def test_refresher_restarts_after_fork():
+    refresher = Refresher(ttl=3600, jitter=0, max_staleness=60)
+    refresher.watch('key', lambda: None)
+    try:
+        refresher.after_fork()
+        assert refresher.running is False
+        refresher.watch('key', lambda: None)
+        assert refresher.running is True
+    finally:
+        refresher.stop(timeout=5)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="Requires os.fork")
+def test_lock_held_during_fork():
+    """
+    Without after_fork, the child would deadlock acquiring the registry's
+    lock (or any module's), which another thread in the parent held when it
+    forked.
+    """
+    holding = Event()
+    release = Event()
+
+    def all_locks():
+        found = [registry._lock]
+        for module in (cache, inference, patterns, plans, records, utils):
+            found.extend(module._locks.values())
+        return found
+
+    def hold():
+        held = all_locks()
+        for lock in held:
+            lock.acquire()
+        holding.set()
+        release.wait(5)
+        for lock in reversed(held):
+            lock.release()
+    thread = Thread(target=hold)
+    thread.start()
+    holding.wait(5)
+    try:
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            try:
+                after_fork()
+                acquired = all(lock.acquire(False) for lock in all_locks())
+                os._exit(0 if acquired else 1)
+            except BaseException:
+                os._exit(2)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+    finally:
+        release.set()
+        thread.join(5)
+
+
+def test_freeze():
+    if not hasattr(gc, 'freeze'):
+        assert freeze() is False
+        return
+    try:
+        assert freeze() is True
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+@patch('stagesetting.warmup.warm')
+@patch('stagesetting.warmup.close_connections')
+def test_when_ready_freezes(close_connections, warm):
+    with patch('stagesetting.fork.freeze') as freeze_mock:
+        when_ready(server=None)
+        assert freeze_mock.called is False
+        with override_settings(STAGESETTING_GC_FREEZE=True):
+            when_ready(server=None)
+        assert freeze_mock.called is True
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+try:
+    from unittest.mock import patch
+except ImportError:  # Python 2, pragma: no cover
+    from mock import patch
+from django.test.utils import override_settings
+import pytest
+from stagesetting import inference
+from stagesetting.inference import (StringClassifier, classify,
+                                    classify_string, format_literals,
+                                    get_classifier)
+
+
+STRINGS = (
+    '', ' ', 'hello', 'hello world', 'some-slug', '<b>html</b>',
+    '127.0.0.1', '256.0.0.1', '1.2.3', '::1', 'fe80::1', '::ffff:1.2.3.4',
+    '1:2', 'a:b:c', '127.0.0.1\n',
+    'https://news.bbc.co.uk/', 'http://[::1]:8000/', 'ftp://x', 'http:/x',
+    'mailto:a@b.com', 'a@b.com', 'a@b', '@', 'a@b.com\n',
+    '1', '0123', '١٢٣', '1.5', '-1.5', '1e5', '1_000', 'NaN', '-Infinity',
+    'inf', 'sNaN', ' 1.5 ', '1.5.5', '.', '-',
+    '98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac',
+    '98967ef2a5a34c19aefa9bb8dc5fcbac',
+    '{98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac}',
+    'urn:uuid:98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac',
+    '98967ef2-a5a3-4c19-aefa-9bb8dc5fcbaz',
+    '04:23', '04:23:00', '04:23:00.123', '25:00', '4:23 pm',
+    '2015-08-01', '08/01/2015', '08/01/15', 'Aug 1 2015', 'aug 1, 2015',
+    '1 August 2015', '1 august, 2015', '2015-02-30', '2015-8-1',
+    '2015-08-01 16:08:51', '2015-08-01 16:08:51.123', '2015-08-01 16:08',
+    '08/01/2015 16:08', '08/01/15 16:08:51', '2015-08-01T16:08:51',
+    '/static/', '/static/.*\\.css$', '^/media/.+$', '%', '100%',
+)
+
+
+@pytest.mark.parametrize('value', STRINGS)
+def test_same_as_reference(value):
+    assert StringClassifier()(value) == classify_string(value)
+    assert classify(value) == classify_string(value)
+
+
+def test_same_as_reference_with_other_formats():
+    with override_settings(USE_L10N=False,
+                           DATE_INPUT_FORMATS=['%d.%m.%Y', '%Y%m%d'],
+                           TIME_INPUT_FORMATS=['%H.%M', '%Hh%M'],
+                           DATETIME_INPUT_FORMATS=['%d.%m.%Y %H.%M']):
+        for value in STRINGS + ('01.08.2015', '20150801', '16.08', '16h08',
+                                '01.08.2015 16.08'):
+            assert classify(value) == classify_string(value), value
+        assert classify('16h08') == inference.TIME
+        assert classify('01.08.2015 16.08') == inference.DATETIME
+
+
+def test_format_literals():
+    assert format_literals('%Y-%m-%d') == frozenset('-')
+    assert format_literals('%d %B, %Y') == frozenset(',')
+    assert format_literals('%H:%M:%S.%f') == frozenset(':.')
+    assert format_literals('%Hh%M') == frozenset()
+    assert format_literals('100%%') == frozenset('%')
+
+
+def test_classify_is_memoized():
+    value = 'memoized-2015-08-01'
+    assert classify(value) is None
+    with patch.object(StringClassifier, '__call__') as classifier:
+        assert classify(value) is None
+    assert classifier.called is False
+
+
+def test_classifiers_reset_when_settings_change():
+    classifier = get_classifier()
+    assert get_classifier() is classifier
+    with override_settings(DATE_INPUT_FORMATS=['%d.%m.%Y']):
+        assert get_classifier() is not classifier
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from collections import defaultdict, deque
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+from django.core.cache import caches
+from django.forms import Form, IntegerField
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+import pytest
+from stagesetting.invalidation import (LocalTransport, FileTransport,
+                                       CacheTransport, RedisTransport,
+                                       InvalidationBus, get_bus, subscribe,
+                                       unsubscribe)
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.snapshot import snapshots
+from stagesetting.utils import registry
+
+
+class FakeRedis(object):
+    """
+    Just enough of redis.StrictRedis's pub/sub for RedisTransport, with
+    every instance sharing the same server.
+    """
+    subscribers = defaultdict(list)
+
+    def publish(self, channel, data):
+        for queue in self.subscribers[channel]:
+            queue.append({'type': 'message', 'channel': channel,
+                          'data': data.encode('utf-8')})
+        return len(self.subscribers[channel])
+
+    def pubsub(self):
+        return FakePubSub()
+
+
+class FakePubSub(object):
+    def __init__(self):
+        self.queue = deque()
+
+    def subscribe(self, channel):
+        FakeRedis.subscribers[channel].append(self.queue)
+        self.queue.append({'type': 'subscribe', 'channel': channel, 'data': 1})
+
+    def get_message(self, ignore_subscribe_messages=False):
+        while self.queue:
+            message = self.queue.popleft()
+            if ignore_subscribe_messages and message['type'] == 'subscribe':
+                continue
+            return message
+        return None
+
+
+@pytest.fixture
+def tmpdir_path():
+    path = tempfile.mkdtemp()
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+def transport_pairs(tmpdir_path):
+    """
+    Two transports which would be in different processes.
+    """
+    path = os.path.join(tmpdir_path, 'tick')
+    local = LocalTransport()
+    yield local, local
+    yield FileTransport(path=path), FileTransport(path=path)
+    yield CacheTransport(), CacheTransport()
+    FakeRedis.subscribers.clear()
+    yield RedisTransport(client=FakeRedis()), RedisTransport(client=FakeRedis())
+
+
+def test_transports(tmpdir_path):
+    caches['default'].clear()
+    for publisher, receiver in transport_pairs(tmpdir_path):
+        first = receiver.poll()
+        publisher.publish('a')
+        second = receiver.poll()
+        assert second is not None
+        assert second != first
+        assert receiver.poll() == second
+        publisher.publish('b')
+        assert receiver.poll() not in (None, second)
+
+
+def test_bus_notifies_subscribers():
+    calls = []
+    callback = subscribe(lambda: calls.append(1))
+    try:
+        transport = LocalTransport()
+        bus = InvalidationBus(transport=transport, interval=0)
+        assert bus.poll() is False
+        transport.publish('a')
+        assert bus.poll() is True
+        assert bus.poll() is False
+        assert len(calls) == 1
+    finally:
+        unsubscribe(callback)
+
+
+def test_bus_interval_bounds_polling():
+    transport = LocalTransport()
+    bus = InvalidationBus(transport=transport, interval=60)
+    bus.poll()
+    transport.publish('a')
+    assert bus.poll() is False
+    assert bus.poll(force=True) is True
+
+
+@override_settings(STAGESETTING_INVALIDATION={
+    'BACKEND': 'stagesetting.invalidation.LocalTransport', 'INTERVAL': 0})
+def test_get_bus():
+    bus = get_bus()
+    assert isinstance(bus.transport, LocalTransport)
+    assert get_bus() is bus
+    with override_settings(STAGESETTING_INVALIDATION=None):
+        assert get_bus() is None
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+@override_settings(STAGESETTING_SHARED_SNAPSHOT=True,
+                   STAGESETTING_INVALIDATION={
+                       'BACKEND': 'stagesetting.invalidation.CacheTransport',
+                       'INTERVAL': 0})
+class SnapshotInvalidationTestCase(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        snapshots.clear()
+
+    def tearDown(self):
+        snapshots.clear()
+
+    def test_no_version_query(self):
+        with form('BUS'):
+            RuntimeSettingWrapper().BUS
+            with self.assertNumQueries(0):
+                assert RuntimeSettingWrapper().BUS == {'count': 3}
+
+    def test_other_process_publishing_clears_snapshot(self):
+        with form('BUS'):
+            RuntimeSettingWrapper().BUS
+            RuntimeSetting.objects.create(key='BUS',
+                                          raw_value=json.dumps({'count': 5}))
+            # nothing has been published, because the transaction is open.
+            assert RuntimeSettingWrapper().BUS == {'count': 3}
+            CacheTransport().publish('elsewhere')
+            assert RuntimeSettingWrapper().BUS == {'count': 5}
+
+
+@override_settings(STAGESETTING_SHARED_SNAPSHOT=True,
+                   STAGESETTING_INVALIDATION={
+                       'BACKEND': 'stagesetting.invalidation.LocalTransport',
+                       'INTERVAL': 0})
+class SaveInvalidationTestCase(TransactionTestCase):
+    def setUp(self):
+        snapshots.clear()
+
+    def tearDown(self):
+        snapshots.clear()
+
+    def test_save_publishes(self):
+        with form('BUS'):
+            assert RuntimeSettingWrapper().BUS == {'count': 3}
+            obj = RuntimeSetting.objects.create(
+                key='BUS', raw_value=json.dumps({'count': 5}))
+            assert RuntimeSetting not in snapshots
+            assert RuntimeSettingWrapper().BUS == {'count': 5}
+            RuntimeSetting.objects.filter(pk=obj.pk).update(
+                raw_value=json.dumps({'count': 6}))
+            assert RuntimeSettingWrapper().BUS == {'count': 6}
+            RuntimeSetting.objects.filter(pk=obj.pk).delete()
+            assert RuntimeSettingWrapper().BUS == {'count': 3}
@@ -3,11 +3,21 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import contextlib
 import json
+try:
+    from unittest.mock import patch
+except ImportError:  # Python 2, pragma: no cover
+    from mock import patch
 from django.contrib.auth import get_user_model
 from django.forms import IntegerField, Form, ModelChoiceField, \
     ModelMultipleChoiceField
+from django.test import TestCase
+from django.test.utils import override_settings
 import pytest
 from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.models import SettingsVersion, get_settings_version
+from stagesetting.plans import form_fingerprint
+from stagesetting.refresh import get_refresher
+from stagesetting.snapshot import snapshots
 from stagesetting.utils import registry, generate_form
 
 
@@ -153,3 +163,191 @@ def test_can_serialize_modelchoices():
         assert '"many_users": ["1", "2"]' in value.raw_value
         assert value.value['single_user'] == user1
         assert set(value.value['many_users']) == set([user1, user2])
+
+
+class LazyRuntimeSettingWrapperTestCase(TestCase):
+    def setUp(self):
+        class ListPerPageForm(Form):
+            count = IntegerField(initial=25, min_value=1, max_value=99)
+        for key in ('LAZY_A', 'LAZY_B', 'LAZY_C'):
+            registry.register(key, ListPerPageForm, {'count': 3})
+        RuntimeSetting.objects.create(key='LAZY_A',
+                                      raw_value=json.dumps({'count': 5}))
+
+    def tearDown(self):
+        for key in ('LAZY_A', 'LAZY_B', 'LAZY_C'):
+            registry.unregister(key)
+
+    def test_loads_only_requested_key(self):
+        wrapped = RuntimeSettingWrapper(lazy=True)
+        with self.assertNumQueries(1):
+            assert wrapped.LAZY_A == {'count': 5}
+        with self.assertNumQueries(0):
+            assert wrapped['LAZY_A'] == {'count': 5}
+        assert wrapped.settings is None
+        assert set(wrapped._partial) == {'LAZY_A'}
+
+    def test_prefetch(self):
+        wrapped = RuntimeSettingWrapper(lazy=True)
+        with self.assertNumQueries(1):
+            assert wrapped.prefetch('LAZY_A', 'LAZY_B') is True
+        with self.assertNumQueries(0):
+            assert wrapped.LAZY_A == {'count': 5}
+            assert wrapped['LAZY_B'] == {'count': 3}
+            assert 'LAZY_B' in wrapped
+            assert wrapped.prefetch('LAZY_A') is False
+
+    def test_unknown_keys_dont_query(self):
+        wrapped = RuntimeSettingWrapper(lazy=True)
+        with self.assertNumQueries(0):
+            with pytest.raises(AttributeError):
+                wrapped.NOT_REGISTERED
+            with pytest.raises(KeyError):
+                wrapped['NOT_REGISTERED']
+            assert 'NOT_REGISTERED' not in wrapped
+
+    def test_missing_keys_query_once(self):
+        class NoDefaultForm(Form):
+            count = IntegerField()
+        registry.register('LAZY_D', NoDefaultForm)
+        try:
+            wrapped = RuntimeSettingWrapper(lazy=True)
+            with self.assertNumQueries(1):
+                assert 'LAZY_D' not in wrapped
+            with self.assertNumQueries(0):
+                with pytest.raises(AttributeError):
+                    wrapped.LAZY_D
+                assert wrapped.prefetch('LAZY_D') is False
+        finally:
+            registry.unregister('LAZY_D')
+
+    @override_settings(STAGESETTING_REFRESH={'TTL': 3600, 'JITTER': 0,
+                                             'MAX_STALENESS': 7200})
+    def test_uses_current_snapshot(self):
+        snapshots.clear()
+        try:
+            assert RuntimeSettingWrapper().LAZY_A == {'count': 5}
+            wrapped = RuntimeSettingWrapper(lazy=True)
+            with self.assertNumQueries(0):
+                assert wrapped.LAZY_A == {'count': 5}
+            assert wrapped.settings is not None
+        finally:
+            get_refresher().stop()
+            snapshots.clear()
+
+    def test_everything_else_loads_all(self):
+        wrapped = RuntimeSettingWrapper(lazy=True)
+        wrapped.LAZY_A
+        assert len(wrapped) >= 3
+        assert wrapped.settings is not None
+        assert wrapped.LAZY_C == {'count': 3}
+
+    def test_setting_enables_lazy(self):
+        with override_settings(STAGESETTING_LAZY=True):
+            assert RuntimeSettingWrapper().lazy is True
+        assert RuntimeSettingWrapper().lazy is False
+
+
+@pytest.mark.django_db
+def test_tagged_value_skips_form():
+    with userform('TAGGED_USERFORM') as form_class:
+        user = get_user_model().objects.create(username='tagged')
+        value = RuntimeSetting(key='TAGGED_USERFORM')
+        with override_settings(STAGESETTING_TAGGED_SERIALIZATION=True):
+            value.value = {'single_user': user.pk, 'many_users': [user.pk],
+                           'another': 3}
+        assert '"__t": "tagged"' in value.raw_value
+        with patch.object(form_class, 'full_clean') as full_clean:
+            result = value.value
+        assert full_clean.called is False
+        assert result['single_user'] == user
+        assert list(result['many_users']) == [user]
+        assert result['another'] == 3
+
+
+def test_tagged_value_under_changed_form_is_cleaned():
+    class SmallerForm(Form):
+        count = IntegerField(min_value=1, max_value=10)
+    with form('TAGGED_CHANGED'):
+        value = RuntimeSetting(key='TAGGED_CHANGED')
+        with override_settings(STAGESETTING_TAGGED_SERIALIZATION=True):
+            value.value = {'count': 50}
+        assert value.value == {'count': 50}
+    registry.register('TAGGED_CHANGED', SmallerForm)
+    try:
+        assert 'count' not in value.value
+    finally:
+        registry.unregister('TAGGED_CHANGED')
+
+
+@pytest.mark.django_db
+def test_fingerprinted_value_skips_cleaning():
+    with form('FINGERPRINTED') as form_class:
+        value = RuntimeSetting(key='FINGERPRINTED')
+        value.value = {'count': 4}
+        assert value.fingerprint == form_fingerprint(form_class)
+        value.save()
+        stored = RuntimeSetting.objects.get(key='FINGERPRINTED')
+        with patch('stagesetting.models.clean_plan_for') as clean_plan:
+            with patch.object(form_class, 'full_clean') as full_clean:
+                assert stored.value == {'count': 4}
+        assert clean_plan.called is False
+        assert full_clean.called is False
+
+
+@pytest.mark.django_db
+def test_unfingerprinted_value_is_cleaned():
+    with form('UNFINGERPRINTED'):
+        value = RuntimeSetting(key='UNFINGERPRINTED', raw_value='{"count": 4}')
+        assert value.fingerprint == ''
+        with patch('stagesetting.models.clean_plan_for',
+                   return_value=None) as clean_plan:
+            assert value.value == {'count': 4}
+        assert clean_plan.called is True
+
+
+def test_invalid_value_not_fingerprinted():
+    with form('INVALID_FINGERPRINT'):
+        value = RuntimeSetting(key='INVALID_FINGERPRINT')
+        value.value = {'count': 400}
+        assert value.fingerprint == ''
+
+
+class SettingsVersionTestCase(TestCase):
+    def test_bumped_by_save(self):
+        before = get_settings_version()
+        obj = RuntimeSetting.objects.create(key='VERSIONED', raw_value='{}')
+        assert get_settings_version() == before + 1
+        obj.save()
+        assert get_settings_version() == before + 2
+
+    def test_bumped_by_restoring_default(self):
+        with form('VERSIONED'):
+            obj = RuntimeSetting.objects.create(key='VERSIONED', raw_value='{}')
+            before = get_settings_version()
+            obj.delete()
+            assert get_settings_version() == before + 1
+
+    def test_bumped_by_bulk_operations(self):
+        before = get_settings_version()
+        RuntimeSetting.objects.bulk_create([
+            RuntimeSetting(key='VERSIONED', raw_value='{}'),
+            RuntimeSetting(key='VERSIONED_TOO', raw_value='{}'),
+        ])
+        assert get_settings_version() == before + 1
+        RuntimeSetting.objects.filter(key='VERSIONED').update(raw_value='[]')
+        assert get_settings_version() == before + 2
+        RuntimeSetting.objects.filter(key='VERSIONED').delete()
+        assert get_settings_version() == before + 3
+
+    def test_missing_row_is_recreated(self):
+        SettingsVersion.objects.all().delete()
+        assert get_settings_version() == 0
+        RuntimeSetting.objects.create(key='VERSIONED', raw_value='{}')
+        assert get_settings_version() == 1
+
+    def test_single_query(self):
+        wrapped = RuntimeSettingWrapper()
+        expected = get_settings_version()
+        with self.assertNumQueries(1):
+            assert wrapped.version == expected
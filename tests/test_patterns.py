@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import re
+try:
+    from unittest.mock import patch
+except ImportError:  # Python 2, pragma: no cover
+    from mock import patch
+import pytest
+from stagesetting.patterns import PatternFilter, patterns_in_use, use_pattern
+from stagesetting.utils import (list_files_in_static,
+                                list_files_in_default_storage,
+                                PartialStaticFilesChoiceField)
+
+
+FILENAMES = ('admin/css/base.css', 'admin/js/core.js', 'admin/js/jquery.js',
+             'site.CSS', 'img/logo.png', 'js/app.min.js', 'README')
+
+
+@pytest.mark.parametrize('patterns', [
+    (None, r'\.css$', r'\.js$'),
+    (r'\.css$', r'^admin/', r'\.min\.'),
+    (r'(\w)\1', r'\.js$'),
+    (r'(?i)\.css$', r'^js/'),
+    (r'nothing-matches-this',),
+])
+def test_same_as_searching_each(patterns):
+    found = PatternFilter(patterns=patterns)(FILENAMES)
+    for pattern in patterns:
+        if pattern is None:
+            expected = list(FILENAMES)
+        else:
+            expected = [name for name in FILENAMES if re.search(pattern, name)]
+        assert found[pattern] == expected
+
+
+def test_combined():
+    assert PatternFilter(patterns=(r'\.css$', r'\.js$')).combined is not None
+    assert PatternFilter(patterns=(r'(\w)\1',)).combined is None
+    assert PatternFilter(patterns=(r'(?i)\.css$',)).combined is None
+    assert PatternFilter(patterns=(None,)).combined is None
+
+
+def test_patterns_in_use():
+    use_pattern(r'\.in-use$')
+    patterns = patterns_in_use(None, r'\.also$')
+    assert r'\.in-use$' in patterns
+    assert r'\.also$' in patterns
+    assert patterns[0] is None
+    assert patterns_in_use() == patterns
+
+
+def test_partial_fields_share_one_pass():
+    PartialStaticFilesChoiceField(only_matching=r'\.css$')
+    PartialStaticFilesChoiceField(only_matching=r'\.js$')
+    list_files_in_static.cache_clear()
+    with patch('stagesetting.utils._get_files_in_static_storage',
+               return_value=FILENAMES) as found:
+        css = list_files_in_static(only_matching=r'\.css$')
+        js = list_files_in_static(only_matching=r'\.js$')
+    list_files_in_static.cache_clear()
+    found.assert_called_once_with(only_matching=None)
+    assert dict(css)['admin'] == (('admin/css/base.css', 'css/base.css'),)
+    assert dict(js)['js'] == (('js/app.min.js', 'app.min.js'),)
+
+
+def test_default_storage_shares_one_pass():
+    list_files_in_default_storage.cache_clear()
+    with patch('stagesetting.utils._get_files_in_default_storage',
+               return_value=FILENAMES) as found:
+        for pattern in (r'\.png$', r'^README$', r'\.js$', None):
+            list_files_in_default_storage(only_matching=pattern)
+        patterns = patterns_in_use()
+        found.reset_mock()
+        for pattern in patterns:
+            list_files_in_default_storage(only_matching=pattern)
+    list_files_in_default_storage.cache_clear()
+    assert found.called is False
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import json
+from uuid import UUID
+from django import forms
+from django.contrib.auth import get_user_model
+from django.test.utils import override_settings, patch_logger
+import pytest
+from stagesetting.plans import CleanPlan, clean_plan_for, make_clean_plan
+from stagesetting.plans import form_fingerprint
+from stagesetting.prefetch import ModelChoicePrefetcher
+from stagesetting.utils import generate_form, JSONEncoder
+from test_app.forms import DateForm, ListPerPageForm, ModelChoicesForm
+
+
+GENERATED = generate_form({
+    'int': 1,
+    'float': 1.5,
+    'decimal': Decimal('1.5'),
+    'bool': True,
+    'nullbool': None,
+    'date': date(2015, 8, 1),
+    'datetime': datetime(2015, 8, 1, 16, 8, 51),
+    'time': time(4, 23),
+    'timedelta': timedelta(minutes=14),
+    'uuid': UUID('98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac'),
+    'list': ['a', 'b', 'c'],
+    'choice': OrderedDict([('a', 'A'), ('b', 'B')]),
+    'email': 'a@b.com',
+    'url': 'https://news.bbc.co.uk/',
+    'ip': '127.0.0.1',
+    'text': 'hello',
+})
+
+
+class HandWrittenForm(forms.Form):
+    agree = forms.BooleanField(required=False)
+    maybe = forms.NullBooleanField()
+    flavours = forms.MultipleChoiceField(
+        choices=(('a', 'A'), ('b', 'B')),
+        widget=forms.CheckboxSelectMultiple, required=False)
+    size = forms.ChoiceField(choices=(('s', 'S'), ('m', 'M')),
+                             widget=forms.RadioSelect)
+    name = forms.CharField(max_length=10, strip=True)
+    count = forms.TypedChoiceField(choices=((1, '1'), (2, '2')), coerce=int)
+
+
+def form_cleaned_data(form_class, data):
+    form = form_class(data=data, initial=data, files=None)
+    form.full_clean()
+    return form.cleaned_data if form.is_valid() else None
+
+
+def as_stored(data):
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+@pytest.mark.parametrize('form_class,data', [
+    (GENERATED, as_stored({
+        'int': 3, 'float': 2.5, 'decimal': Decimal('3.25'), 'bool': False,
+        'nullbool': None, 'date': date(2016, 1, 2),
+        'datetime': datetime(2016, 1, 2, 3, 4, 5), 'time': time(1, 2),
+        'timedelta': timedelta(seconds=30),
+        'uuid': UUID('98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac'),
+        'list': ['a', 'c'], 'choice': 'b', 'email': 'c@d.com',
+        'url': 'http://example.com/', 'ip': '::1', 'text': ' there ',
+    })),
+    (GENERATED, as_stored({
+        'int': '3', 'float': '2.5', 'decimal': '3.25', 'bool': 'true',
+        'nullbool': 'false', 'date': '2016-01-02',
+        'datetime': '2016-01-02 03:04:05', 'time': '01:02',
+        'timedelta': '30', 'uuid': '98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac',
+        'list': ['b'], 'choice': 'a', 'email': 'c@d.com',
+        'url': 'example.com', 'ip': '127.0.0.1', 'text': 'x',
+    })),
+    (HandWrittenForm, {'agree': True, 'maybe': True, 'flavours': ['a'],
+                       'size': 's', 'name': ' x ', 'count': '2'}),
+    (HandWrittenForm, {'agree': 'false', 'maybe': '3', 'size': 'm',
+                       'name': 'y', 'count': 1}),
+    (HandWrittenForm, {'size': 'm', 'name': 'y', 'count': 1}),
+    (ListPerPageForm, {'count': 5}),
+])
+def test_same_as_form(form_class, data):
+    plan = clean_plan_for(form_class)
+    assert isinstance(plan, CleanPlan)
+    expected = form_cleaned_data(form_class, data)
+    assert expected is not None
+    result = plan(data)
+    assert result == expected
+    assert list(result) == list(expected)
+    for key, value in expected.items():
+        assert type(result[key]) == type(value)
+
+
+@pytest.mark.parametrize('form_class,data', [
+    (GENERATED, {'int': 'x'}),
+    (ListPerPageForm, {'count': 100}),
+    (ListPerPageForm, {}),
+    (HandWrittenForm, {'size': 'xl', 'name': 'y', 'count': 1}),
+])
+def test_invalid_data(form_class, data):
+    assert form_cleaned_data(form_class, data) is None
+    assert clean_plan_for(form_class)(data) is None
+
+
+class WithInit(forms.Form):
+    count = forms.IntegerField()
+
+    def __init__(self, *args, **kwargs):
+        super(WithInit, self).__init__(*args, **kwargs)
+        self.fields['count'].max_value = 5
+
+
+class WithCleanField(forms.Form):
+    count = forms.IntegerField()
+
+    def clean_count(self):
+        return self.cleaned_data['count'] * 2
+
+
+class WithPrefix(forms.Form):
+    prefix = 'p'
+    count = forms.IntegerField()
+
+
+class WithDisabled(forms.Form):
+    count = forms.IntegerField(disabled=True)
+
+
+class WithFile(forms.Form):
+    upload = forms.FileField()
+
+
+class WithMultiWidget(forms.Form):
+    when = forms.SplitDateTimeField()
+
+
+@pytest.mark.parametrize('form_class', [
+    WithInit, WithCleanField, WithPrefix, WithDisabled, WithFile,
+    WithMultiWidget, DateForm,
+])
+def test_falls_back(form_class):
+    assert make_clean_plan(form_class) is None
+
+
+def test_memoized():
+    assert clean_plan_for(ListPerPageForm) is clean_plan_for(ListPerPageForm)
+    with override_settings(STAGESETTING_CLEAN_PLANS=False):
+        assert clean_plan_for(ListPerPageForm) is None
+
+
+def test_fall_back_logged_once():
+    class Unplannable(forms.Form):
+        count = forms.IntegerField()
+
+        def clean(self):
+            return self.cleaned_data
+    with patch_logger('stagesetting.plans', 'debug') as logger_calls:
+        assert clean_plan_for(Unplannable) is None
+        assert clean_plan_for(Unplannable) is None
+    assert len(logger_calls) == 1
+    assert 'Unplannable' in logger_calls[0]
+
+
+@pytest.mark.django_db
+def test_model_choices_use_prefetcher(django_assert_num_queries):
+    users = [get_user_model().objects.create(username=str(i))
+             for i in range(3)]
+    data = as_stored({'single_user': users[0], 'many_users': users[1:],
+                      'another': 2})
+    expected = form_cleaned_data(ModelChoicesForm, data)
+    prefetcher = ModelChoicePrefetcher()
+    prefetcher.add(ModelChoicesForm.base_fields, data)
+    prefetcher.fetch()
+    with django_assert_num_queries(0):
+        result = clean_plan_for(ModelChoicesForm)(
+            data, clean_field=prefetcher.clean)
+    assert result['single_user'] == expected['single_user']
+    assert list(result['many_users']) == list(expected['many_users'])
+    assert result['another'] == 2
+
+
+def test_form_fingerprint():
+    class Limited(forms.Form):
+        count = forms.IntegerField(max_value=10)
+    first = form_fingerprint(Limited)
+    assert len(first) == 32
+    assert form_fingerprint(Limited) == first
+
+    class Limited(forms.Form):
+        count = forms.IntegerField(max_value=10)
+    assert form_fingerprint(Limited) == first
+
+    class Limited(forms.Form):
+        count = forms.IntegerField(max_value=20)
+    assert form_fingerprint(Limited) != first
+
+    class Limited(forms.Form):
+        count = forms.FloatField(max_value=10)
+    assert form_fingerprint(Limited) != first
+
+
+def test_form_fingerprint_choices():
+    class Choices(forms.Form):
+        choice = forms.ChoiceField(choices=(('a', 'A'),))
+    first = form_fingerprint(Choices)
+
+    class Choices(forms.Form):
+        choice = forms.ChoiceField(choices=(('a', 'A'), ('b', 'B')))
+    assert form_fingerprint(Choices) != first
+
+    class Choices(forms.Form):
+        choice = forms.ChoiceField(choices=lambda: (('a', 'A'),))
+    assert form_fingerprint(Choices) is None
+
+
+def test_form_fingerprint_coerce():
+    choices = (('1', 'one'),)
+
+    class Coerced(forms.Form):
+        number = forms.TypedChoiceField(choices=choices, coerce=str)
+    first = form_fingerprint(Coerced)
+
+    class Coerced(forms.Form):
+        number = forms.TypedChoiceField(choices=choices, coerce=str)
+    assert form_fingerprint(Coerced) == first
+
+    class Coerced(forms.Form):
+        number = forms.TypedChoiceField(choices=choices, coerce=int)
+    assert form_fingerprint(Coerced) != first
+
+    class Coerced(forms.Form):
+        number = forms.TypedChoiceField(choices=choices, coerce=str,
+                                        empty_value=None)
+    assert form_fingerprint(Coerced) != first
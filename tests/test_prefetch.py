@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import json
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.prefetch import ModelChoicePrefetcher
+from stagesetting.utils import registry
+from test_app.forms import ModelChoicesForm
+
+
+class PrefetchTestCase(TestCase):
+    keys = ('USERS_A', 'USERS_B', 'USERS_C', 'USERS_D')
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create(username='user%d' % i)
+                      for i in range(5)]
+        for index, key in enumerate(self.keys):
+            registry.register(key, ModelChoicesForm)
+            RuntimeSetting.objects.create(key=key, raw_value=json.dumps({
+                'single_user': self.users[index].pk,
+                'many_users': [self.users[index].pk, self.users[index + 1].pk],
+                'another': 2,
+            }))
+
+    def tearDown(self):
+        for key in self.keys:
+            registry.unregister(key)
+
+    def test_fixed_number_of_queries(self):
+        wrapped = RuntimeSettingWrapper()
+        # one for the settings, one for all the users.
+        with self.assertNumQueries(2):
+            for key in self.keys:
+                list(wrapped[key]['many_users'])
+
+    def test_same_result_as_unprefetched(self):
+        wrapped = RuntimeSettingWrapper()
+        for setting in RuntimeSetting.objects.filter(key__in=self.keys):
+            expected = setting.value
+            found = wrapped[setting.key]
+            assert found['single_user'] == expected['single_user']
+            assert list(found['many_users']) == list(expected['many_users'])
+            assert found['another'] == expected['another']
+
+    def test_missing_objects_fall_back(self):
+        RuntimeSetting.objects.filter(key='USERS_A').update(
+            raw_value=json.dumps({'single_user': 999, 'many_users': [999],
+                                  'another': 2}))
+        value = RuntimeSettingWrapper().USERS_A
+        assert value == {'another': 2}
+
+    def test_unapplied_forms_untouched(self):
+        setting = RuntimeSetting.objects.get(key='USERS_A')
+        prefetcher = ModelChoicePrefetcher()
+        form = setting.get_form()
+        prefetcher.add(form.fields, form.data)
+        assert prefetcher.fetch() == 1
+        assert 'clean' not in vars(form.fields['single_user'])
+        prefetcher.apply(form)
+        assert 'clean' in vars(form.fields['single_user'])
+        assert 'clean' not in vars(ModelChoicesForm.base_fields['single_user'])
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+from datetime import date
+from decimal import Decimal
+import json
+import pickle
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.forms import (Form, IntegerField, CharField, DateField,
+                          DecimalField, ModelChoiceField, Field)
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import text_type
+import pytest
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.plans import form_fingerprint
+from stagesetting.records import (SettingRecord, SettingAccessor,
+                                  record_class, record_class_for, freeze,
+                                  accessor_class, field_type)
+from stagesetting.utils import registry
+
+
+class AwkwardForm(Form):
+    count = IntegerField()
+    items = CharField()
+    _private = CharField()
+
+AwkwardForm.base_fields['foo-bar'] = CharField()
+AwkwardForm.base_fields['class'] = CharField()
+
+AWKWARD = {'count': 1, 'items': 'a', '_private': 'b', 'foo-bar': 'c',
+           'class': 'd'}
+
+
+def test_access():
+    record = freeze(AwkwardForm, AWKWARD)
+    assert record.count == 1
+    assert record['count'] == 1
+    for key, value in AWKWARD.items():
+        assert record[key] == value
+        assert record.get(key) == value
+        assert key in record
+    assert record.get('nope', 2) == 2
+    assert 'nope' not in record
+    with pytest.raises(KeyError):
+        record['nope']
+    assert sorted(record) == sorted(AWKWARD)
+    assert len(record) == 5
+    assert dict(record.items()) == AWKWARD
+    # a field can't hide the dictionary API.
+    assert callable(record.items)
+    assert not hasattr(record, '__dict__')
+
+
+def test_read_only():
+    record = freeze(AwkwardForm, AWKWARD)
+    with pytest.raises(AttributeError):
+        record.count = 2
+    with pytest.raises(AttributeError):
+        del record.count
+    with pytest.raises(TypeError):
+        record['count'] = 2
+    copied = record.copy()
+    copied['count'] = 2
+    assert record.count == 1
+
+
+def test_equality():
+    record = freeze(AwkwardForm, AWKWARD)
+    assert record == AWKWARD
+    assert AWKWARD == record
+    assert record == freeze(AwkwardForm, dict(AWKWARD))
+    assert record != dict(AWKWARD, count=2)
+    assert record != 1
+    with pytest.raises(TypeError):
+        hash(record)
+
+
+def test_class_generated_once():
+    cls = record_class_for(AwkwardForm)
+    assert issubclass(cls, SettingRecord)
+    assert record_class_for(AwkwardForm) is cls
+    assert type(freeze(AwkwardForm, AWKWARD)) is cls
+    # data which doesn't match the form still works.
+    assert freeze(AwkwardForm, {'a': 1}).a == 1
+    assert record_class(('a',)) is not cls
+
+
+def test_pickle():
+    record = freeze(AwkwardForm, AWKWARD)
+    restored = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+    assert restored == record
+    assert type(restored) is type(record)
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+@override_settings(STAGESETTING_FROZEN=True)
+class FrozenWrapperTestCase(TestCase):
+    def test_values_are_records(self):
+        RuntimeSetting.objects.create(key='FROZEN',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('FROZEN'):
+            with form('FROZEN_DEFAULT'):
+                wrapper = RuntimeSettingWrapper()
+                assert isinstance(wrapper.FROZEN, SettingRecord)
+                assert wrapper.FROZEN.count == 4
+                assert wrapper.FROZEN == {'count': 4}
+                assert isinstance(wrapper.FROZEN_DEFAULT, SettingRecord)
+                assert wrapper['FROZEN_DEFAULT'].count == 3
+
+    def test_lazy(self):
+        with form('FROZEN'):
+            wrapper = RuntimeSettingWrapper(lazy=True)
+            assert wrapper.FROZEN.count == 3
+
+
+class TypedForm(Form):
+    count = IntegerField()
+    when = DateField()
+    ratio = DecimalField()
+    name = CharField()
+    user = ModelChoiceField(queryset=get_user_model().objects.all())
+    items = CharField()
+
+
+def test_accessor_class():
+    cls = accessor_class(key='LIST_PER_PAGE', form_class=TypedForm)
+    assert issubclass(cls, SettingAccessor)
+    assert cls.__name__ == 'ListPerPageSetting'
+    assert cls._types == {'count': int, 'when': date, 'ratio': Decimal,
+                          'name': text_type, 'user': get_user_model(),
+                          'items': text_type}
+    assert field_type(Field()) is object
+
+
+@pytest.mark.django_db
+def test_from_raw():
+    user = get_user_model().objects.create(username='accessor')
+    cls = accessor_class(key='TYPED', form_class=TypedForm)
+    data = {'count': '3', 'when': '2015-08-01', 'ratio': '1.5',
+            'name': 'x', 'user': str(user.pk), 'items': 'y'}
+    value = cls.from_raw(data, fingerprint=form_fingerprint(TypedForm))
+    assert type(value) is cls
+    assert value.count == 3
+    assert value.when == date(2015, 8, 1)
+    assert value.ratio == Decimal('1.5')
+    assert value.user == user
+    assert value['items'] == 'y'
+    assert cls.from_raw(data) == value
+
+
+def test_from_raw_untrusted_uses_form():
+    class LimitedForm(Form):
+        count = IntegerField(max_value=5)
+    cls = accessor_class(key='LIMITED', form_class=LimitedForm)
+    fingerprint = form_fingerprint(LimitedForm)
+    # validated when it was stored, so validators aren't run again.
+    assert cls.from_raw({'count': '9'}, fingerprint=fingerprint).count == 9
+    with pytest.raises(ValidationError):
+        cls.from_raw({'count': '9'})
+    with pytest.raises(ValidationError):
+        cls.from_raw({'count': '9'}, fingerprint='stale')
+    assert cls.from_raw({'count': '4'}, fingerprint='stale').count == 4
+
+
+def test_get_accessor():
+    registry.register('ACCESSOR', TypedForm)
+    try:
+        cls = registry.get_accessor(key='ACCESSOR')
+        assert registry.get_accessor(key='ACCESSOR') is cls
+        value = cls({'count': 1, 'when': None, 'ratio': None, 'name': '',
+                     'user': None, 'items': 'x'})
+        # a field can't hide a method.
+        assert value['items'] == 'x'
+        assert callable(value.items)
+        restored = pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        assert type(restored) is cls
+        assert restored == value
+    finally:
+        registry.unregister('ACCESSOR')
+    with pytest.raises(KeyError):
+        registry.get_accessor(key='ACCESSOR')
+    # once unregistered, it comes back as a plain record.
+    restored = pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    assert not isinstance(restored, SettingAccessor)
+    assert restored == value
+
+
+@override_settings(STAGESETTING_ACCESSORS=True)
+class AccessorWrapperTestCase(TestCase):
+    def test_values_are_accessors(self):
+        RuntimeSetting.objects.create(key='TYPED',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('TYPED'):
+            wrapper = RuntimeSettingWrapper()
+            assert type(wrapper.TYPED) is registry.get_accessor(key='TYPED')
+            assert wrapper.TYPED.count == 4
+            assert wrapper.TYPED._types == {'count': int}
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+import json
+from threading import Event
+import time
+from django.forms import Form, IntegerField
+from django.test import TestCase
+from django.test.utils import override_settings
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.refresh import Refresher, get_refresher
+from stagesetting.snapshot import snapshots
+from stagesetting.utils import registry
+
+
+def test_next_interval():
+    refresher = Refresher(ttl=10, jitter=2, max_staleness=60)
+    intervals = [refresher.next_interval() for _ in range(50)]
+    assert all(8 <= interval <= 12 for interval in intervals)
+    assert len(set(intervals)) > 1
+    assert Refresher(ttl=1, jitter=5, max_staleness=60).next_interval() >= 0
+
+
+def test_refresh_survives_errors():
+    refresher = Refresher(ttl=10, jitter=0, max_staleness=60)
+    calls = []
+
+    def broken():
+        raise ValueError("database went away")
+    refresher._callbacks = {'broken': broken, 'ok': lambda: calls.append(1)}
+    assert refresher.refresh() == 1
+    assert calls == [1]
+
+
+def test_thread():
+    refresher = Refresher(ttl=0.01, jitter=0, max_staleness=60)
+    refreshed = Event()
+    try:
+        refresher.watch('key', refreshed.set)
+        assert refresher.running is True
+        assert refreshed.wait(5) is True
+    finally:
+        assert refresher.stop(timeout=5) is True
+    assert refresher.running is False
+
+
+@override_settings(STAGESETTING_REFRESH={'TTL': 30})
+def test_get_refresher():
+    refresher = get_refresher()
+    assert refresher.ttl == 30
+    assert refresher.max_staleness == 300
+    assert get_refresher() is refresher
+    with override_settings(STAGESETTING_REFRESH=None):
+        assert get_refresher() is None
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+@override_settings(STAGESETTING_REFRESH={'TTL': 3600, 'JITTER': 0,
+                                         'MAX_STALENESS': 7200})
+class RefreshedSnapshotTestCase(TestCase):
+    def setUp(self):
+        snapshots.clear()
+        self.refresher = get_refresher()
+
+    def tearDown(self):
+        self.refresher.stop()
+        snapshots.clear()
+
+    def test_readers_get_the_last_snapshot(self):
+        obj = RuntimeSetting.objects.create(key='SWR',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('SWR'):
+            assert RuntimeSettingWrapper().SWR == {'count': 4}
+            assert self.refresher.running is True
+            obj.value = {'count': 5}
+            obj.save()
+            with self.assertNumQueries(0):
+                assert RuntimeSettingWrapper().SWR == {'count': 4}
+            # as the background thread would.
+            assert self.refresher.refresh() == 1
+            assert RuntimeSettingWrapper().SWR == {'count': 5}
+
+    def test_revalidation_extends_the_snapshot(self):
+        with form('SWR'):
+            RuntimeSettingWrapper().SWR
+            checked_at = snapshots._snapshots[RuntimeSetting].checked_at
+            time.sleep(0.01)
+            self.refresher.refresh()
+            current = snapshots._snapshots[RuntimeSetting]
+            assert current.checked_at > checked_at
+
+    def test_max_staleness(self):
+        obj = RuntimeSetting.objects.create(key='SWR',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('SWR'):
+            assert RuntimeSettingWrapper().SWR == {'count': 4}
+            obj.value = {'count': 5}
+            obj.save()
+            current = snapshots._snapshots[RuntimeSetting]
+            snapshots._snapshots[RuntimeSetting] = current._replace(
+                checked_at=current.checked_at - 7201)
+            assert snapshots.peek(model=RuntimeSetting) is None
+            assert RuntimeSettingWrapper().SWR == {'count': 5}
+
+    def test_registry_changes_are_seen(self):
+        with form('SWR'):
+            assert 'SWR' in RuntimeSettingWrapper()
+            with form('SWR2'):
+                assert 'SWR2' in RuntimeSettingWrapper()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from datetime import timedelta, datetime, date, time
+from decimal import Decimal
+import json
+from uuid import UUID
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import override_settings
+from django.utils.six import text_type
+from django.utils.timezone import utc
+import pytest
+from stagesetting.serializers import (JSONSerializer, OrjsonSerializer,
+                                      MsgpackSerializer)
+from stagesetting.utils import (FormRegistry, JSONEncoder, TaggedValues,
+                                get_serializer)
+
+
+def available_serializers():
+    for serializer_class in (JSONSerializer, OrjsonSerializer,
+                             MsgpackSerializer):
+        try:
+            serializer_class()
+        except ImproperlyConfigured:
+            yield pytest.param(serializer_class, marks=pytest.mark.skip(
+                reason="%s is not installed" % serializer_class.__name__))
+        else:
+            yield serializer_class
+
+
+every_serializer = pytest.mark.parametrize('serializer_class',
+                                           list(available_serializers()))
+
+
+TYPED_DATA = {
+    'datetime': datetime(2015, 8, 1, 16, 8, 51, 125068),
+    'tzdatetime': datetime(2015, 8, 1, 16, 8, 51, 125068).replace(tzinfo=utc),
+    'date': date(2015, 8, 1),
+    'time': time(4, 23, 1, 15),
+    'timedelta': timedelta(days=3, minutes=14, microseconds=3),
+    'decimal': Decimal('1.50'),
+    'uuid': UUID('98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac'),
+    'int': 1,
+    'float': 2.5,
+    'bool': False,
+    'text': 'hello ☃',
+    'list': ['a', 'b'],
+    'none': None,
+}
+
+
+@every_serializer
+def test_output_is_text(serializer_class):
+    serializer = serializer_class()
+    assert isinstance(serializer.dumps(TYPED_DATA), text_type)
+    assert isinstance(serializer.dumps(TYPED_DATA, tagged=True), text_type)
+
+
+@every_serializer
+def test_untagged_matches_json(serializer_class):
+    serializer = serializer_class()
+    expected = json.loads(json.dumps(TYPED_DATA, cls=JSONEncoder))
+    result = serializer.loads(serializer.dumps(TYPED_DATA))
+    assert result == expected
+    assert not isinstance(result, TaggedValues)
+
+
+@every_serializer
+def test_tagged_round_trip(serializer_class):
+    serializer = serializer_class()
+    result = serializer.loads(serializer.dumps(TYPED_DATA, tagged=True))
+    assert isinstance(result, TaggedValues)
+    assert result == TYPED_DATA
+    for key, value in TYPED_DATA.items():
+        assert type(result[key]) == type(value)
+
+
+@every_serializer
+def test_tuples_become_lists(serializer_class):
+    serializer = serializer_class()
+    for tagged in (True, False):
+        result = serializer.loads(serializer.dumps({'a': ('b', 'c')},
+                                                   tagged=tagged))
+        assert result == {'a': ['b', 'c']}
+
+
+@every_serializer
+@pytest.mark.django_db
+def test_models_become_primary_keys(serializer_class):
+    serializer = serializer_class()
+    user = get_user_model().objects.create(username='serialized')
+    data = {'user': user, 'users': get_user_model().objects.all()}
+    for tagged in (True, False):
+        result = serializer.loads(serializer.dumps(data, tagged=tagged))
+        assert result == {'user': text_type(user.pk),
+                          'users': [text_type(user.pk)]}
+
+
+@every_serializer
+def test_lookalikes_left_alone(serializer_class):
+    serializer = serializer_class()
+    data = {'a': {'__t': 'unknown', 'v': 1}, 'b': {'__t': 'decimal'}}
+    assert serializer.loads(serializer.dumps(data)) == data
+
+
+@every_serializer
+def test_reads_existing_json(serializer_class):
+    serializer = serializer_class()
+    default = JSONSerializer()
+    assert serializer.loads(default.dumps(TYPED_DATA)) == default.loads(
+        default.dumps(TYPED_DATA))
+    assert serializer.loads(default.dumps(TYPED_DATA, tagged=True)) == TYPED_DATA
+
+
+@every_serializer
+def test_used_by_registry(serializer_class):
+    path = '%s.%s' % (serializer_class.__module__, serializer_class.__name__)
+    fr = FormRegistry(name='default')
+    with override_settings(STAGESETTING_SERIALIZER=path):
+        assert isinstance(get_serializer(), serializer_class)
+        output = fr.serialize({'decimal': Decimal('1.50')}, tagged=True)
+        assert fr.deserialize(output) == {'decimal': Decimal('1.50')}
+    assert isinstance(get_serializer(), JSONSerializer)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+try:
+    from unittest.mock import patch
+except ImportError:  # Python 2, pragma: no cover
+    from mock import patch
+from django.forms import Form, IntegerField
+from django.test import TestCase
+from django.test.utils import override_settings
+import pytest
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.shm import (SharedSnapshotFile, HEADER, get_shared,
+                              get_shared_file, is_private_directory,
+                              registry_digest)
+from stagesetting.snapshot import snapshots
+from stagesetting.utils import registry
+
+
+DIGEST = b'0123456789abcdef'
+
+
+@pytest.fixture
+def path():
+    directory = tempfile.mkdtemp()
+    try:
+        yield os.path.join(directory, 'settings.snapshot')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_round_trip(path):
+    writer = SharedSnapshotFile(path=path)
+    reader = SharedSnapshotFile(path=path)
+    assert reader.read(version=1, digest=DIGEST) is None
+    writer.write(version=1, digest=DIGEST, resolved={'A': {'b': 1}})
+    assert reader.read(version=1, digest=DIGEST) == {'A': {'b': 1}}
+    assert reader.read(version=2, digest=DIGEST) is None
+    assert reader.read(version=1, digest=b'fedcba9876543210') is None
+
+
+def test_remapped_when_replaced(path):
+    writer = SharedSnapshotFile(path=path)
+    reader = SharedSnapshotFile(path=path)
+    writer.write(version=1, digest=DIGEST, resolved={'A': 1})
+    assert reader.read(version=1, digest=DIGEST) == {'A': 1}
+    first = reader._mapped
+    assert reader.read(version=1, digest=DIGEST) == {'A': 1}
+    assert reader._mapped is first
+    writer.write(version=2, digest=DIGEST, resolved={'A': 2})
+    assert reader.read(version=2, digest=DIGEST) == {'A': 2}
+    assert reader._mapped is not first
+    assert first.closed
+
+
+def test_get_builds_once(path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'A': len(calls)}
+    first = SharedSnapshotFile(path=path)
+    second = SharedSnapshotFile(path=path)
+    assert first.get(version=1, digest=DIGEST, build=build) == {'A': 1}
+    assert second.get(version=1, digest=DIGEST, build=build) == {'A': 1}
+    assert len(calls) == 1
+    assert second.get(version=2, digest=DIGEST, build=build) == {'A': 2}
+    assert len(calls) == 2
+
+
+def test_unusable_files_are_ignored(path):
+    with open(path, 'wb') as f:
+        f.write(b'nonsense')
+    shared = SharedSnapshotFile(path=path)
+    assert shared.read(version=1, digest=DIGEST) is None
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(b'SSTG', 1, 1, DIGEST, 100) + b'truncated')
+    assert shared.read(version=1, digest=DIGEST) is None
+    assert shared.get(version=1, digest=DIGEST, build=dict) == {}
+
+
+def test_unwritable_directory_still_builds():
+    shared = SharedSnapshotFile(path='/does/not/exist/settings.snapshot')
+    assert shared.get(version=1, digest=DIGEST, build=lambda: {'A': 1}) == {'A': 1}
+
+
+def test_shared_directory_must_be_private(path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'A': len(calls)}
+    directory = os.path.dirname(path)
+    shared = SharedSnapshotFile(path=path)
+    os.chmod(directory, 0o777)
+    assert is_private_directory(directory) is False
+    assert shared.get(version=1, digest=DIGEST, build=build) == {'A': 1}
+    assert os.path.exists(path) is False
+    os.chmod(directory, 0o700)
+    assert is_private_directory(directory) is True
+    with patch('os.getuid', return_value=os.getuid() + 1):
+        assert is_private_directory(directory) is False
+    assert shared.get(version=1, digest=DIGEST, build=build) == {'A': 2}
+    assert os.path.exists(path) is True
+    assert shared.get(version=1, digest=DIGEST, build=build) == {'A': 2}
+
+
+def test_files_of_other_users_are_ignored(path):
+    SharedSnapshotFile(path=path).write(version=1, digest=DIGEST,
+                                        resolved={'A': 1})
+    shared = SharedSnapshotFile(path=path)
+    with patch('os.getuid', return_value=os.getuid() + 1):
+        assert shared.read(version=1, digest=DIGEST) is None
+    assert shared.read(version=1, digest=DIGEST) == {'A': 1}
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+class SharedMemoryTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(
+            STAGESETTING_SHARED_MEMORY=self.directory)
+        self.settings.enable()
+        snapshots.clear()
+
+    def tearDown(self):
+        snapshots.clear()
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def test_path(self):
+        shared = get_shared_file(model=RuntimeSetting)
+        assert shared.path == os.path.join(self.directory,
+                                           'stagesetting.runtimesetting.snapshot')
+        assert get_shared_file(model=RuntimeSetting) is shared
+
+    def test_other_processes_read_the_file(self):
+        RuntimeSetting.objects.create(key='SHM',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('SHM'):
+            assert RuntimeSettingWrapper().SHM == {'count': 4}
+            assert os.path.exists(get_shared_file(model=RuntimeSetting).path)
+            # as if in another worker, which has no snapshot of its own.
+            snapshots.clear()
+
+            def build():
+                raise AssertionError("Should have come from the shared file")
+            shared = get_shared(model=RuntimeSetting, build=build)
+            assert shared['SHM'] == {'count': 4}
+            with self.assertNumQueries(1):
+                assert RuntimeSettingWrapper().SHM == {'count': 4}
+
+    def test_rebuilt_when_version_changes(self):
+        obj = RuntimeSetting.objects.create(key='SHM',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('SHM'):
+            assert RuntimeSettingWrapper().SHM == {'count': 4}
+            obj.value = {'count': 5}
+            obj.save()
+            assert RuntimeSettingWrapper().SHM == {'count': 5}
+
+    def test_registry_digest_changes(self):
+        before = registry_digest(model=RuntimeSetting)
+        with form('SHM'):
+            assert registry_digest(model=RuntimeSetting) != before
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+import json
+from threading import Event, Thread
+from django.forms import Form, IntegerField
+from django.test import TestCase
+from django.test.utils import override_settings
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.snapshot import snapshots, SnapshotStore
+from stagesetting.utils import registry
+
+
+@contextlib.contextmanager
+def form(key, default=None):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, default or {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+@override_settings(STAGESETTING_SHARED_SNAPSHOT=True)
+class SharedSnapshotTestCase(TestCase):
+    def setUp(self):
+        snapshots.clear()
+
+    def tearDown(self):
+        snapshots.clear()
+
+    def test_wrappers_share_settings(self):
+        RuntimeSetting.objects.create(key='SNAP',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('SNAP'):
+            first = RuntimeSettingWrapper()
+            assert first.SNAP == {'count': 4}
+            second = RuntimeSettingWrapper()
+            # only the staleness check is paid for.
+            with self.assertNumQueries(1):
+                assert second.SNAP == {'count': 4}
+            assert first.settings is second.settings
+
+    def test_shared_settings_are_immutable(self):
+        RuntimeSetting.objects.create(key='SNAP',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('SNAP'):
+            first = RuntimeSettingWrapper()
+            with self.assertRaises(TypeError):
+                first.SNAP['count'] = 999
+            with self.assertRaises(AttributeError):
+                first.SNAP.count = 999
+            assert RuntimeSettingWrapper().SNAP == {'count': 4}
+            assert RuntimeSettingWrapper().SNAP.copy() == {'count': 4}
+
+    def test_rebuilt_when_database_changes(self):
+        obj = RuntimeSetting.objects.create(key='SNAP',
+                                            raw_value=json.dumps({'count': 4}))
+        with form('SNAP'):
+            first = RuntimeSettingWrapper()
+            assert first.SNAP == {'count': 4}
+            obj.value = {'count': 9}
+            obj.save()
+            second = RuntimeSettingWrapper()
+            assert second.SNAP == {'count': 9}
+            # already evaluated wrappers keep what they saw.
+            assert first.SNAP == {'count': 4}
+
+    def test_rebuilt_after_bulk_update(self):
+        RuntimeSetting.objects.create(key='SNAP',
+                                      raw_value=json.dumps({'count': 4}))
+        with form('SNAP'):
+            assert RuntimeSettingWrapper().SNAP == {'count': 4}
+            RuntimeSetting.objects.filter(key='SNAP').update(
+                raw_value=json.dumps({'count': 8}))
+            assert RuntimeSettingWrapper().SNAP == {'count': 8}
+
+    def test_rebuilt_when_registry_changes(self):
+        with form('SNAP'):
+            assert 'SNAP' in RuntimeSettingWrapper()
+            with form('SNAP2'):
+                assert 'SNAP2' in RuntimeSettingWrapper()
+            assert 'SNAP2' not in RuntimeSettingWrapper()
+
+    def test_disabled(self):
+        with form('SNAP'):
+            with override_settings(STAGESETTING_SHARED_SNAPSHOT=False):
+                RuntimeSettingWrapper().SNAP
+            assert RuntimeSetting not in snapshots
+
+
+class SnapshotStoreTestCase(TestCase):
+    def test_build_only_called_when_stale(self):
+        store = SnapshotStore()
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {'A': {}}
+        assert store.get(model=RuntimeSetting, build=build) == {'A': {}}
+        assert store.get(model=RuntimeSetting, build=build) == {'A': {}}
+        assert len(calls) == 1
+        RuntimeSetting.objects.create(key='SNAP', raw_value='{}')
+        store.get(model=RuntimeSetting, build=build)
+        assert len(calls) == 2
+
+    def test_clear(self):
+        store = SnapshotStore()
+        store.get(model=RuntimeSetting, build=dict)
+        assert len(store) == 1
+        store.clear(model=RuntimeSetting)
+        assert len(store) == 0
+
+
+class FixedTokenStore(SnapshotStore):
+    __slots__ = ('token',)
+
+    def get_token(self, model):
+        return self.token
+
+
+def test_previous_snapshot_served_during_rebuild():
+    store = FixedTokenStore()
+    store.token = 1
+    assert store.get(model=RuntimeSetting, build=lambda: {'A': 1}) == {'A': 1}
+    store.token = 2
+    building = Event()
+    finish = Event()
+
+    def slow_build():
+        building.set()
+        finish.wait(5)
+        return {'A': 2}
+    rebuild = Thread(target=store.get, args=(RuntimeSetting, slow_build))
+    rebuild.start()
+    try:
+        assert building.wait(5) is True
+
+        def fail():
+            raise AssertionError("Only one caller should rebuild")
+        assert store.get(model=RuntimeSetting, build=fail) == {'A': 1}
+    finally:
+        finish.set()
+        rebuild.join(5)
+    assert store.get(model=RuntimeSetting, build=fail) == {'A': 2}
+
+
+def test_first_build_is_waited_for():
+    store = FixedTokenStore()
+    store.token = 1
+    building = Event()
+    finish = Event()
+    calls = []
+
+    def slow_build():
+        calls.append(1)
+        building.set()
+        finish.wait(5)
+        return {'A': 1}
+    first = Thread(target=store.get, args=(RuntimeSetting, slow_build))
+    first.start()
+    assert building.wait(5) is True
+    results = []
+    second = Thread(target=lambda: results.append(
+        store.get(model=RuntimeSetting, build=slow_build)))
+    second.start()
+    finish.set()
+    first.join(5)
+    second.join(5)
+    assert results == [{'A': 1}]
+    assert len(calls) == 1
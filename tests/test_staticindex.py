@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import shutil
+import tempfile
+import time
+try:
+    from unittest.mock import patch
+except ImportError:  # Python 2, pragma: no cover
+    from mock import patch
+from django.contrib.staticfiles.finders import get_finders
+from django.core.files.storage import FileSystemStorage
+from django.test.utils import override_settings
+import pytest
+from stagesetting import invalidation
+from stagesetting.staticindex import (StaticFilesIndex, static_index,
+                                      invalidate_static_index)
+from stagesetting.utils import list_files_in_static
+
+
+FILESYSTEM_ONLY = ['django.contrib.staticfiles.finders.FileSystemFinder']
+
+
+def touch(root, *parts):
+    path = os.path.join(root, *parts)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write('x')
+    return path
+
+
+def age(root):
+    """
+    Make every directory old enough for its listing to be trusted.
+    """
+    past = time.time() - 60
+    for path, dirs, files in os.walk(root):
+        os.utime(path, (past, past))
+
+
+@pytest.fixture
+def static_dir():
+    root = tempfile.mkdtemp()
+    touch(root, 'css', 'site.css')
+    touch(root, 'js', 'site.js')
+    touch(root, 'js', 'vendor', 'lib.js')
+    touch(root, 'robots.txt')
+    age(root)
+    with override_settings(STATICFILES_DIRS=[root],
+                           STATICFILES_FINDERS=FILESYSTEM_ONLY):
+        yield root
+    shutil.rmtree(root)
+
+
+def test_same_as_finders(static_dir):
+    index = StaticFilesIndex()
+    expected = tuple(path for finder in get_finders()
+                     for path, storage in finder.list(ignore_patterns=None))
+    assert index.files() == expected
+    assert sorted(expected) == ['css/site.css', 'js/site.js',
+                                'js/vendor/lib.js', 'robots.txt']
+
+
+def test_same_as_finders_for_app_directories():
+    index = StaticFilesIndex()
+    expected = tuple(path for finder in get_finders()
+                     for path, storage in finder.list(ignore_patterns=None))
+    assert index.files() == expected
+    assert 'admin/js/core.js' in expected
+
+
+def test_only_changed_directories_are_listed(static_dir):
+    index = StaticFilesIndex()
+    generation = index.refresh()
+    touch(static_dir, 'js', 'vendor', 'new.js')
+    with patch.object(FileSystemStorage, 'listdir', autospec=True,
+                      side_effect=FileSystemStorage.listdir) as listdir:
+        assert index.refresh(force=True) == generation + 1
+    assert [call[0][1] for call in listdir.call_args_list] == [
+        os.path.join('js', 'vendor')]
+    assert 'js/vendor/new.js' in index.files()
+
+
+def test_recently_changed_directories_are_listed_again(static_dir):
+    touch(static_dir, 'css', 'print.css')
+    index = StaticFilesIndex()
+    generation = index.refresh()
+    with patch.object(FileSystemStorage, 'listdir', autospec=True,
+                      side_effect=FileSystemStorage.listdir) as listdir:
+        assert index.refresh(force=True) == generation
+    assert [call[0][1] for call in listdir.call_args_list] == ['css']
+
+
+def test_removed_files(static_dir):
+    index = StaticFilesIndex()
+    index.refresh()
+    shutil.rmtree(os.path.join(static_dir, 'js'))
+    index.refresh(force=True)
+    assert sorted(index.files()) == ['css/site.css', 'robots.txt']
+
+
+def test_only_checked_every_interval(static_dir):
+    index = StaticFilesIndex()
+    with override_settings(STAGESETTING_STATIC_INDEX_INTERVAL=60):
+        found = index.files()
+        touch(static_dir, 'new.txt')
+        assert index.files() is found
+        index.refresh(force=True)
+        assert 'new.txt' in index.files()
+
+
+def test_list_files_in_static_sees_new_files(static_dir):
+    with override_settings(STAGESETTING_STATIC_INDEX_INTERVAL=0):
+        found = dict(list_files_in_static())
+        assert ('js/vendor/lib.js', 'vendor/lib.js') in found['js']
+        touch(static_dir, 'js', 'vendor', 'new.js')
+        found = dict(list_files_in_static())
+        assert ('js/vendor/new.js', 'vendor/new.js') in found['js']
+
+
+def test_invalidate_static_index():
+    static_index.refresh()
+    assert static_index.due() is False
+    invalidate_static_index()
+    assert static_index.due() is True
+
+
+def test_settings_changes_keep_index():
+    config = {'BACKEND': 'stagesetting.invalidation.LocalTransport'}
+    with override_settings(STAGESETTING_INVALIDATION=config):
+        static_index.refresh()
+        invalidation.get_bus().publish()
+        invalidation.get_bus().poll()
+        assert static_index.due() is False
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import os
+import shutil
+import tempfile
+from threading import Lock
+import time
+from django.core.files.storage import FileSystemStorage
+from django.test.utils import override_settings
+import pytest
+from stagesetting.storagewalk import StorageWalker, ThreadPoolExecutor
+from stagesetting.storagewalk import walk_storage
+
+
+needs_futures = pytest.mark.skipif(ThreadPoolExecutor is None,
+                                   reason="concurrent.futures unavailable")
+
+
+class SlowStorage(FileSystemStorage):
+    """
+    Pretends every `listdir` is a round trip to a remote service, keeping
+    track of how many were ever in progress at once.
+    """
+    latency = 0.02
+
+    def __init__(self, *args, **kwargs):
+        super(SlowStorage, self).__init__(*args, **kwargs)
+        self._lock = Lock()
+        self.listing = 0
+        self.most_listing = 0
+
+    def listdir(self, path):
+        with self._lock:
+            self.listing += 1
+            self.most_listing = max(self.most_listing, self.listing)
+        try:
+            time.sleep(self.latency)
+            return super(SlowStorage, self).listdir(path)
+        finally:
+            with self._lock:
+                self.listing -= 1
+
+
+def recursive_listdir(storage, directory=''):
+    dirs, files = storage.listdir(directory)
+    for fn in files:
+        yield os.path.join(directory, fn)
+    for subdir in dirs:
+        if directory:
+            subdir = os.path.join(directory, subdir)
+        for fn in recursive_listdir(storage, directory=subdir):
+            yield fn
+
+
+@pytest.fixture
+def storage():
+    root = tempfile.mkdtemp()
+    for top in range(4):
+        for sub in range(4):
+            path = os.path.join(root, 'dir%d' % top, 'sub%d' % sub)
+            os.makedirs(path)
+            for name in ('a.txt', 'b.txt'):
+                with open(os.path.join(path, name), 'w') as f:
+                    f.write('x')
+    with open(os.path.join(root, 'top.txt'), 'w') as f:
+        f.write('x')
+    yield SlowStorage(location=root)
+    shutil.rmtree(root)
+
+
+def test_same_as_recursive_listdir(storage):
+    expected = list(recursive_listdir(storage))
+    assert len(expected) == 33
+    walker = StorageWalker(storage=storage)
+    assert list(walker.walk()) == expected
+    assert walker.truncated is False
+
+
+@needs_futures
+def test_concurrent_same_as_recursive_listdir(storage):
+    expected = list(recursive_listdir(storage))
+    walker = StorageWalker(storage=storage, workers=8)
+    assert list(walker.walk()) == expected
+    assert list(walker.walk('dir1')) == list(recursive_listdir(storage, 'dir1'))
+
+
+def test_sequential_lists_one_at_a_time(storage):
+    list(StorageWalker(storage=storage).walk())
+    assert storage.most_listing == 1
+
+
+@needs_futures
+def test_concurrent_lists_several_at_once(storage):
+    list(StorageWalker(storage=storage, workers=8).walk())
+    assert storage.most_listing > 1
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_max_depth(storage, workers):
+    walker = StorageWalker(storage=storage, workers=workers, max_depth=1)
+    assert list(walker.walk()) == ['top.txt']
+    walker = StorageWalker(storage=storage, workers=workers, max_depth=0)
+    assert list(walker.walk()) == ['top.txt']
+    walker = StorageWalker(storage=storage, workers=workers, max_depth=2)
+    assert len(list(walker.walk())) == 33
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_max_files(storage, workers):
+    expected = list(recursive_listdir(storage))
+    walker = StorageWalker(storage=storage, workers=workers, max_files=5)
+    assert list(walker.walk()) == expected[:5]
+    assert walker.truncated is True
+    walker.max_files = 33
+    assert list(walker.walk()) == expected
+    assert walker.truncated is False
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_timeout(storage, workers):
+    storage.latency = 0.2
+    walker = StorageWalker(storage=storage, workers=workers, timeout=0.1)
+    started = time.time()
+    found = list(walker.walk())
+    assert time.time() - started < 0.5
+    assert found in ([], ['top.txt'])
+    assert walker.truncated is True
+
+
+def test_walk_storage_settings(storage):
+    options = {'WORKERS': 4, 'MAX_FILES': 3}
+    with override_settings(STAGESETTING_STORAGE_WALK=options):
+        assert len(list(walk_storage(storage))) == 3
+    assert len(list(walk_storage(storage))) == 33
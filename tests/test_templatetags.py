@@ -44,3 +44,12 @@ def test_reuses_existing_context_variable_if_set_via_middleware_is_requestcontex
     stagesetting_mw(request=request, view_func=None, view_args=None, view_kwargs=None)
     context = RequestContext(request, {})
     assert Template("{% load stagesetting %}{% stagesetting as LOL %}{{ LOL|length }}").render(context) == '2'
+
+
+@pytest.mark.django_db
+def test_version():
+    from stagesetting.models import RuntimeSetting
+    before = Template("{% load stagesetting %}{% stagesetting_version %}").render(Context())
+    RuntimeSetting.objects.create(key='VERSIONED', raw_value='{}')
+    after = Template("{% load stagesetting %}{% stagesetting_version %}").render(Context())
+    assert int(after) == int(before) + 1
@@ -15,11 +15,13 @@ from decimal import Decimal
 from collections import OrderedDict
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django import forms
 from django.forms import fields, ModelChoiceField, ModelMultipleChoiceField
 from django.utils.functional import empty
 import re
 import django
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.test import TransactionTestCase
 from django.test.utils import override_settings, patch_logger
 from django.utils.timezone import utc
@@ -30,6 +32,7 @@ except ImportError:  # could either not be installed, or too new a Django (1.9+)
     CAN_BLEACH = False
 import pytest
 from stagesetting.models import RuntimeSetting
+from stagesetting.plans import form_fingerprint
 from stagesetting.utils import (JSONEncoder, FormRegistry, generate_form,
                                 list_files_in_static, get_htmlfield,
                                 list_files_in_default_storage,
@@ -37,7 +40,8 @@ from stagesetting.utils import (JSONEncoder, FormRegistry, generate_form,
                                 PartialStaticFilesChoiceField,
                                 PartialDefaultStorageFilesChoiceField,
                                 DefaultStorageFilesChoiceField,
-                                formstring_from_formclass, LRU_MAX)
+                                formstring_from_formclass, LRU_MAX,
+                                TaggedValues)
 
 
 @pytest.mark.django_db
@@ -485,7 +489,26 @@ def test_list_files_in_default_storage_cached():
         with patch('stagesetting.utils._get_files_in_default_storage') as is_called:
             for x in range(0, 6):
                 list_files_in_default_storage()
-            is_called.assert_called_once_with()
+            assert is_called.call_count == 1
+
+
+def test_list_files_in_default_storage_truncated_not_cached():
+    options = {'MAX_FILES': 1}
+    with isolate_lru_cache(list_files_in_default_storage):
+        with override_settings(STAGESETTING_STORAGE_WALK=options):
+            with patch('stagesetting.utils._get_files_in_default_storage',
+                       side_effect=lambda walker: walker.walk()) as is_called:
+                first = list_files_in_default_storage()
+                second = list_files_in_default_storage()
+            assert first == second
+            assert sum(len(files) for group, files in first) == 1
+            assert is_called.call_count == 2
+        # the complete listing is found, and then cached.
+        found = list_files_in_default_storage()
+        assert sum(len(files) for group, files in found) > 1
+        with patch('stagesetting.utils._get_files_in_default_storage') as is_called:
+            assert list_files_in_default_storage() == found
+            assert is_called.called is False
 
 
 @pytest.mark.skipif(CAN_BLEACH is False, reason="Import error loading BleachField")
@@ -613,6 +636,36 @@ def test_generate_form_queryset_becomes_modelmultiplechoicefield():
     assert isinstance(form.fields['field'], ModelMultipleChoiceField) is True
 
 
+def test_generate_form_reuses_classes():
+    config = {'count': 1, 'when': date(2015, 8, 1), 'choices': ['a', 'b']}
+    form_class = generate_form(config)
+    assert generate_form(dict(config)) is form_class
+    assert generate_form({'count': 2, 'when': date(2015, 8, 1),
+                          'choices': ['a', 'b']}) is not form_class
+    # 1 == True, but they're different fields.
+    assert generate_form({'count': True, 'when': date(2015, 8, 1),
+                          'choices': ['a', 'b']}) is not form_class
+    assert generate_form(OrderedDict(sorted(config.items()))) is not form_class
+
+
+def test_generate_form_never_reuses_models_or_callables():
+    config = {'field': get_user_model()(pk=1)}
+    assert generate_form(config) is not generate_form(config)
+    config = {'field': lambda: 1}
+    assert generate_form(config) is not generate_form(config)
+
+
+def test_generate_form_forgets_classes_when_settings_change():
+    config = {'field': '/static/'}
+    form_class = generate_form(config)
+    with override_settings(STATIC_URL='/assets/'):
+        changed = generate_form(config)
+        assert changed is not form_class
+        assert isinstance(changed.base_fields['field'],
+                          StaticFilesChoiceField) is False
+    assert generate_form(config) is not changed
+
+
 def test_generate_form_regex_becomes_regexfield():
     form = generate_form({'field': re.compile('')})()
     assert isinstance(form.fields['field'], fields.RegexField) is True
@@ -747,3 +800,153 @@ def test_generate_form_to_string():
     a = fields.IntegerField(initial=2, widget=widgets.NumberInput)
     e = fields.DecimalField(initial=Decimal('1.0'), widget=widgets.NumberInput)
     f = fields.DateTimeField(initial=datetime.datetime(2015, 10, 10, 10, 10, 10), widget=widgets.DateTimeInput)"""
+
+
+@override_settings(STAGESETTING_CLEAN_PLANS=False)
+def test_formregistry_default_value_is_memoized():
+    fr = FormRegistry(name='default')
+    form_class = generate_form({'count': 1})
+    fr.register('MEMO', form_class, {'count': '4'})
+    with patch.object(form_class, 'is_valid', autospec=True,
+                      side_effect=form_class.is_valid) as is_valid:
+        first = fr.get_default_value('MEMO')
+        second = fr.get_default_value('MEMO')
+    assert first == second == {'count': 4}
+    assert first is not second
+    assert is_valid.call_count == 1
+
+
+def test_formregistry_default_value_copies():
+    fr = FormRegistry(name='default')
+    fr.register('MEMO', generate_form({'count': 1}), {'count': '4'})
+    fr.get_default_value('MEMO')['count'] = 100
+    assert fr.get_default_value('MEMO') == {'count': 4}
+
+
+def test_formregistry_default_value_copies_deeply():
+    fr = FormRegistry(name='default')
+    form_class = generate_form({'tags': ['a', 'b']})
+    fr.register('MEMO', form_class, {'tags': ['a']})
+    fr.get_default_value('MEMO')['tags'].append('b')
+    assert fr.get_default_value('MEMO') == {'tags': ['a']}
+
+
+@pytest.mark.django_db
+def test_formregistry_default_value_model_fields_not_memoized():
+    fr = FormRegistry(name='default')
+    group = Group.objects.create(name='memo')
+
+    class GroupForm(forms.Form):
+        group = forms.ModelChoiceField(queryset=Group.objects.all())
+    fr.register('MEMO', GroupForm, {'group': group.pk})
+    assert fr.get_default_value('MEMO') == {'group': group}
+    group.delete()
+    assert fr.get_default_value('MEMO') == {}
+
+
+def test_formregistry_default_value_invalidated_by_generation():
+    fr = FormRegistry(name='default')
+    generation = fr.generation
+    fr.register('MEMO', generate_form({'count': 1}), {'count': '4'})
+    assert fr.generation == generation + 1
+    assert fr.get_default_value('MEMO') == {'count': 4}
+    fr.unregister('MEMO')
+    assert fr.generation == generation + 2
+    fr.register('MEMO', generate_form({'count': 1}), {'count': '6'})
+    assert fr.get_default_value('MEMO') == {'count': 6}
+
+
+def test_tagged_serialization_round_trip():
+    fr = FormRegistry(name='default')
+    data = {
+        'datetime': datetime(2015, 8, 1, 16, 8, 51, 125068),
+        'tzdatetime': datetime(2015, 8, 1, 16, 8, 51, 125068).replace(tzinfo=utc),
+        'date': date(2015, 8, 1),
+        'time': time(4, 23, 1, 15),
+        'timedelta': timedelta(days=3, minutes=14, microseconds=3),
+        'decimal': Decimal('1.50'),
+        'uuid': UUID('98967ef2-a5a3-4c19-aefa-9bb8dc5fcbac'),
+        'int': 1,
+        'list': ['a', 'b'],
+        'none': None,
+    }
+    output = fr.serialize(data, tagged=True)
+    assert '{"__t": "decimal", "v": "1.50"}' in output
+    result = fr.deserialize(output)
+    assert isinstance(result, TaggedValues)
+    assert result == data
+    for key, value in data.items():
+        assert type(result[key]) == type(value)
+
+
+def test_tagged_serialization_off_by_default():
+    fr = FormRegistry(name='default')
+    result = fr.deserialize(fr.serialize({'decimal': Decimal('1.50')}))
+    assert result == {'decimal': '1.50'}
+    assert not isinstance(result, TaggedValues)
+    with override_settings(STAGESETTING_TAGGED_SERIALIZATION=True):
+        output = fr.serialize({'decimal': Decimal('1.50')})
+    assert isinstance(fr.deserialize(output), TaggedValues)
+
+
+def test_tagged_serialization_leaves_lookalikes():
+    fr = FormRegistry(name='default')
+    data = {'a': {'__t': 'unknown', 'v': 1}, 'b': {'__t': 'decimal'}}
+    assert fr.deserialize(json.dumps(data)) == data
+
+
+def test_tagged_serialization_never_used_for_defaults():
+    fr = FormRegistry(name='default')
+    fr.register('TAGGED', generate_form({'count': 1}), {'count': '4'})
+    with override_settings(STAGESETTING_TAGGED_SERIALIZATION=True):
+        assert fr.get_default('TAGGED') == '{"count": "4"}'
+
+
+def test_trusted_value():
+    fr = FormRegistry(name='default')
+    form_class = generate_form({'count': 1, 'price': Decimal('1.00')})
+    fingerprint = form_fingerprint(form_class)
+    tagged = fr.deserialize(fr.serialize(
+        {'count': 3, 'price': Decimal('2.50')}, tagged=True))
+    assert fr.trusted_value(form_class, tagged, fingerprint=fingerprint) == {
+        'count': 3, 'price': Decimal('2.50')}
+    untagged = fr.deserialize(fr.serialize(
+        {'count': 3, 'price': Decimal('2.50')}, tagged=False))
+    assert fr.trusted_value(form_class, untagged) is None
+    # fields have changed since it was written
+    partial = fr.deserialize(fr.serialize({'count': 3}, tagged=True))
+    assert fr.trusted_value(form_class, partial,
+                            fingerprint=fingerprint) is None
+
+
+def test_trusted_value_tagged_needs_fingerprint():
+    fr = FormRegistry(name='default')
+    form_class = generate_form({'count': 1})
+    tagged = fr.deserialize(fr.serialize({'count': 50}, tagged=True))
+    assert fr.trusted_value(form_class, tagged) is None
+    assert fr.trusted_value(form_class, tagged, fingerprint='') is None
+    # validated under a form which has changed since.
+    assert fr.trusted_value(form_class, tagged, fingerprint='0' * 32) is None
+
+
+def test_trusted_value_by_fingerprint():
+    fr = FormRegistry(name='default')
+    form_class = generate_form({'count': 1, 'price': Decimal('1.00')})
+    untagged = fr.deserialize(fr.serialize(
+        {'count': 3, 'price': Decimal('2.50')}, tagged=False))
+    fingerprint = form_fingerprint(form_class)
+    assert fr.trusted_value(form_class, untagged,
+                            fingerprint=fingerprint) == {
+        'count': 3, 'price': Decimal('2.50')}
+    # stored by an older version of the form, or before fingerprints.
+    assert fr.trusted_value(form_class, untagged, fingerprint='0' * 32) is None
+    assert fr.trusted_value(form_class, untagged, fingerprint='') is None
+
+
+def test_trusted_value_by_fingerprint_uses_custom_clean():
+    class CoercedForm(forms.Form):
+        number = forms.TypedChoiceField(choices=(('1', 'one'),), coerce=int)
+    fr = FormRegistry(name='default')
+    assert fr.trusted_value(CoercedForm, {'number': '1'},
+                            fingerprint=form_fingerprint(CoercedForm)) == {
+        'number': 1}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+import contextlib
+from django.apps import apps
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError
+from django.forms import Form, IntegerField
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from stagesetting.cache import get_resolved
+from stagesetting.models import RuntimeSetting, RuntimeSettingWrapper
+from stagesetting.snapshot import snapshots
+from stagesetting.utils import registry
+from stagesetting.warmup import warm, when_ready
+
+
+@contextlib.contextmanager
+def form(key):
+    class ListPerPageForm(Form):
+        count = IntegerField(initial=25, min_value=1, max_value=99)
+    registry.register(key, ListPerPageForm, {'count': 3})
+    try:
+        yield ListPerPageForm
+    finally:
+        registry.unregister(key)
+
+
+class WarmTestCase(TestCase):
+    def setUp(self):
+        snapshots.clear()
+        caches['default'].clear()
+
+    def tearDown(self):
+        snapshots.clear()
+        caches['default'].clear()
+
+    @override_settings(STAGESETTING_SHARED_SNAPSHOT=True,
+                       STAGESETTING_INVALIDATION={
+                           'BACKEND': 'stagesetting.invalidation.LocalTransport'})
+    def test_snapshot(self):
+        with form('WARM'):
+            assert warm()['WARM'] == {'count': 3}
+            assert RuntimeSetting in snapshots
+            with self.assertNumQueries(0):
+                assert RuntimeSettingWrapper().WARM == {'count': 3}
+
+    @override_settings(STAGESETTING_CACHE='default')
+    def test_cache(self):
+        with form('WARM'):
+            warm(model=RuntimeSetting)
+            assert get_resolved(model=RuntimeSetting)['WARM'] == {'count': 3}
+
+    @override_settings(STAGESETTING_LAZY=True)
+    def test_ignores_lazy(self):
+        with form('WARM'):
+            assert 'WARM' in warm()
+
+    def test_command(self):
+        out = StringIO()
+        with form('WARM'):
+            call_command('stagesetting', 'warm', stdout=out)
+        assert 'Warmed' in out.getvalue()
+
+
+class AppConfigTestCase(TestCase):
+    def test_disabled(self):
+        config = apps.get_app_config('stagesetting')
+        with patch('stagesetting.warmup.warm') as warm_mock:
+            assert config.warm_stagesetting() is False
+        assert warm_mock.called is False
+
+    @override_settings(STAGESETTING_WARM=True)
+    def test_enabled(self):
+        config = apps.get_app_config('stagesetting')
+        with patch('stagesetting.warmup.warm') as warm_mock:
+            with patch('stagesetting.warmup.close_connections') as close_mock:
+                assert config.warm_stagesetting() is True
+        warm_mock.assert_called_once_with(model=RuntimeSetting)
+        assert close_mock.called is True
+
+    @override_settings(STAGESETTING_WARM=True)
+    def test_database_unavailable(self):
+        config = apps.get_app_config('stagesetting')
+        with patch('stagesetting.warmup.warm',
+                   side_effect=OperationalError("no such table")):
+            with patch('stagesetting.warmup.close_connections') as close_mock:
+                assert config.warm_stagesetting() is False
+        assert close_mock.called is True
+
+
+def test_when_ready():
+    with patch('stagesetting.warmup.warm') as warm_mock:
+        with patch('stagesetting.warmup.close_connections') as close_mock:
+            when_ready(server=None)
+    assert warm_mock.called is True
+    assert close_mock.called is True